@@ -0,0 +1,167 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Asynchronous command execution library.
+
+Library that provides asyncio awaitables for passthru commands of any of the
+application libraries. Outstanding commands (for example Asynchronous Event
+Requests), keep alive observers and I/O can be run concurrently in one event
+loop without polling.
+
+With nvme-cli every command is a child process that is awaited by the event
+loop, so cancelling a command kills its process. The other applications
+submit blocking ioctls, each run in a daemon thread. A cancelled ioctl stays
+outstanding in the driver, its thread does not keep the interpreter from
+exiting.
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(1, './')
+from src.macros import *
+from utils.logging_module import logger
+from lib.applib.ioctl_lib import IoctlLib
+from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.syslib.system_lib import CommandResult, SystemLib
+
+
+class AsyncExecutor():
+    """
+    Submits passthru commands of an application library as asyncio awaitables.
+
+    Attributes:
+        app: Application library (NVMeCLILib, Libnvme, IoctlLib or IoUringLib).
+        max_concurrency (int): Maximum number of outstanding commands.
+        timeout (float): Default timeout in seconds for a command, None for no timeout.
+    """
+
+    def __init__(self, app, max_concurrency=ASYNC_MAX_CONCURRENCY, timeout=None) -> None:
+        """ Constructor """
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.limit = asyncio.Semaphore(max_concurrency)
+        self.outstanding = set()
+        # nvme-cli commands are processes, the others block in ioctl
+        self.uses_processes = isinstance(app, NVMeCLILib) and not isinstance(app, IoctlLib)
+
+    def close(self):
+        """Reports the commands still blocked in the driver. Their daemon
+            threads end when the controller completes or aborts them.
+        """
+        if self.outstanding:
+            logger.info(f"-- {len(self.outstanding)} commands still outstanding in the driver")
+
+    async def submit_admin_passthru(self, nvme_cmd, timeout=None):
+        """
+        Submit admin passthru command to the NVMe device.
+
+        Args:
+            nvme_cmd: The NVMe command object to be submitted.
+            timeout (float, optional): Seconds after which the command is
+                cancelled. Defaults to the timeout of the executor.
+
+        Returns:
+            NVMeRspStruct: "nvme_cmd.rsp", filled with the completion.
+
+        Raises:
+            TimeoutError: If the command did not complete in time.
+        """
+        return await self.submit(nvme_cmd, True, timeout)
+
+    async def submit_io_passthru(self, nvme_cmd, timeout=None):
+        """
+        Submit io passthru command to the NVMe device.
+
+        Args:
+            nvme_cmd: The NVMe command object to be submitted.
+            timeout (float, optional): Seconds after which the command is
+                cancelled. Defaults to the timeout of the executor.
+
+        Returns:
+            NVMeRspStruct: "nvme_cmd.rsp", filled with the completion.
+
+        Raises:
+            TimeoutError: If the command did not complete in time.
+        """
+        return await self.submit(nvme_cmd, False, timeout)
+
+    async def submit(self, nvme_cmd, admin, timeout=None):
+        """Waits for a free slot and runs the command with the timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        async with self.limit:
+            if self.uses_processes:
+                run = self.run_process(nvme_cmd, admin)
+            else:
+                run = self.run_in_thread(nvme_cmd, admin)
+            return await asyncio.wait_for(run, timeout)
+
+    async def run_process(self, nvme_cmd, admin):
+        """Runs the nvme-cli command as a child process awaited by the event loop.
+            The process is killed if the command is cancelled or times out.
+        """
+        with NVMeCLILib.write_payload(nvme_cmd, admin) as pass_fds:
+            argv = self.app.build_passthru_argv(nvme_cmd, admin, pass_fds)
+            logger.info("-- Executing Command: {}", argv)
+
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                SystemLib.resolve_executable(argv[0]), *argv[1:],
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                close_fds=bool(pass_fds), pass_fds=pass_fds)
+            output = NVMeCLILib.read_buffer(nvme_cmd, admin)
+            try:
+                if output is not None:
+                    received, stderr = await asyncio.gather(
+                        AsyncExecutor.read_into(process.stdout, output), process.stderr.read())
+                    stdout = b""
+                    await process.wait()
+                else:
+                    received = None
+                    stdout, stderr = await process.communicate()
+            finally:
+                if process.returncode is None:
+                    logger.info(f"-- -- Command cancelled, killing process {process.pid}")
+                    process.kill()
+                    await process.wait()
+
+        result = CommandResult(argv, process.returncode, stdout, stderr,
+                               duration=time.perf_counter() - start, received=received)
+        SystemLib.log_result(result)
+
+        self.app.complete_passthru(nvme_cmd, result, admin)
+        NVMeCLILib.parse_response(nvme_cmd, result.ret_code, result.stderr)
+        return nvme_cmd.rsp
+
+    @staticmethod
+    async def read_into(stream, output):
+        """Reads the stream into the buffer in chunks as they arrive. Data beyond
+            the size of the buffer is counted and discarded.
+
+        Returns:
+            int: Bytes read from the stream.
+        """
+        view = memoryview(output).cast("B")
+        received = 0
+        while chunk := await stream.read(65536):
+            if received < len(view):
+                count = min(len(chunk), len(view) - received)
+                view[received:received + count] = chunk[:count]
+            received += len(chunk)
+        return received
+
+    async def run_in_thread(self, nvme_cmd, admin):
+        """Runs the blocking submission in a daemon thread.
+            A cancelled command stops being awaited, but the ioctl can only be
+            ended by the driver (see "nvme_cmd.timeout_ms").
+        """
+        submit = getattr(self.app, "submit_admin_passthru" if admin else "submit_io_passthru",
+                         None) or self.app.submit_passthru
+        future = SystemLib.run_in_thread(submit, nvme_cmd, True, False)
+        self.outstanding.add(future)
+        future.add_done_callback(self.outstanding.discard)
+        status = await asyncio.wrap_future(future)
+
+        self.app.get_response(nvme_cmd, status)
+        return nvme_cmd.rsp
@@ -0,0 +1,195 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Discovery log library.
+
+Library that decodes the binary discovery log page (LID 70h) instead of the
+text output of nvme-cli. The entries are mapped without a copy onto a NumPy
+structured array whose dtype mirrors NVMF_DISC_LOG_ENTRY, so logs with
+thousands of subsystems and referrals are filtered by transport, address
+family, subsystem type or NQN prefix with array operations.
+
+The log page can be read from a discovery controller with Get Log Page
+commands in chunks (log page offset, see log_page_lib), following the
+procedure of the specification: header, entries, header again, and a retry
+of the whole read if the generation counter changed in between. A raw log
+page saved by nvme-cli (nvme discover --raw) can be decoded as well.
+"""
+
+import copy
+import ctypes
+import struct
+import sys
+import numpy as np
+sys.path.insert(1, "./")
+from src.macros import *
+from utils.logging_module import logger
+from lib.applib.log_page_lib import LogPageReader
+from lib.structlib.struct_fabric_libnvme_lib import NVMF_DISC_LOG_ENTRY, NVMF_DISCOVERY_LOG
+
+# Generation counter, number of records, record format
+DISC_LOG_HEADER     = struct.Struct("<QQH")
+DISC_LOG_HEADER_SIZE = NVMF_DISCOVERY_LOG.entries.offset
+DISC_LOG_ENTRY_SIZE = ctypes.sizeof(NVMF_DISC_LOG_ENTRY)
+
+
+def entry_dtype(structure):
+    """Builds the NumPy structured dtype of a ctypes structure, with the same
+        field offsets and item size. Reserved fields are left out.
+
+    Args:
+        structure: ctypes.Structure class, e.g. NVMF_DISC_LOG_ENTRY.
+
+    Returns:
+        numpy.dtype: The structured dtype.
+    """
+    names, formats, offsets = [], [], []
+    for name, ctype in structure._fields_:
+        if name.startswith("rsvd"):
+            continue
+        field = getattr(structure, name)
+        if issubclass(ctype, ctypes.Array) and ctype._type_ is ctypes.c_char:
+            dtype = np.dtype(f"S{ctype._length_}")
+        elif issubclass(ctype, ctypes.Array):
+            dtype = np.dtype((np.dtype(ctype._type_).newbyteorder("<"), ctype._length_))
+        elif issubclass(ctype, (ctypes.Structure, ctypes.Union)):
+            dtype = np.dtype(f"V{field.size}")
+        else:
+            dtype = np.dtype(ctype).newbyteorder("<")
+        names.append(name)
+        formats.append(dtype)
+        offsets.append(field.offset)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets,
+                     "itemsize": ctypes.sizeof(structure)})
+
+
+DISC_LOG_ENTRY_DTYPE = entry_dtype(NVMF_DISC_LOG_ENTRY)
+
+
+class DiscoveryLog():
+    """
+    Decoded discovery log page.
+
+    The entries reference the memory of the raw log page, which must not be
+    modified while the DiscoveryLog is used.
+
+    Attributes:
+        genctr (int): Generation counter of the log page.
+        numrec (int): Number of records reported in the header.
+        recfmt (int): Record format.
+        entries (numpy.ndarray): Entries, of dtype DISC_LOG_ENTRY_DTYPE.
+        raw (numpy.ndarray): Bytes of the entries, one row per entry.
+    """
+
+    def __init__(self, log) -> None:
+        """
+        Args:
+            log: Buffer with the log page, header included (bytes, bytearray,
+                ctypes array, ...).
+
+        Raises:
+            ValueError: If the buffer is shorter than the header.
+        """
+        buffer = memoryview(log).cast("B")
+        if len(buffer) < DISC_LOG_HEADER_SIZE:
+            raise ValueError(f"Discovery log page too short: {len(buffer)} bytes")
+        self.genctr, self.numrec, self.recfmt = DISC_LOG_HEADER.unpack_from(buffer)
+        count = min(self.numrec, (len(buffer) - DISC_LOG_HEADER_SIZE) // DISC_LOG_ENTRY_SIZE)
+        if count < self.numrec:
+            logger.warning(f"Discovery log truncated: {count} of {self.numrec} records")
+        self.entries = np.frombuffer(buffer, DISC_LOG_ENTRY_DTYPE, count, DISC_LOG_HEADER_SIZE)
+        self.raw = np.frombuffer(buffer, np.uint8, count * DISC_LOG_ENTRY_SIZE,
+                                 DISC_LOG_HEADER_SIZE).reshape(count, DISC_LOG_ENTRY_SIZE)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def select(self, trtype=None, adrfam=None, subtype=None, nqn_prefix=None):
+        """Mask of the entries matching all the given criteria.
+
+        Args:
+            trtype (int or Iterable[int], optional): Transport type(s), e.g. NVMF_TRTYPE_TCP.
+            adrfam (int or Iterable[int], optional): Address family(ies), e.g. NVMF_ADRFAM_IPV4.
+            subtype (int or Iterable[int], optional): Subsystem type(s), e.g. NVME_NQN_NVME.
+            nqn_prefix (str, optional): Prefix of the subsystem NQN.
+
+        Returns:
+            numpy.ndarray: Boolean mask, one value per entry.
+        """
+        mask = np.ones(len(self.entries), dtype=bool)
+        for name, value in (("trtype", trtype), ("adrfam", adrfam), ("subtype", subtype)):
+            if value is None:
+                continue
+            if isinstance(value, int):
+                mask &= self.entries[name] == value
+            else:
+                mask &= np.isin(self.entries[name], list(value))
+        if nqn_prefix:
+            prefix = np.frombuffer(nqn_prefix.encode(), dtype=np.uint8)
+            if len(prefix) > NVME_NQN_LENGTH:
+                mask[:] = False
+            else:
+                offset = NVMF_DISC_LOG_ENTRY.subnqn.offset
+                mask &= (self.raw[:, offset:offset + len(prefix)] == prefix).all(axis=1)
+        return mask
+
+    def filter(self, trtype=None, adrfam=None, subtype=None, nqn_prefix=None):
+        """Entries matching all the given criteria, see select().
+
+        Returns:
+            DiscoveryLog: Log with the matching entries only.
+        """
+        mask = self.select(trtype, adrfam, subtype, nqn_prefix)
+        log = copy.copy(self)
+        log.entries, log.raw = self.entries[mask], self.raw[mask]
+        return log
+
+    @staticmethod
+    def decode(value):
+        """ Text of a fixed size field, without the NUL or space padding """
+        return value.split(b"\0", 1)[0].decode(errors="replace").strip()
+
+    def subnqns(self):
+        """ Subsystem NQN of each entry """
+        return [self.decode(nqn) for nqn in self.entries["subnqn"]]
+
+    def entry(self, index):
+        """Fields of one entry.
+
+        Args:
+            index (int): Index of the entry.
+
+        Returns:
+            Dict[str, int or str]: Field values, text fields decoded.
+        """
+        entry = self.entries[index]
+        fields = {}
+        for name in DISC_LOG_ENTRY_DTYPE.names:
+            if DISC_LOG_ENTRY_DTYPE[name].kind == "S":
+                fields[name] = self.decode(entry[name])
+            elif DISC_LOG_ENTRY_DTYPE[name].kind == "u":
+                fields[name] = int(entry[name])
+        return fields
+
+
+def read_discovery_log(controller, max_chunk=LOG_PAGE_MAX_CHUNK, retries=LOG_PAGE_RETRIES):
+    """Reads the whole discovery log page in chunks of at most MDTS. The
+        header is read again after the entries, and the log page read again
+        if its generation counter changed.
+
+    Args:
+        controller: Controller connected to the discovery subsystem.
+        max_chunk (int, optional): Maximum transfer size of one command.
+        retries (int, optional): Number of reads of the log page before giving up.
+
+    Returns:
+        Tuple[int, DiscoveryLog]: Status Code of the failed command or 0, and
+            the log page (None on failure).
+
+    Raises:
+        LogPageChanged: If the generation counter changed on every read.
+    """
+    reader = LogPageReader(controller, max_chunk=max_chunk, retries=retries)
+    status, log = reader.read(NVME_LOG_LID_DISCOVER)
+    return status, DiscoveryLog(log) if status == 0 else None
@@ -0,0 +1,394 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+io_uring interface library.
+
+Library that provides NVMe passthrough over io_uring (IORING_OP_URING_CMD)
+on the NVMe generic character devices (/dev/ngXnY). Batches of commands are
+kept in flight up to a configurable queue depth, which allows I/O tests to
+load the target at queue depths of 1-256 from Python.
+
+The ring is driven through the raw io_uring_setup/io_uring_enter system
+calls and mmap'd ring memory, no liburing is required. Linux 5.19 or above
+is needed for NVMe passthrough over io_uring. Only x86_64 is supported, see
+IoUring.
+"""
+import ctypes
+import errno
+import mmap
+import os
+import platform
+import re
+import struct
+import sys
+import threading
+sys.path.insert(1, './')
+from src.macros import *
+from utils.logging_module import logger
+from lib.applib.libnvme_lib import device_handles
+from lib.applib.ioctl_lib import IoctlLib
+from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.structlib.struct_codec_lib import TIMEOUT_OFFSET, TIMEOUT_RESULT, opcode_nsid, set_data
+
+# System call numbers (x86_64)
+SYS_IO_URING_SETUP          = 425
+SYS_IO_URING_ENTER          = 426
+
+IORING_SETUP_SQE128         = 1 << 10
+IORING_SETUP_CQE32          = 1 << 11
+IORING_FEAT_SINGLE_MMAP     = 1 << 0
+IORING_ENTER_GETEVENTS      = 1 << 0
+IORING_OFF_SQ_RING          = 0
+IORING_OFF_CQ_RING          = 0x8000000
+IORING_OFF_SQES             = 0x10000000
+IORING_OP_NOP               = 0
+IORING_OP_URING_CMD         = 46
+
+SQE_SIZE                    = 128   # IORING_SETUP_SQE128
+CQE_SIZE                    = 32    # IORING_SETUP_CQE32
+SQE_CMD_OFFSET              = 48    # struct nvme_uring_cmd starts at sqe->cmd
+
+# opcode, flags, ioprio, fd, cmd_op, pad, addr, len, op_flags, user_data,
+# buf_index, personality, splice_fd_in
+SQE_HEADER = struct.Struct("<BBHiIIQIIQHHi")
+# user_data, res, flags, big_cqe[0] (command result)
+CQE = struct.Struct("<QiIQ")
+
+
+class IoSqringOffsets(ctypes.Structure):
+    """ struct io_sqring_offsets """
+    _fields_ = [("head", ctypes.c_uint32),
+                ("tail", ctypes.c_uint32),
+                ("ring_mask", ctypes.c_uint32),
+                ("ring_entries", ctypes.c_uint32),
+                ("flags", ctypes.c_uint32),
+                ("dropped", ctypes.c_uint32),
+                ("array", ctypes.c_uint32),
+                ("resv1", ctypes.c_uint32),
+                ("user_addr", ctypes.c_uint64),
+                ]
+
+
+class IoCqringOffsets(ctypes.Structure):
+    """ struct io_cqring_offsets """
+    _fields_ = [("head", ctypes.c_uint32),
+                ("tail", ctypes.c_uint32),
+                ("ring_mask", ctypes.c_uint32),
+                ("ring_entries", ctypes.c_uint32),
+                ("overflow", ctypes.c_uint32),
+                ("cqes", ctypes.c_uint32),
+                ("flags", ctypes.c_uint32),
+                ("resv1", ctypes.c_uint32),
+                ("user_addr", ctypes.c_uint64),
+                ]
+
+
+class IoUringParams(ctypes.Structure):
+    """ struct io_uring_params """
+    _fields_ = [("sq_entries", ctypes.c_uint32),
+                ("cq_entries", ctypes.c_uint32),
+                ("flags", ctypes.c_uint32),
+                ("sq_thread_cpu", ctypes.c_uint32),
+                ("sq_thread_idle", ctypes.c_uint32),
+                ("features", ctypes.c_uint32),
+                ("wq_fd", ctypes.c_uint32),
+                ("resv", ctypes.c_uint32 * 3),
+                ("sq_off", IoSqringOffsets),
+                ("cq_off", IoCqringOffsets),
+                ]
+
+
+class IoUring():
+    """
+    A single io_uring instance set up with 128 byte SQEs and 32 byte CQEs
+    as required for NVMe passthrough.
+
+    Ring indices are read and written through the shared mapping. Python does
+    not provide memory barriers, the ordering of the ring updates relies on
+    the total store order of x86_64. On weakly ordered architectures (e.g.
+    aarch64) the kernel could see the SQ tail before the SQE, so the ring is
+    refused there.
+    """
+
+    libc = ctypes.CDLL(None, use_errno=True)
+
+    def __init__(self, entries) -> None:
+        """ Constructor
+
+        Args:
+            entries (int): Number of submission queue entries (rounded up to a
+                power of 2 by the kernel).
+
+        Raises:
+            OSError: If the ring could not be set up, or the architecture is
+                not x86_64.
+        """
+        if platform.machine() != "x86_64":
+            raise OSError(errno.ENOTSUP, "io_uring ring ordering requires x86_64, "
+                                         f"not {platform.machine()}")
+        self.params = IoUringParams()
+        self.params.flags = IORING_SETUP_SQE128 | IORING_SETUP_CQE32
+        self.fd = IoUring.libc.syscall(SYS_IO_URING_SETUP, ctypes.c_uint(entries),
+                                       ctypes.byref(self.params))
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"io_uring_setup failed: {os.strerror(err)}")
+
+        sq_off, cq_off = self.params.sq_off, self.params.cq_off
+        sq_size = sq_off.array + self.params.sq_entries * 4
+        cq_size = cq_off.cqes + self.params.cq_entries * CQE_SIZE
+        if self.params.features & IORING_FEAT_SINGLE_MMAP:
+            sq_size = cq_size = max(sq_size, cq_size)
+            self.sq_ring = mmap.mmap(self.fd, sq_size, offset=IORING_OFF_SQ_RING)
+            self.cq_ring = self.sq_ring
+        else:
+            self.sq_ring = mmap.mmap(self.fd, sq_size, offset=IORING_OFF_SQ_RING)
+            self.cq_ring = mmap.mmap(self.fd, cq_size, offset=IORING_OFF_CQ_RING)
+        self.sqes = mmap.mmap(self.fd, self.params.sq_entries * SQE_SIZE,
+                              offset=IORING_OFF_SQES)
+
+        self.sq_tail = ctypes.c_uint32.from_buffer(self.sq_ring, sq_off.tail)
+        self.sq_mask = ctypes.c_uint32.from_buffer(self.sq_ring, sq_off.ring_mask).value
+        self.sq_array = (ctypes.c_uint32 * self.params.sq_entries).from_buffer(
+            self.sq_ring, sq_off.array)
+        self.cq_head = ctypes.c_uint32.from_buffer(self.cq_ring, cq_off.head)
+        self.cq_tail = ctypes.c_uint32.from_buffer(self.cq_ring, cq_off.tail)
+        self.cq_mask = ctypes.c_uint32.from_buffer(self.cq_ring, cq_off.ring_mask).value
+        self.cqes_offset = cq_off.cqes
+        self.sqes_address = ctypes.addressof(ctypes.c_char.from_buffer(self.sqes))
+        self.entries = self.params.sq_entries
+        self.to_submit = 0
+
+    def prep_sqe(self, opcode, fd, cmd_op=0, user_data=0, command=None):
+        """Fills the next free SQE. The caller must not queue more than
+            `entries` SQEs between calls to enter().
+
+        Args:
+            opcode (int): io_uring opcode (IORING_OP_*).
+            fd (int): File descriptor the operation is for.
+            cmd_op (int): Command operation for IORING_OP_URING_CMD.
+            user_data (int): Value returned in the CQE of this SQE.
+            command: ctypes structure copied into the command area of the SQE.
+        """
+        tail = self.sq_tail.value
+        index = tail & self.sq_mask
+        offset = index * SQE_SIZE
+        SQE_HEADER.pack_into(self.sqes, offset, opcode, 0, 0, fd, cmd_op, 0, 0, 0, 0,
+                             user_data, 0, 0, 0)
+        if command is not None:
+            ctypes.memmove(self.sqes_address + offset + SQE_CMD_OFFSET,
+                           ctypes.addressof(command), ctypes.sizeof(command))
+        self.sq_array[index] = index
+        self.sq_tail.value = tail + 1
+        self.to_submit += 1
+
+    def enter(self, min_complete=0):
+        """Submits the queued SQEs and optionally waits for completions.
+
+        Args:
+            min_complete (int): Number of completions to wait for.
+
+        Returns:
+            int: Number of SQEs consumed by the kernel.
+
+        Raises:
+            OSError: If io_uring_enter fails.
+        """
+        flags = IORING_ENTER_GETEVENTS if min_complete else 0
+        while True:
+            ret = IoUring.libc.syscall(SYS_IO_URING_ENTER, self.fd, self.to_submit,
+                                       min_complete, flags, None, 0)
+            if ret >= 0:
+                self.to_submit -= ret
+                return ret
+            err = ctypes.get_errno()
+            if err != errno.EINTR:
+                raise OSError(err, f"io_uring_enter failed: {os.strerror(err)}")
+
+    def reap(self):
+        """Consumes all available completions.
+
+        Returns:
+            List[Tuple[int, int, int]]: (user_data, res, result) of each CQE.
+        """
+        completions = []
+        head = self.cq_head.value
+        tail = self.cq_tail.value
+        while head != tail:
+            offset = self.cqes_offset + (head & self.cq_mask) * CQE_SIZE
+            user_data, res, _, result = CQE.unpack_from(self.cq_ring, offset)
+            completions.append((user_data, res, result))
+            head += 1
+        self.cq_head.value = head
+        return completions
+
+    def close(self):
+        """ Unmaps the rings and closes the io_uring descriptor """
+        if self.fd < 0:
+            return
+        # Views into the mappings have to be released before unmapping
+        del self.sq_tail, self.sq_array, self.cq_head, self.cq_tail
+        self.sqes.close()
+        if self.cq_ring is not self.sq_ring:
+            self.cq_ring.close()
+        self.sq_ring.close()
+        os.close(self.fd)
+        self.fd = -1
+
+
+class IoUringLib(IoctlLib):
+
+    def __init__(self, dev_path=None, queue_depth=IO_URING_DEFAULT_QD) -> None:
+        """Initialize attributes for the io_uring Library. Admin commands and
+            management use the ioctl library, I/O commands go through io_uring.
+
+        Args:
+            dev_path (str, optional): Device path to which commands need to be sent.
+                Defaults to None.
+            queue_depth (int, optional): Maximum number of commands in flight.
+        """
+        super().__init__(dev_path)
+        self.queue_depth = queue_depth
+        self.ring = None
+        self.ring_lock = threading.Lock()
+
+    def close(self):
+        """ Releases the ring and this object's use of the cached descriptors """
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        super().close()
+
+    def get_ring(self, queue_depth):
+        """ Returns the ring, (re)creating it if it is smaller than queue_depth """
+        if self.ring and self.ring.entries < queue_depth:
+            self.ring.close()
+            self.ring = None
+        if not self.ring:
+            self.ring = IoUring(queue_depth)
+        return self.ring
+
+    def get_generic_dev_name(self, nsid):
+        """Maps the configured device and a namespace to its generic char device.
+
+        Args:
+            nsid (int): Namespace identifier of the command.
+
+        Returns:
+            str: Device name in format ngXnY.
+        """
+        ctrl = re.match(r"\Anvme([0-9]+)", self.dev_name).group(1)
+        return f"ng{ctrl}n{nsid}"
+
+    @staticmethod
+    def device_nsid(nsid, admin):
+        """Namespace of the generic device a command is submitted on. Admin
+            commands, whatever their NSID (0 for Identify Controller or
+            fabrics commands), and commands to all namespaces (FFFFFFFFh)
+            go to namespace 1, as ngXn0 and ngXnFFFFFFFF do not exist.
+
+        Args:
+            nsid (int): Namespace identifier of the command.
+            admin (bool): The command is an admin command.
+
+        Returns:
+            int: Namespace identifier of the generic device.
+        """
+        return 1 if admin or nsid in (0, 0xFFFFFFFF) else nsid
+
+    def submit_batch(self, nvme_cmds, queue_depth=None, admin=False):
+        """
+        Submit a batch of commands keeping up to queue_depth of them in flight.
+        The CQE of every command is filled in its "nvme_cmd.rsp".
+
+        Args:
+            nvme_cmds (List[NVMeCommand]): Commands to submit. Data is transferred
+                from/to the memory specified in each "nvme_cmd.buff".
+            queue_depth (int, optional): Maximum commands in flight.
+                Defaults to the queue depth of the library.
+            admin (bool, optional): Submit as admin commands. Defaults to False.
+
+        Returns:
+            List[int]: Status code of each command, negative errno if the command
+                could not be submitted.
+        """
+        with self.ring_lock:
+            return self.submit_batch_locked(nvme_cmds, queue_depth, admin)
+
+    def submit_batch_locked(self, nvme_cmds, queue_depth, admin):
+        """ submit_batch with the ring lock held """
+        queue_depth = min(queue_depth or self.queue_depth, len(nvme_cmds)) or 1
+        ring = self.get_ring(queue_depth)
+        cmd_op = NVME_URING_CMD_ADMIN if admin else NVME_URING_CMD_IO
+        statuses = [None] * len(nvme_cmds)
+
+        fds = {}
+        for nvme_cmd in nvme_cmds:
+            _, nsid = opcode_nsid(nvme_cmd.cmd)
+            if nsid not in fds:
+                fd = device_handles.get(self.get_generic_dev_name(self.device_nsid(nsid, admin)))
+                if fd < 0:
+                    logger.warning(f"-- -- Failed to open generic device for NSID {nsid}: {fd}")
+                    return [fd] * len(nvme_cmds)
+                fds[nsid] = fd
+
+        submitted = completed = 0
+        in_flight = 0
+        while completed < len(nvme_cmds):
+            while submitted < len(nvme_cmds) and in_flight < queue_depth:
+                nvme_cmd = nvme_cmds[submitted]
+                command = nvme_cmd.cmd.generic_command
+                opcode, nsid = opcode_nsid(command)
+                if admin and opcode == 0x7f:
+                    # Fabric Command, response is returned in the result
+                    set_data(command, 0, 0)
+                else:
+                    set_data(command, nvme_cmd.buff or 0,
+                             nvme_cmd.buff_size if nvme_cmd.buff else 0)
+                # The result is rsvd2 of struct nvme_uring_cmd
+                timeout_ms, _ = TIMEOUT_RESULT.unpack_from(command, TIMEOUT_OFFSET)
+                TIMEOUT_RESULT.pack_into(command, TIMEOUT_OFFSET, nvme_cmd.timeout_ms or timeout_ms, 0)
+                ring.prep_sqe(IORING_OP_URING_CMD, fds[nsid], cmd_op,
+                              user_data=submitted, command=command)
+                submitted += 1
+                in_flight += 1
+
+            ring.enter(min_complete=1)
+            for index, res, result in ring.reap():
+                statuses[index] = res
+                self.fill_response(nvme_cmds[index], res, result)
+                if admin and res == 0 and opcode_nsid(nvme_cmds[index].cmd) == (0x7f, 0x04) \
+                        and nvme_cmds[index].buff:
+                    # Property Get response
+                    ctypes.memmove(nvme_cmds[index].buff, result.to_bytes(8, 'little'), 8)
+                if admin and self.identify_cache:
+                    self.identify_cache.admin_completed(nvme_cmds[index], res)
+                completed += 1
+                in_flight -= 1
+
+        return statuses
+
+    def submit_io_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """
+        Submit io passthru command to the NVMe device through io_uring.
+
+        Args:
+            nvme_cmd: The NVMe command object to be submitted. The "NVMeCmdStruct"
+                will be utilised from "nvme_cmd.cmd" and the data is transferred
+                from/to memory specified in "nvme_cmd.buff".
+            verify_rsp: Flag indicating whether to verify the response. (TBD)
+            async_run: Flag indicating whether to run the command asynchronously.
+                If True, a Future resolving to the status code is returned.
+
+        Returns:
+            int: Status Code of the command execution.
+        """
+        if async_run:
+            return self.run_async(self.submit_io_passthru, nvme_cmd, verify_rsp)
+
+        self.ret_status = self.submit_batch([nvme_cmd], queue_depth=1)[0]
+        self.result = nvme_cmd.rsp.response.command_specific.CommandSpecific64
+        if self.ret_status != 0:
+            logger.warning("Command execution unsuccessful: {}", hex(self.ret_status))
+        return self.ret_status
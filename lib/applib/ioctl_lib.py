@@ -0,0 +1,299 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+IOCTL interface library.
+
+Library that provides an interface for interacting with NVMe devices
+by issuing the Linux NVMe passthru ioctls directly on the device.
+The NVMeCommand structure already has the layout of the kernel's
+nvme_passthru_cmd, so commands are handed to the driver without any
+translation, intermediate process or shared library.
+
+Fabric management (discover, connect, disconnect, list-subsys) is not done
+through passthru ioctls and is inherited from the nvme-cli library.
+"""
+import ctypes
+import errno
+import fcntl
+import re
+import sys
+sys.path.insert(1, './')
+from src.macros import *
+from utils.logging_module import logger
+from lib.applib.libnvme_lib import DeviceHandleCache, device_handles
+from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.cmdlib.commands_lib import NVMeCommandLib
+from lib.structlib.struct_base_lib import GenericCommand64
+from lib.structlib.struct_codec_lib import complete_response
+
+
+class IoctlLib(NVMeCLILib):
+
+    def __init__(self, dev_path=None) -> None:
+        """Initialize attributes for the IOCTL Library
+
+        Args:
+            dev_path (str, optional): Device path to which commands need to be sent.
+                Defaults to None.
+
+        Raises:
+            NameError: If device path is not in correct format.
+        """
+        super().__init__(dev_path)
+        if dev_path:
+            if re.match(r"\A/dev/nvme[0-9]+(n[0-9]+)?\Z", dev_path):
+                self.dev_name = dev_path[5:]
+            elif re.match(r"\Anvme[0-9]+(n[0-9]+)?\Z", dev_path):
+                self.dev_name = dev_path
+                self.dev_path = "/dev/" + dev_path
+            else:
+                logger.error(
+                    f"-- {dev_path} not in format of /dev/nvmeX or /dev/nvmeXnY or nvmeX or nvmeXnY")
+                raise NameError(
+                    dev_path, " not in format of /dev/nvmeX or /dev/nvmeXnY or nvmeX or nvmeXnY")
+            device_handles.register(self.dev_name)
+        else:
+            self.dev_name = None
+
+        self.cmdlib = NVMeCommandLib("ioctl")
+        self.ret_status = 0
+        self.result = 0
+
+    def reset(self):
+        """ Clears the state left by previously executed commands """
+        super().reset()
+        self.ret_status = 0
+        self.result = 0
+
+    def close(self):
+        """Releases this object's use of the cached device descriptor. The
+            descriptor is closed if no other object uses the controller.
+        """
+        if self.dev_name:
+            device_handles.unregister(self.dev_name)
+            device_handles.close_idle()
+
+    def submit_ioctl(self, request, command):
+        """Issues the passthru ioctl on the cached descriptor of the device.
+            A stale descriptor is reopened once and the ioctl is retried.
+
+        Args:
+            request (int): ioctl request code (NVME_IOCTL_*).
+            command: GenericCommand or GenericCommand64 structure to pass.
+
+        Returns:
+            int: NVMe status (0 on success), or negative errno if the ioctl failed.
+        """
+        fd = device_handles.get(self.dev_name)
+        if fd < 0:
+            logger.warning(f"-- -- Failed to open NVMe device {self.dev_name}. Error code {fd}")
+            return fd
+
+        for retry in (True, False):
+            try:
+                return fcntl.ioctl(fd, request, command)
+            except OSError as e:
+                if retry and e.errno in DeviceHandleCache.STALE_ERRNOS:
+                    logger.warning(f"-- -- Descriptor of {self.dev_name} is stale, reopening")
+                    fd = device_handles.reopen(self.dev_name)
+                    if fd >= 0:
+                        continue
+                logger.warning(f"-- -- ioctl failed: {errno.errorcode.get(e.errno, e.errno)}")
+                return -e.errno
+
+    def submit_passthru(self, nvme_cmd, verify_rsp=False, async_run=False):
+        """
+        Submit a passthru command to the NVMe device. Same as submit_admin_passthru,
+        kept for parity with the libnvme library.
+        """
+        return self.submit_admin_passthru(nvme_cmd, verify_rsp, async_run)
+
+    def submit_admin_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """
+        Submit admin passthru command to the NVMe device.
+
+        Args:
+            nvme_cmd: The NVMe command object to be submitted. The "NVMeCmdStruct"
+                will be utilised from "nvme_cmd.cmd" and the reponse is moved to memory
+                specified in "nvme_cmd.buff".
+            verify_rsp: Flag indicating whether to verify the response. (TBD)
+            async_run: Flag indicating whether to run the command asynchronously.
+                If True, a Future resolving to the status code is returned.
+
+        Returns:
+            int: Status Code of the command execution.
+        """
+        if async_run:
+            return self.run_async(self.submit_admin_passthru, nvme_cmd, verify_rsp)
+
+        command = nvme_cmd.cmd.generic_command
+        if nvme_cmd.timeout_ms:
+            command.timeout_ms = nvme_cmd.timeout_ms
+
+        if command.cdw0.OPC == 0x7f:
+            # Fabric Command, needs the 64 bit result for Property Get
+            command64 = GenericCommand64()
+            ctypes.memmove(ctypes.addressof(command64), ctypes.addressof(command),
+                           GenericCommand64.rsvd2.offset)
+            self.ret_status = self.submit_ioctl(NVME_IOCTL_ADMIN64_CMD, command64)
+            self.result = command64.result
+
+            if self.ret_status == 0 and command.NSID == 0x04 and nvme_cmd.buff:
+                # Property Get response
+                ctypes.memmove(nvme_cmd.buff, self.result.to_bytes(8, 'little'), 8)
+        else:
+            command.dptr.sgl.addr = nvme_cmd.buff if nvme_cmd.buff else 0
+            command.dptr.sgl.data_len = nvme_cmd.buff_size if nvme_cmd.buff else 0
+            self.ret_status = self.submit_ioctl(NVME_IOCTL_ADMIN_CMD, command)
+            self.result = command.result
+
+        self.fill_response(nvme_cmd, self.ret_status, self.result)
+        if self.identify_cache:
+            self.identify_cache.admin_completed(nvme_cmd, self.ret_status)
+        if self.ret_status != 0:
+            logger.warning("Command execution unsuccessful: {}", hex(self.ret_status))
+        return self.ret_status
+
+    def submit_io_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """
+        Submit io passthru command to the NVMe device.
+
+        Args:
+            nvme_cmd: The NVMe command object to be submitted. The "NVMeCmdStruct"
+                will be utilised from "nvme_cmd.cmd" and the data is transferred
+                from/to memory specified in "nvme_cmd.buff".
+            verify_rsp: Flag indicating whether to verify the response. (TBD)
+            async_run: Flag indicating whether to run the command asynchronously.
+                If True, a Future resolving to the status code is returned.
+
+        Returns:
+            int: Status Code of the command execution.
+        """
+        if async_run:
+            return self.run_async(self.submit_io_passthru, nvme_cmd, verify_rsp)
+
+        command = nvme_cmd.cmd.generic_command
+        if nvme_cmd.timeout_ms:
+            command.timeout_ms = nvme_cmd.timeout_ms
+        command.dptr.sgl.addr = nvme_cmd.buff if nvme_cmd.buff else 0
+        command.dptr.sgl.data_len = nvme_cmd.buff_size if nvme_cmd.buff else 0
+
+        self.ret_status = self.submit_ioctl(NVME_IOCTL_IO_CMD, command)
+        self.result = command.result
+
+        self.fill_response(nvme_cmd, self.ret_status, self.result)
+        if self.ret_status != 0:
+            logger.warning("Command execution unsuccessful: {}", hex(self.ret_status))
+        return self.ret_status
+
+    def submit_batch(self, nvme_cmds, queue_depth=None, admin=False):
+        """
+        Submit a batch of passthru commands to the NVMe device. All commands
+        are issued on the cached descriptor of the device.
+
+        Args:
+            nvme_cmds (List[NVMeCommand]): Commands to submit. Data is transferred
+                from/to the memory specified in each "nvme_cmd.buff".
+            queue_depth (int, optional): Unused, the ioctls are synchronous.
+            admin (bool, optional): Submit as admin commands. Defaults to False.
+
+        Returns:
+            List[int]: Status code of each command. The CQE of each command is filled.
+        """
+        submit = self.submit_admin_passthru if admin else self.submit_io_passthru
+        return [submit(nvme_cmd) for nvme_cmd in nvme_cmds]
+
+    def fill_response(self, nvme_cmd, status, result=None):
+        """Fills the CQE structure of the command. Done at completion, so that
+            commands completing concurrently do not share any state.
+
+        Args:
+            nvme_cmd: Command object to fill response in.
+            status (int): NVMe status of the command or negative errno.
+            result (int, optional): Command specific result (CQE DW0-DW1).
+                Left unchanged if None.
+        """
+        # A negative errno leaves the status unchanged, the command did not reach the controller
+        complete_response(nvme_cmd.rsp.response, nvme_cmd.cmd, status, result)
+
+    def get_response(self, nvme_cmd, rsp=None):
+        """Fill the CQE structure from the status of the command. The command
+            specific result is filled when the command completes.
+
+        Args:
+            nvme_cmd: Command object to fill response in
+            rsp (int, optional): Manually provide the status, else takes the
+                previously executed command's status. Defaults to None.
+
+        Returns:
+            bool: Indicates success or failure
+        """
+        status = self.ret_status if rsp is None else rsp
+        self.fill_response(nvme_cmd, status)
+        return status >= 0
+
+    def get_passthru_result(self):
+        """ Returns the result (CQE DW0) of the last command as a hex string """
+        return f"0x{self.result & 0xFFFFFFFF:08x}" if self.ret_status == 0 else None
+
+    def submit_list_ns_cmd(self):
+        """Sends identify command with CNS=02 to retrieve active namespace list
+
+        Returns:
+            Tuple[int, List[str] | str]:
+            - If execution successful, tuple contains status code and list of
+                absolute namespace paths.
+            - If execution fails, tuple contains status code and error.
+        """
+        nvme_cmd = self.cmdlib.get_identify_cmd()
+        result = ctypes.create_string_buffer(4096)
+        nvme_cmd.buff = ctypes.addressof(result)
+        nvme_cmd.cmd.identify_cmd.cdw10.raw = 0x02
+
+        status = self.submit_admin_passthru(nvme_cmd)
+        if status != 0:
+            return status, "ERROR"
+
+        dev = re.sub(r"n[0-9]+\Z", "", self.dev_path)
+        ns_ids = (ctypes.c_uint32 * 1024).from_buffer(result)
+        ns_paths = []
+        for nsid in ns_ids:
+            if nsid == 0:
+                break
+            ns_paths.append(dev + 'n' + str(nsid))
+        return 0, ns_paths
+
+    def get_device_lba_size(self, dev=None):
+        """
+        Submits an Identify Namespace command to compute the block size of the
+        formatted LBA format.
+
+        Args:
+            str: Device path whose block size is to be computed.
+
+        Returns:
+            int: The block size. -1 if error.
+        """
+        dev = dev if dev else self.dev_path
+        lba_size = self.get_cached_lba_size(dev)
+        if lba_size:
+            return lba_size
+
+        match = re.search(r"n([0-9]+)\Z", dev)
+        nsid = int(match.group(1)) if match else 1
+
+        nvme_cmd = self.cmdlib.get_identify_cmd()
+        result = ctypes.create_string_buffer(4096)
+        nvme_cmd.buff = ctypes.addressof(result)
+        nvme_cmd.cmd.identify_cmd.NSID = nsid
+        nvme_cmd.cmd.identify_cmd.cdw10.raw = 0x00
+
+        if self.submit_admin_passthru(nvme_cmd) != 0:
+            return -1
+
+        # FLBAS (byte 26) bits 3:0 and 6:5 select the LBA Format, LBAF0 at byte 128
+        flbas = result.raw[26]
+        lba_format = (flbas & 0x0F) | ((flbas >> 1) & 0x30)
+        lbads = result.raw[128 + 4 * lba_format + 2]
+        return 2**lbads
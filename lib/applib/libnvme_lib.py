@@ -10,23 +10,358 @@ This library is designed to be used in the framework that requires
 interaction with NVMe devices, and it abstracts the complexities
 of dealing with the libnvme APIs and it's source code.
 """
+import errno
+import glob
 import json
 import re
 import os
+import shutil
+import subprocess
 import sys
+import threading
 sys.path.insert(1, "./")
 import ctypes
 from utils.logging_module import logger
 from lib.structlib.struct_fabric_libnvme_lib import *
 from lib.cmdlib.commands_lib import NVMeCommandLib
+from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.syslib.system_lib import SystemLib
+from lib.structlib.struct_codec_lib import encode_status
+
+
+class DeviceHandleCache():
+    """
+    Session wide cache of open NVMe device descriptors.
+
+    Each device is opened once and the descriptor is shared by every user of
+    that device. Users are reference counted so that idle descriptors can be
+    closed, and a descriptor can be reopened when it goes stale after a
+    controller reset or reconnect. All descriptors are closed at teardown.
+
+    Attributes:
+        open_count (int): Number of times a device had to be opened.
+        reuse_count (int): Number of times an already open descriptor was reused.
+        reopen_count (int): Number of times a stale descriptor was reopened.
+    """
+
+    # errno values which indicate that a descriptor no longer points to a live device
+    STALE_ERRNOS = (errno.EBADF, errno.ENODEV, errno.ENXIO)
+
+    def __init__(self, opener=None) -> None:
+        """ Constructor
+
+        Args:
+            opener (callable, optional): Function taking a device name (nvmeX or
+                nvmeXnY) and returning a descriptor or a negative error code.
+                Defaults to opening "/dev/<name>" read-only.
+        """
+        self.opener = opener if opener else DeviceHandleCache.open_device
+        self.handles = {}
+        self.users = {}
+        self.lock = threading.Lock()
+        self.open_count = 0
+        self.reuse_count = 0
+        self.reopen_count = 0
+
+    @staticmethod
+    def open_device(dev_name):
+        """Opens the device node read-only, same as nvme_open in libnvme.
+
+        Args:
+            dev_name (str): Device name in format nvmeX or nvmeXnY.
+
+        Returns:
+            int: Descriptor of the opened device or negative errno on failure.
+        """
+        try:
+            return os.open(f"/dev/{dev_name}", os.O_RDONLY)
+        except OSError as e:
+            return -e.errno
+
+    def register(self, dev_name):
+        """Registers a user of the device. Does not open the device.
+
+        Args:
+            dev_name (str): Device name in format nvmeX or nvmeXnY.
+        """
+        with self.lock:
+            self.users[dev_name] = self.users.get(dev_name, 0) + 1
+
+    def unregister(self, dev_name):
+        """Removes a user of the device. The descriptor stays cached until
+            close_idle() or close_all() is called.
+
+        Args:
+            dev_name (str): Device name in format nvmeX or nvmeXnY.
+        """
+        with self.lock:
+            if self.users.get(dev_name, 0) > 0:
+                self.users[dev_name] -= 1
+
+    def get(self, dev_name):
+        """Returns the cached descriptor of the device, opening it only if needed.
+
+        Args:
+            dev_name (str): Device name in format nvmeX or nvmeXnY.
+
+        Returns:
+            int: Descriptor of the device or negative error code on failure.
+        """
+        with self.lock:
+            fd = self.handles.get(dev_name)
+            if fd is not None:
+                self.reuse_count += 1
+                return fd
+            fd = self.opener(dev_name)
+            if fd >= 0:
+                self.handles[dev_name] = fd
+                self.open_count += 1
+            return fd
+
+    def reopen(self, dev_name):
+        """Closes the cached descriptor of the device and opens it again.
+            Used after a controller reset or reconnect.
+
+        Args:
+            dev_name (str): Device name in format nvmeX or nvmeXnY.
+
+        Returns:
+            int: New descriptor of the device or negative error code on failure.
+        """
+        self.invalidate(dev_name)
+        with self.lock:
+            self.reopen_count += 1
+        return self.get(dev_name)
+
+    def invalidate(self, dev_name):
+        """Closes and forgets the cached descriptor of the device, if any.
+            Invalidating a controller (nvmeX) also invalidates its namespaces.
+            The next get() opens the device again.
+
+        Args:
+            dev_name (str): Device name in format nvmeX or nvmeXnY.
+        """
+        with self.lock:
+            stale = [dev for dev in self.handles
+                     if dev == dev_name or re.match(rf"\A{dev_name}n[0-9]+\Z", dev)]
+            handles = [self.handles.pop(dev) for dev in stale]
+        for fd in handles:
+            DeviceHandleCache.close_fd(fd)
+
+    @staticmethod
+    def controller_of(dev_name):
+        """Instance number of the controller of a device (nvmeX, nvmeXnY or ngXnY).
+
+        Returns:
+            str: The instance number, or the device name if not in these formats.
+        """
+        match = re.match(r"\A(?:nvme|ng)([0-9]+)", dev_name)
+        return match.group(1) if match else dev_name
+
+    def close_idle(self):
+        """Closes the descriptors of controllers which have no registered users.
+            Descriptors of the namespaces and generic devices of a controller
+            are in use as long as the controller or one of them has users.
+        """
+        with self.lock:
+            busy = {DeviceHandleCache.controller_of(dev)
+                    for dev, users in self.users.items() if users > 0}
+            idle = [dev for dev in self.handles
+                    if DeviceHandleCache.controller_of(dev) not in busy]
+            handles = [self.handles.pop(dev) for dev in idle]
+        for fd in handles:
+            DeviceHandleCache.close_fd(fd)
+
+    def close_all(self):
+        """Closes every cached descriptor. Called at session teardown."""
+        with self.lock:
+            handles = list(self.handles.values())
+            self.handles.clear()
+            self.users.clear()
+        for fd in handles:
+            DeviceHandleCache.close_fd(fd)
+
+    @staticmethod
+    def close_fd(fd):
+        """Closes the descriptor, ignoring descriptors which are already invalid."""
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def stats(self):
+        """Counters for confirming that the hot path does not open devices.
+
+        Returns:
+            dict: Open, reuse and reopen counts along with the number of
+                descriptors currently open.
+        """
+        with self.lock:
+            return {"opens": self.open_count, "reuses": self.reuse_count,
+                    "reopens": self.reopen_count, "open_handles": len(self.handles)}
+
+
+# Shared by every Libnvme object of the session
+device_handles = DeviceHandleCache()
+
+
+# Function prototypes of every libnvme method used by the framework.
+# Format: "symbol": (argtypes, restype)
+LIBNVME_PROTOTYPES = {
+    # void nvmf_default_config(struct nvme_fabrics_config *cfg);
+    "nvmf_default_config": ([ctypes.POINTER(NVME_FABRICS_CONFIG)], None),
+
+    # nvme_root_t nvme_scan(const char *config_file);
+    "nvme_scan": ([ctypes.c_char_p], ctypes.POINTER(NVME_ROOT)),
+
+    # nvme_host_t nvme_default_host(nvme_root_t r);
+    "nvme_default_host": ([ctypes.POINTER(NVME_ROOT)], ctypes.POINTER(NVME_HOST)),
+
+    # nvme_ctrl_t nvme_create_ctrl(nvme_root_t r,
+    #         const char *subsysnqn, const char *transport,
+    #         const char *traddr, const char *host_traddr,
+    #         const char *host_iface, const char *trsvcid);
+    "nvme_create_ctrl": ([ctypes.POINTER(NVME_ROOT)] + [ctypes.c_char_p]*6,
+                         ctypes.POINTER(NVME_CTRL)),
+
+    # int nvmf_add_ctrl(nvme_host_t h, nvme_ctrl_t c,
+    #       const struct nvme_fabrics_config *cfg);
+    "nvmf_add_ctrl": ([ctypes.POINTER(NVME_HOST), ctypes.POINTER(NVME_CTRL),
+                       ctypes.POINTER(NVME_FABRICS_CONFIG)], ctypes.c_int),
+
+    # int nvmf_get_discovery_log(nvme_ctrl_t c, struct nvmf_discovery_log **logp,
+    #         int max_retries);
+    "nvmf_get_discovery_log": ([ctypes.POINTER(NVME_CTRL),
+                                ctypes.POINTER(ctypes.POINTER(NVMF_DISCOVERY_LOG)),
+                                ctypes.c_int], ctypes.c_int),
+
+    # int nvme_disconnect_ctrl(nvme_ctrl_t c);
+    "nvme_disconnect_ctrl": ([ctypes.POINTER(NVME_CTRL)], ctypes.c_int),
+
+    # void nvme_free_ctrl(struct nvme_ctrl *c);
+    "nvme_free_ctrl": ([ctypes.POINTER(NVME_CTRL)], None),
+
+    # void nvme_free_tree(nvme_root_t r);
+    "nvme_free_tree": ([ctypes.POINTER(NVME_ROOT)], None),
+
+    # nvme_ctrl_t nvme_ctrl_find(nvme_subsystem_t s, const char *transport,
+    # const char *traddr, const char *trsvcid,
+    # const char *subsysnqn, const char *host_traddr,
+    # const char *host_iface);
+    "nvme_ctrl_find": ([ctypes.POINTER(NVME_SUBSYSTEM)] + [ctypes.c_char_p]*6,
+                       ctypes.POINTER(NVME_CTRL)),
+
+    # nvme_subsystem_t nvme_lookup_subsystem(struct nvme_host *h,
+    # const char *name,
+    # const char *subsysnqn);
+    "nvme_lookup_subsystem": ([ctypes.POINTER(NVME_HOST)] + [ctypes.c_char_p]*2,
+                              ctypes.POINTER(NVME_SUBSYSTEM)),
+
+    # nvme_ctrl_t nvme_lookup_ctrl(nvme_subsystem_t s, const char *transport,
+    # const char *traddr, const char *host_traddr,
+    # const char *host_iface, const char *trsvcid,
+    # nvme_ctrl_t p);
+    "nvme_lookup_ctrl": ([ctypes.POINTER(NVME_SUBSYSTEM)] + [ctypes.c_char_p]*5
+                         + [ctypes.POINTER(NVME_CTRL)], ctypes.POINTER(NVME_CTRL)),
+
+    # nvme_host_t nvme_first_host(nvme_root_t r);
+    "nvme_first_host": ([ctypes.POINTER(NVME_ROOT)], ctypes.POINTER(NVME_HOST)),
+
+    # nvme_host_t nvme_next_host(nvme_root_t r, nvme_host_t h);
+    "nvme_next_host": ([ctypes.POINTER(NVME_ROOT), ctypes.POINTER(NVME_HOST)],
+                       ctypes.POINTER(NVME_HOST)),
+
+    # nvme_subsystem_t nvme_first_subsystem(nvme_host_t h);
+    "nvme_first_subsystem": ([ctypes.POINTER(NVME_HOST)], ctypes.POINTER(NVME_SUBSYSTEM)),
+
+    # nvme_subsystem_t nvme_next_subsystem(nvme_host_t h, nvme_subsystem_t s);
+    "nvme_next_subsystem": ([ctypes.POINTER(NVME_HOST), ctypes.POINTER(NVME_SUBSYSTEM)],
+                            ctypes.POINTER(NVME_SUBSYSTEM)),
+
+    # nvme_ctrl_t nvme_subsystem_first_ctrl(nvme_subsystem_t s);
+    "nvme_subsystem_first_ctrl": ([ctypes.POINTER(NVME_SUBSYSTEM)], ctypes.POINTER(NVME_CTRL)),
+
+    # nvme_ctrl_t nvme_subsystem_next_ctrl(nvme_subsystem_t s, nvme_ctrl_t c);
+    "nvme_subsystem_next_ctrl": ([ctypes.POINTER(NVME_SUBSYSTEM), ctypes.POINTER(NVME_CTRL)],
+                                 ctypes.POINTER(NVME_CTRL)),
+
+    # const char *nvme_ctrl_get_name(nvme_ctrl_t c);
+    "nvme_ctrl_get_name": ([ctypes.POINTER(NVME_CTRL)], ctypes.c_char_p),
+
+    # const char *nvme_ctrl_get_subsysnqn(nvme_ctrl_t c);
+    "nvme_ctrl_get_subsysnqn": ([ctypes.POINTER(NVME_CTRL)], ctypes.c_char_p),
+
+    # void nvme_host_set_dhchap_key(nvme_host_t h, const char *key);
+    "nvme_host_set_dhchap_key": ([ctypes.POINTER(NVME_HOST), ctypes.c_char_p], None),
+
+    # void nvme_ctrl_set_dhchap_key(nvme_ctrl_t c, const char *key);
+    "nvme_ctrl_set_dhchap_key": ([ctypes.POINTER(NVME_CTRL), ctypes.c_char_p], None),
+
+    # int nvme_open(const char *name);
+    "nvme_open": ([ctypes.c_char_p], ctypes.c_int),
+
+    # int nvme_submit_admin_passthru(int fd, struct nvme_passthru_cmd *cmd,
+    #         __u32 *result);
+    "nvme_submit_admin_passthru": ([ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p],
+                                   ctypes.c_int32),
+
+    # int nvme_submit_admin_passthru64(int fd, struct nvme_passthru_cmd64 *cmd,
+    #         __u64 *result);
+    "nvme_submit_admin_passthru64": ([ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p],
+                                     ctypes.c_int32),
+}
+
+# Loaded shared objects, one per path for the whole process
+loaded_libnvme = {}
+loaded_libnvme_lock = threading.Lock()
+
+
+def load_libnvme(libnvme_path):
+    """Loads the libnvme shared object and binds all prototypes from
+        LIBNVME_PROTOTYPES. This happens only once per path in a process,
+        later calls return the already bound library.
+
+    Args:
+        libnvme_path (str): Path to the libnvme.so file.
+
+    Returns:
+        ctypes.CDLL: The loaded library with prototypes defined.
+    """
+    with loaded_libnvme_lock:
+        libnvme = loaded_libnvme.get(libnvme_path)
+        if libnvme:
+            return libnvme
+
+        logger.info(f"-- libnvme initializing, using path {libnvme_path}")
+        libnvme = ctypes.CDLL(libnvme_path, use_errno=True)
+        for symbol, (argtypes, restype) in LIBNVME_PROTOTYPES.items():
+            try:
+                function = getattr(libnvme, symbol)
+            except AttributeError:
+                logger.warning(f"-- libnvme at {libnvme_path} does not export {symbol}")
+                continue
+            function.argtypes = argtypes
+            function.restype = restype
+
+        loaded_libnvme[libnvme_path] = libnvme
+        return libnvme
 
 
 class Libnvme():
 
+    # Standard library directories searched before walking the file system
+    LIB_DIRS = ["/usr/local/lib", "/usr/local/lib64", "/usr/lib", "/usr/lib64", "/lib", "/lib64"]
+
+    # Path resolved by get_libnvme_path, shared by the whole process
+    resolved_path = None
+
+    # libnvme submits admin and fabrics commands only, there is no I/O passthru
+    io_passthru = False
+
     def __init__(self, dev_path=None) -> None:
         """ - Initialize attributes for the CLI Library
             - Sets the path for the shared object file.
-            - Defines the function prototypes of the libnvme C methods.
+            - Loads libnvme with the function prototypes bound (once per process).
         Args:
             dev_path (str, optional): Device path to which commands need to be sent.
                 Defaults to None.
@@ -45,140 +380,21 @@ class Libnvme():
             raise NameError(
                 dev_path, " not in format of /dev/nvmeX or /dev/nvmeXnY or nvmeX or nvmeXnY")
 
+        if dev_path:
+            device_handles.register(self.dev_name)
+
         self.connectedDeviceName = None
         self.command = None
         self.response = None
         self.cmdlib = NVMeCommandLib("libnvme")
-        libnvme_path = Libnvme.get_libnvme_path()
-        logger.info(f"-- libnvme initializing, using path {libnvme_path}")
-        self.libnvme = ctypes.CDLL(libnvme_path)
-
-        # void nvmf_default_config(struct nvme_fabrics_config *cfg);
-        self.libnvme.nvmf_default_config.argtypes = [
-            ctypes.POINTER(NVME_FABRICS_CONFIG)]
-        self.libnvme.nvmf_default_config.restype = None
-
-        # nvme_root_t nvme_scan(const char *config_file);
-        self.libnvme.nvme_scan.argtypes = [ctypes.c_char_p]
-        self.libnvme.nvme_scan.restype = ctypes.POINTER(NVME_ROOT)
-
-        # nvme_host_t nvme_default_host(nvme_root_t r);
-        self.libnvme.nvme_default_host.argtypes = [ctypes.POINTER(NVME_ROOT)]
-        self.libnvme.nvme_default_host.restype = ctypes.POINTER(NVME_HOST)
-
-        # nvme_ctrl_t nvme_create_ctrl(nvme_root_t r,
-        #         const char *subsysnqn, const char *transport,
-        #         const char *traddr, const char *host_traddr,
-        #         const char *host_iface, const char *trsvcid);
-        self.libnvme.nvme_create_ctrl.argtypes = [
-            ctypes.POINTER(NVME_ROOT)]+[ctypes.c_char_p]*6
-        self.libnvme.nvme_create_ctrl.restype = ctypes.POINTER(NVME_CTRL)
-
-        # int nvmf_add_ctrl(nvme_host_t h, nvme_ctrl_t c,
-        #       const struct nvme_fabrics_config *cfg);
-        self.libnvme.nvmf_add_ctrl.argtypes = [ctypes.POINTER(
-            NVME_HOST), ctypes.POINTER(NVME_CTRL), ctypes.POINTER(NVME_FABRICS_CONFIG)]
-        self.libnvme.nvmf_add_ctrl.restype = ctypes.c_int
-
-        # int nvmf_get_discovery_log(nvme_ctrl_t c, struct nvmf_discovery_log **logp,
-        #         int max_retries);
-        self.libnvme.nvmf_get_discovery_log.argtypes = [ctypes.POINTER(
-            NVME_CTRL), ctypes.POINTER(ctypes.POINTER(NVMF_DISCOVERY_LOG)), ctypes.c_int]
-        self.libnvme.nvmf_get_discovery_log.restype = ctypes.c_int
-
-        # int nvme_disconnect_ctrl(nvme_ctrl_t c);
-        self.libnvme.nvme_disconnect_ctrl.argtypes = [
-            ctypes.POINTER(NVME_CTRL)]
-        self.libnvme.nvme_disconnect_ctrl.restype = ctypes.c_int
-
-        # void nvme_free_ctrl(struct nvme_ctrl *c);
-        self.libnvme.nvme_free_ctrl.argtypes = [ctypes.POINTER(NVME_CTRL)]
-        self.libnvme.nvme_free_ctrl.restype = None
-
-        # void nvme_free_tree(nvme_root_t r);
-        self.libnvme.nvme_free_tree.argtypes = [ctypes.POINTER(NVME_ROOT)]
-        self.libnvme.nvme_free_tree.restype = None
-
-        # nvme_ctrl_t nvme_ctrl_find(nvme_subsystem_t s, const char *transport,
-        # const char *traddr, const char *trsvcid,
-        # const char *subsysnqn, const char *host_traddr,
-        # const char *host_iface);
-        self.libnvme.nvme_ctrl_find.argtypes = [
-            ctypes.POINTER(NVME_SUBSYSTEM)]+[ctypes.c_char_p]*6
-        self.libnvme.nvme_ctrl_find.restype = ctypes.POINTER(NVME_CTRL)
-
-        # nvme_subsystem_t nvme_lookup_subsystem(struct nvme_host *h,
-        # const char *name,
-        # const char *subsysnqn);
-        self.libnvme.nvme_lookup_subsystem.argtypes = [
-            ctypes.POINTER(NVME_HOST)]+[ctypes.c_char_p]*2
-        self.libnvme.nvme_lookup_subsystem.restype = ctypes.POINTER(
-            NVME_SUBSYSTEM)
-
-        # nvme_ctrl_t nvme_lookup_ctrl(nvme_subsystem_t s, const char *transport,
-        # const char *traddr, const char *host_traddr,
-        # const char *host_iface, const char *trsvcid,
-        # nvme_ctrl_t p);
-        self.libnvme.nvme_lookup_ctrl.argtypes = [ctypes.POINTER(
-            NVME_SUBSYSTEM)] + [ctypes.c_char_p]*5 + [ctypes.POINTER(NVME_CTRL)]
-        self.libnvme.nvme_lookup_ctrl.restype = ctypes.POINTER(NVME_CTRL)
-
-        # nvme_host_t nvme_first_host(nvme_root_t r);
-        self.libnvme.nvme_first_host.argtypes = [ctypes.POINTER(NVME_ROOT)]
-        self.libnvme.nvme_first_host.restype = ctypes.POINTER(NVME_HOST)
-
-        # nvme_host_t nvme_next_host(nvme_root_t r, nvme_host_t h);
-        self.libnvme.nvme_next_host.argtypes = [
-            ctypes.POINTER(NVME_ROOT), ctypes.POINTER(NVME_HOST)]
-        self.libnvme.nvme_next_host.restype = ctypes.POINTER(NVME_HOST)
-
-        # nvme_subsystem_t nvme_first_subsystem(nvme_host_t h);
-        self.libnvme.nvme_first_subsystem.argtypes = [
-            ctypes.POINTER(NVME_HOST)]
-        self.libnvme.nvme_first_subsystem.restype = ctypes.POINTER(
-            NVME_SUBSYSTEM)
-
-        # nvme_subsystem_t nvme_next_subsystem(nvme_host_t h, nvme_subsystem_t s);
-        self.libnvme.nvme_next_subsystem.argtypes = [
-            ctypes.POINTER(NVME_HOST), ctypes.POINTER(NVME_SUBSYSTEM)]
-        self.libnvme.nvme_next_subsystem.restype = ctypes.POINTER(
-            NVME_SUBSYSTEM)
-
-        # nvme_ctrl_t nvme_subsystem_first_ctrl(nvme_subsystem_t s);
-        self.libnvme.nvme_subsystem_first_ctrl.argtypes = [
-            ctypes.POINTER(NVME_SUBSYSTEM)]
-        self.libnvme.nvme_subsystem_first_ctrl.restype = ctypes.POINTER(
-            NVME_CTRL)
-
-        # nvme_ctrl_t nvme_subsystem_next_ctrl(nvme_subsystem_t s, nvme_ctrl_t c);
-        self.libnvme.nvme_subsystem_next_ctrl.argtypes = [
-            ctypes.POINTER(NVME_SUBSYSTEM), ctypes.POINTER(NVME_CTRL)]
-        self.libnvme.nvme_subsystem_next_ctrl.restype = ctypes.POINTER(
-            NVME_CTRL)
-
-        # const char *nvme_ctrl_get_name(nvme_ctrl_t c);
-        self.libnvme.nvme_ctrl_get_name.argtypes = [ctypes.POINTER(NVME_CTRL)]
-        self.libnvme.nvme_ctrl_get_name.restype = ctypes.c_char_p
-
-        # void nvme_host_set_dhchap_key(nvme_host_t h, const char *key);
-        self.libnvme.nvme_host_set_dhchap_key.argtypes = [
-            ctypes.POINTER(NVME_HOST), ctypes.c_char_p]
-        self.libnvme.nvme_host_set_dhchap_key.restype = None
-
-        # const char *nvme_ctrl_get_subsysnqn(nvme_ctrl_t c);
-        self.libnvme.nvme_ctrl_get_subsysnqn.argtypes = [
-            ctypes.POINTER(NVME_CTRL)]
-        self.libnvme.nvme_ctrl_get_subsysnqn.restype = ctypes.c_char_p
-
-        # void nvme_ctrl_set_dhchap_key(nvme_ctrl_t c, const char *key);
-        self.libnvme.nvme_host_set_dhchap_key.argtypes = [
-            ctypes.POINTER(NVME_CTRL), ctypes.c_char_p]
-        self.libnvme.nvme_host_set_dhchap_key.restype = None
+        self.libnvme = load_libnvme(Libnvme.get_libnvme_path())
+        self.ret_status = 0
+        self.identify_cache = None
 
     @staticmethod
     def get_libnvme_path():
         """Static method used to set the path of the libnvme.so file
-            and fine it if needed.
+            and find it if needed. The path is resolved once per process.
 
         Raises:
             FileNotFoundError: If unable to find the libnvme.so file anywhere.
@@ -186,50 +402,199 @@ class Libnvme():
         Returns:
             str: Path to the correct libnvme.so file.
         """
+        if Libnvme.resolved_path:
+            return Libnvme.resolved_path
+
         f = open("config/ts_config.json")
         ts_config = json.load(f)
         f.close()
 
         # Finding system's libnvme.so file
         if ts_config["libnvme_path"].lower() == "auto":
-            for root, dirs, files in os.walk("/usr/"):
-                if "libnvme.so" in files:
-                    return os.path.join(root, "libnvme.so")
-
-            for root, dirs, files in os.walk("/"):
-                if "libnvme.so" in files:
-                    return os.path.join(root, "libnvme.so")
-
-            logger.error("--",
-                  "Not able to find libnvme.so. Give the path manually in ts_config.json.")
-            raise FileNotFoundError(
-                "Not able to find libnvme.so. Give the path manually in ts_config.json.")
+            libnvme_path = Libnvme.find_libnvme_path()
+            if not libnvme_path:
+                logger.error("--",
+                      "Not able to find libnvme.so. Give the path manually in ts_config.json.")
+                raise FileNotFoundError(
+                    "Not able to find libnvme.so. Give the path manually in ts_config.json.")
 
         elif ts_config["libnvme_path"].endswith("libnvme.so") and os.path.isfile(ts_config["libnvme_path"]):
-            return ts_config["libnvme_path"]
+            libnvme_path = ts_config["libnvme_path"]
         else:
             logger.error(
                 "-- libnvme.so path not correct. Set to \"auto\" to find automatically.")
             raise FileNotFoundError(
                 "libnvme.so path not correct. Set to \"auto\" to find automatically.")
 
+        Libnvme.resolved_path = libnvme_path
+        return libnvme_path
+
+    @staticmethod
+    def find_libnvme_path():
+        """Finds the libnvme.so file, cheapest source first:
+            - Path cached on disk by a previous run (if the file is unchanged)
+            - Dynamic linker cache (ldconfig -p)
+            - Standard library directories
+            - Walk of /usr/ and then of the entire file system
+
+        Returns:
+            str: Path to the libnvme.so file, None if not found.
+        """
+        libnvme_path = Libnvme.read_path_cache()
+        if libnvme_path:
+            logger.debug(f"-- libnvme path taken from cache: {libnvme_path}")
+            return libnvme_path
+
+        libnvme_path = Libnvme.find_in_ldconfig() or Libnvme.find_in_lib_dirs()
+
+        if not libnvme_path:
+            logger.warning("-- libnvme not in linker cache or library directories, searching file system")
+            for top in ["/usr/", "/"]:
+                for root, dirs, files in os.walk(top):
+                    if "libnvme.so" in files:
+                        libnvme_path = os.path.join(root, "libnvme.so")
+                        break
+                if libnvme_path:
+                    break
+
+        if libnvme_path:
+            Libnvme.write_path_cache(libnvme_path)
+        return libnvme_path
+
+    @staticmethod
+    def find_in_ldconfig():
+        """Looks up libnvme in the dynamic linker cache.
+
+        Returns:
+            str: Path to libnvme, None if not present in the cache.
+        """
+        ldconfig = shutil.which("ldconfig") or shutil.which("ldconfig", path="/sbin:/usr/sbin")
+        if not ldconfig:
+            return None
+        try:
+            output = subprocess.run([ldconfig, "-p"], capture_output=True,
+                                    timeout=5).stdout.decode(errors="ignore")
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+        # Lines are in format: "\tlibnvme.so.1 (libc6,x86-64) => /usr/lib/libnvme.so.1"
+        found = {}
+        for line in output.splitlines():
+            match = re.match(r"\s*(libnvme\.so[.0-9]*)\s.*=>\s*(\S+)", line)
+            if match and os.path.isfile(match.group(2)):
+                found.setdefault(match.group(1), match.group(2))
+        if "libnvme.so" in found:
+            return found["libnvme.so"]
+        return found[sorted(found)[0]] if found else None
+
+    @staticmethod
+    def find_in_lib_dirs():
+        """Looks for libnvme in the standard library directories.
+
+        Returns:
+            str: Path to libnvme, None if not present.
+        """
+        lib_dirs = Libnvme.LIB_DIRS + sorted(glob.glob("/usr/lib/*-linux-gnu")) \
+            + sorted(glob.glob("/lib/*-linux-gnu"))
+        for lib_dir in lib_dirs:
+            libnvme_path = os.path.join(lib_dir, "libnvme.so")
+            if os.path.isfile(libnvme_path):
+                return libnvme_path
+            versioned = sorted(glob.glob(os.path.join(lib_dir, "libnvme.so.*")))
+            if versioned:
+                return versioned[0]
+        return None
+
+    @staticmethod
+    def get_path_cache_file():
+        """ Returns the file used for caching the resolved libnvme path on disk """
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        return os.path.join(cache_dir, "nvmfabtest", "libnvme_path.json")
+
+    @staticmethod
+    def read_path_cache():
+        """Reads the libnvme path cached on disk. The entry is only valid if the
+            file still has the same inode and modification time.
+
+        Returns:
+            str: Cached path, None if there is no valid entry.
+        """
+        try:
+            with open(Libnvme.get_path_cache_file()) as f:
+                entry = json.load(f)
+            stat = os.stat(entry["path"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if stat.st_ino != entry.get("inode") or stat.st_mtime_ns != entry.get("mtime_ns"):
+            return None
+        return entry["path"]
+
+    @staticmethod
+    def write_path_cache(libnvme_path):
+        """Caches the libnvme path on disk keyed by the file's inode and
+            modification time. Failure to write the cache is not an error.
+
+        Args:
+            libnvme_path (str): Path to the libnvme.so file.
+        """
+        cache_file = Libnvme.get_path_cache_file()
+        try:
+            stat = os.stat(libnvme_path)
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, "w") as f:
+                json.dump({"path": libnvme_path, "inode": stat.st_ino,
+                           "mtime_ns": stat.st_mtime_ns}, f)
+        except OSError as e:
+            logger.debug(f"-- Could not cache libnvme path: {e}")
+
     def nvme_open(self):
-        """Wrapper for the nvme_open method in libnvme. 
+        """Retrieves the descriptor of the device from the session wide
+            device handle cache. The device is opened only on first use.
 
         Returns:
             Tuple[int, str]: Tuple containing status and error message (empty if success)
         """
         device_name = self.dev_name
-        nvme_open = self.libnvme.nvme_open
-        nvme_open.argtypes = [ctypes.c_char_p]
-        nvme_open.restype = ctypes.c_int
-        device_descriptor = nvme_open(device_name.encode())
+        device_descriptor = device_handles.get(device_name)
         if device_descriptor < 0:
             return device_descriptor, f"Failed to open NVMe device {device_name}. Error code {device_descriptor}"
         else:
             self.device_descriptor = device_descriptor
             return 0, ""
 
+    def is_stale_descriptor(self, status):
+        """Checks if a failed submission was caused by a stale descriptor and
+            reopens the device if so.
+
+        Args:
+            status (int): Return value of the libnvme submit call.
+
+        Returns:
+            bool: True if the device was reopened and the command can be retried.
+        """
+        if status >= 0 or ctypes.get_errno() not in DeviceHandleCache.STALE_ERRNOS:
+            return False
+        logger.warning(f"-- -- Descriptor of {self.dev_name} is stale, reopening")
+        device_descriptor = device_handles.reopen(self.dev_name)
+        if device_descriptor < 0:
+            return False
+        self.device_descriptor = device_descriptor
+        return True
+
+    def reset(self):
+        """ Clears the state left by previously executed commands """
+        self.ret_status = 0
+        self.command = None
+        self.response = None
+
+    def close(self):
+        """Releases this object's use of the cached device descriptor. The
+            descriptor is closed if no other object uses the controller.
+        """
+        if getattr(self, "dev_name", None):
+            device_handles.unregister(self.dev_name)
+            device_handles.close_idle()
+
     def submit_list_ns_cmd(self):
         """Sends identify command with CNS=02 to retrieve active namespace list
 
@@ -254,14 +619,14 @@ class Libnvme():
             return status, error
 
         libnvme_submit_admin_passthru = self.libnvme.nvme_submit_admin_passthru
-        libnvme_submit_admin_passthru.argtypes = [
-            ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p]
-        libnvme_submit_admin_passthru.restype = ctypes.c_int32
         logger.debug("-- Structure passed to libnvme is at address ",
               hex(command.dptr.sgl.addr))
 
         status = libnvme_submit_admin_passthru(
             self.device_descriptor, ctypes.addressof(command), None)
+        if self.is_stale_descriptor(status):
+            status = libnvme_submit_admin_passthru(
+                self.device_descriptor, ctypes.addressof(command), None)
         if status == 0:
             ns_paths = []
             dev = self.dev_name if self.dev_name[-2] != 'n' else self.dev_name[:-2]
@@ -274,6 +639,15 @@ class Libnvme():
         else:
             return 1, "ERROR"
 
+    def run_async(self, function, nvme_cmd, verify_rsp):
+        """Runs the submission in a daemon thread, see SystemLib.run_in_thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the status code of the command.
+        """
+        return SystemLib.run_in_thread(function, nvme_cmd, verify_rsp, False,
+                                       name="nvme-libnvme")
+
     def submit_passthru(self, nvme_cmd, verify_rsp=False, async_run=False):
         """
         Submit a passthru command to the NVMe device.
@@ -283,11 +657,16 @@ class Libnvme():
                 will be utilised from "nvme_cmd.cmd" and the reponse is moved to memory
                 specified in "nvme_cmd.buff".
             verify_rsp: Flag indicating whether to verify the response. (TBD)
-            async_run: Flag indicating whether to run the command asynchronously. (TBD)
+            async_run: Flag indicating whether to run the command asynchronously.
+                If True, a Future resolving to the status code is returned.
+                See AsyncExecutor for awaitable, cancellable submissions.
 
         Returns:
             int: Status Code of the command execution.
         """
+        if async_run:
+            return self.run_async(self.submit_passthru, nvme_cmd, verify_rsp)
+
         command = nvme_cmd.cmd.generic_command
         logger.info("--" +
               f"libnvme submit passthru: OPC:{command.cdw0.OPC} NSID:{command.NSID} CDW10:{command.cdw10.raw} CDW11:{command.cdw11.raw}")
@@ -301,14 +680,13 @@ class Libnvme():
             nvme_cmd.cmd.generic_command.dptr.sgl.data_len = nvme_cmd.buff_size
             nvme_cmd.cmd.generic_command.dptr.sgl.addr = nvme_cmd.buff
 
-            # Prototype definitions
             libnvme_submit_admin_passthru = self.libnvme.nvme_submit_admin_passthru
-            libnvme_submit_admin_passthru.argtypes = [
-                ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p]
-            libnvme_submit_admin_passthru.restype = ctypes.c_int32
 
             self.ret_status = libnvme_submit_admin_passthru(
                 self.device_descriptor, ctypes.addressof(command), None)
+            if self.is_stale_descriptor(self.ret_status):
+                self.ret_status = libnvme_submit_admin_passthru(
+                    self.device_descriptor, ctypes.addressof(command), None)
             if self.ret_status != 0:
                 logger.warning("-- -- Command execution unsuccessful: ",
                       hex(self.ret_status))
@@ -316,20 +694,48 @@ class Libnvme():
         if command.cdw0.OPC == 0x7f:
             # Fabric Command
 
-            # Prototype definitions
             libnvme_submit_admin_passthru = self.libnvme.nvme_submit_admin_passthru64
-            libnvme_submit_admin_passthru.argtypes = [
-                ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p]
-            libnvme_submit_admin_passthru.restype = ctypes.c_int32
 
             self.ret_status = libnvme_submit_admin_passthru(
                 self.device_descriptor, ctypes.addressof(command), nvme_cmd.buff)
+            if self.is_stale_descriptor(self.ret_status):
+                self.ret_status = libnvme_submit_admin_passthru(
+                    self.device_descriptor, ctypes.addressof(command), nvme_cmd.buff)
             if self.ret_status != 0:
                 logger.info("-- -- Command execution unsuccessful: ",
                       hex(self.ret_status))
 
+        if self.identify_cache:
+            self.identify_cache.admin_completed(nvme_cmd, self.ret_status)
         return self.ret_status
 
+    def submit_batch(self, nvme_cmds, queue_depth=None, admin=False):
+        """
+        Submit a batch of admin passthru commands to the NVMe device, one after
+        the other. Every command reuses the descriptor of the device kept in
+        device_handles, the device is not opened per command.
+
+        Args:
+            nvme_cmds (List[NVMeCommand]): Commands to submit. Data is transferred
+                from/to the memory specified in each "nvme_cmd.buff".
+            admin (bool, optional): Submit as admin commands. libnvme has no I/O
+                passthru, an I/O batch (False) is not submitted. Defaults to False.
+
+        Returns:
+            List[int]: Status code of each command, negative errno if the command
+                could not be submitted (-EOPNOTSUPP for every command of an I/O
+                batch). The CQE of each command is filled.
+        """
+        if not admin:
+            logger.warning(f"-- -- libnvme has no I/O passthru, batch of {len(nvme_cmds)} "
+                           "I/O commands not submitted")
+            return [-errno.EOPNOTSUPP] * len(nvme_cmds)
+        statuses = []
+        for nvme_cmd in nvme_cmds:
+            statuses.append(self.submit_passthru(nvme_cmd))
+            self.get_response(nvme_cmd)
+        return statuses
+
     def submit_connect_cmd(self, transport, address, svcid, nqn, kato=None,
                            duplicate=False, hostnqn=None, hostid=None, nr_io_queues=None,
                            dhchap_host=None, dhchap_ctrl=None):
@@ -391,6 +797,10 @@ class Libnvme():
 
         got_name = str(self.libnvme.nvme_ctrl_get_name(c))[2:-1]
         self.connectedDeviceName = got_name
+        # A reconnect can reuse the name of a removed controller
+        device_handles.invalidate(got_name)
+        if self.identify_cache and got_name == getattr(self, "dev_name", None):
+            self.identify_cache.invalidate()
         logger.success(
             f"-- Successfully connected to {transport} {address} {svcid} {nqn}")
         logger.info("-- -- Device Name (self.connectedDeviceName):", got_name)
@@ -463,7 +873,11 @@ class Libnvme():
             return 1, "Disconnect failed, device not found"
         i = 0
         for c in ctrl:
+            got_name = str(self.libnvme.nvme_ctrl_get_name(c))[2:-1]
             self.ret_status = self.libnvme.nvme_disconnect_ctrl(c)
+            device_handles.invalidate(got_name)
+            if self.identify_cache and got_name == getattr(self, "dev_name", None):
+                self.identify_cache.invalidate()
             i += 1
         if self.ret_status == 0:
             logger.success((f"-- Disconnected {i} controller"+("" if i == 1 else "s")))
@@ -472,19 +886,20 @@ class Libnvme():
 
         return self.ret_status, "Disconnect failed" if self.ret_status != 0 else ""
 
-    def get_response(self, nvme_cmd):
-        """Fill the CQE structure (TBD)
+    def get_response(self, nvme_cmd, rsp=None):
+        """Fill the CQE structure from the status of the command
 
         Args:
             nvme_cmd: Command object to fill response in
+            rsp (int, optional): Manually provide the status, else takes the
+                previously executed command's status. Defaults to None.
 
         Returns:
             bool: Indicates success or failure
         """
-        response = nvme_cmd.rsp.response
-        response.sf.SC = self.ret_status
-        response.DNR = 0
-        response.sf.M = 0
-        response.sf.CRD = 0
-        response.sf.SCT = 0
-        response.sf.SC = 0
+        status = self.ret_status if rsp is None else rsp
+        if status < 0:
+            # libnvme failed with errno, command did not reach the controller
+            return False
+        encode_status(nvme_cmd.rsp.response, status)
+        return True
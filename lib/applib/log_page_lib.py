@@ -0,0 +1,310 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Log page library.
+
+Library that reads log pages of any size with Get Log Page commands split at
+the Maximum Data Transfer Size of the controller, each chunk addressed with
+the log page offset (LPO). The chunks are submitted as a batch through the
+application library, so they are pipelined by the applications able to keep
+several commands in flight (io_uring, nvme-cli), and are assembled
+in one preallocated buffer or streamed to a file for logs too large to keep
+in memory (telemetry).
+
+All chunks but the last one are read with Retain Asynchronous Event set, so
+an event is only cleared once the whole log page was read. For log pages with
+a generation counter (discovery, controller-initiated telemetry) the header
+is read before and after the data, and the log page read again if the
+generation changed in between.
+"""
+
+import ctypes
+import struct
+import sys
+sys.path.insert(1, "./")
+from src.macros import *
+from utils.logging_module import logger
+
+TELEMETRY_BLOCK_SIZE = 512
+# Last block of data areas 1-3 (u16) and of data area 4 (u32)
+TELEMETRY_LAST_BLOCKS = struct.Struct("<8xHHH2xI")
+TELEMETRY_GENERATION = struct.Struct("<382xB")
+DISCOVERY_HEADER = struct.Struct("<QQ")
+
+
+class LogPageChanged(Exception):
+    """ The generation of a log page kept changing while it was read """
+
+
+def discovery_size(header):
+    """ Size of the discovery log page: header and one entry per record """
+    return 1024 + DISCOVERY_HEADER.unpack_from(header)[1] * 1024
+
+
+def discovery_generation(header):
+    """ Generation counter and number of records of the discovery log page """
+    return DISCOVERY_HEADER.unpack_from(header)
+
+
+def telemetry_size(header, data_area=3):
+    """Size of a telemetry log page up to the end of a data area.
+
+    Args:
+        header: Telemetry log header (512 bytes).
+        data_area (int, optional): Last data area to read, 1 to 4.
+
+    Returns:
+        int: Size in bytes, header included.
+    """
+    last_blocks = TELEMETRY_LAST_BLOCKS.unpack_from(header)
+    return (max(last_blocks[:data_area]) + 1) * TELEMETRY_BLOCK_SIZE
+
+
+def telemetry_generation(header):
+    """ Telemetry Controller-Initiated Data Generation Number """
+    return TELEMETRY_GENERATION.unpack_from(header)[0]
+
+
+# Log pages whose size or generation is read from a header:
+# log identifier: (header size, size of the log page, generation of the data)
+LOG_PAGE_HEADERS = {
+    NVME_LOG_LID_TELEMETRY_HOST: (TELEMETRY_BLOCK_SIZE, telemetry_size, None),
+    NVME_LOG_LID_TELEMETRY_CTRL: (TELEMETRY_BLOCK_SIZE, telemetry_size, telemetry_generation),
+    NVME_LOG_LID_DISCOVER: (1024, discovery_size, discovery_generation),
+}
+
+
+class LogPageReader():
+    """
+    Reads log pages from a controller in chunks of at most the maximum data
+    transfer size.
+
+    Args:
+        controller (Controller): Controller the log pages are read from.
+        max_chunk (int, optional): Upper bound of the transfer size of one
+            command, on top of the MDTS of the controller.
+        queue_depth (int, optional): Maximum commands in flight.
+        retries (int, optional): Reads of a log page whose generation changed
+            before giving up.
+
+    Attributes:
+        commands (int): Number of Get Log Page commands submitted.
+    """
+
+    def __init__(self, controller, max_chunk=LOG_PAGE_MAX_CHUNK,
+                 queue_depth=LOG_PAGE_QUEUE_DEPTH, retries=LOG_PAGE_RETRIES) -> None:
+        """ Constructor """
+        self.controller = controller
+        self.max_chunk = max_chunk
+        self.queue_depth = queue_depth
+        self.retries = retries
+        self.chunk_size = None
+        self.offsets_supported = None
+        self.commands = 0
+
+    def get_chunk_size(self):
+        """Transfer size of one Get Log Page command: MDTS of the controller,
+            bounded by max_chunk. Read from the device on first use.
+
+        Returns:
+            int: Chunk size in bytes, a multiple of 4.
+        """
+        if self.chunk_size is None:
+            identify = self.controller.identify
+            chunk_size = min(self.controller.max_transfer_size or self.max_chunk, self.max_chunk)
+            # LPA bit 2: extended data for Get Log Page (NUMDU and LPO)
+            self.offsets_supported = bool(identify.LPA & 0x04)
+            self.chunk_size = chunk_size - chunk_size % 4
+            logger.info(f"-- Log pages read in chunks of {self.chunk_size} bytes")
+        return self.chunk_size
+
+    def chunks(self, length):
+        """Splits a log page in chunks.
+
+        Args:
+            length (int): Size of the log page in bytes.
+
+        Returns:
+            List[Tuple[int, int]]: Offset and length of each chunk.
+
+        Raises:
+            ValueError: If the log page does not fit in one command and the
+                controller does not support log page offsets.
+        """
+        chunk_size = self.get_chunk_size()
+        if length > chunk_size and not self.offsets_supported:
+            raise ValueError(f"Log page of {length} bytes exceeds MDTS ({chunk_size} bytes) "
+                             "and the controller does not support log page offsets")
+        return [(offset, min(chunk_size, length - offset))
+                for offset in range(0, length, chunk_size)]
+
+    def submit_chunks(self, log_id, chunks, address, nsid, lsp, lsi, rae):
+        """Reads chunks of a log page with one batch of commands.
+
+        Args:
+            log_id (int): Log page identifier.
+            chunks (List[Tuple[int, int]]): Offset and length of each chunk.
+            address (int): Address the first chunk is read to, the others follow it.
+            nsid, lsp, lsi (int): Namespace ID, log specific field and identifier.
+            rae (bool): Retain Asynchronous Event for the last chunk, it is
+                set for the others.
+
+        Returns:
+            int: Status Code of the first failed command, or 0.
+        """
+        nvme_cmds = []
+        base = chunks[0][0]
+        for index, (offset, length) in enumerate(chunks):
+            nvme_cmd = self.controller.cmdlib.get_get_log_cmd(
+                log_id, length, offset, nsid, lsp, rae or index < len(chunks) - 1, lsi)
+            nvme_cmd.buff = address + offset - base
+            nvme_cmds.append(nvme_cmd)
+
+        self.commands += len(nvme_cmds)
+        if len(nvme_cmds) == 1:
+            app = self.controller.app
+            submit = getattr(app, "submit_admin_passthru", None) or app.submit_passthru
+            statuses = [submit(nvme_cmds[0], verify_rsp=True, async_run=False)]
+        else:
+            statuses = self.controller.app.submit_batch(nvme_cmds, self.queue_depth, admin=True)
+        for (offset, _), status in zip(chunks, statuses):
+            if status != 0:
+                logger.error(f"-- Get Log Page {log_id:#x} at offset {offset} failed: {status}")
+                return status
+        return 0
+
+    def read_header(self, log_id, nsid, lsp, lsi, rae=True):
+        """ Header of a log page listed in LOG_PAGE_HEADERS, (status, bytes) """
+        header = (ctypes.c_ubyte * LOG_PAGE_HEADERS[log_id][0])()
+        status = self.submit_chunks(log_id, [(0, len(header))], ctypes.addressof(header),
+                                    nsid, lsp, lsi, rae)
+        return status, bytes(header)
+
+    def read(self, log_id, length=None, nsid=0xFFFFFFFF, lsp=0, lsi=0, rae=False, out=None,
+             path=None):
+        """Reads a log page.
+
+        Args:
+            log_id (int): Log page identifier.
+            length (int, optional): Bytes to read. Read from the header of the
+                log pages listed in LOG_PAGE_HEADERS if None.
+            nsid (int, optional): Namespace ID. Defaults to all namespaces.
+            lsp, lsi (int, optional): Log specific field and identifier.
+            rae (bool, optional): Retain Asynchronous Event.
+            out (optional): Writable buffer the log page is read into (ctypes
+                array, bytearray, ...), at least length bytes.
+            path (str, optional): File the log page is streamed to, in windows
+                of queue_depth chunks, instead of a buffer.
+
+        Returns:
+            Tuple[int, Any]: Status Code of the failed command or 0, and the log
+                page: the buffer (out or a ctypes array of length bytes), or path.
+                None on failure.
+
+        Raises:
+            ValueError: If the log page does not fit in out, or is larger than
+                LOG_PAGE_MAX_BUFFER without a path.
+            LogPageChanged: If the generation changed on each of the reads.
+        """
+        header_size, size, generation = LOG_PAGE_HEADERS.get(log_id, (0, None, None))
+        for _ in range(self.retries):
+            before = None
+            if header_size and (length is None or generation):
+                status, header = self.read_header(log_id, nsid, lsp, lsi)
+                if status != 0:
+                    return status, None
+                before = generation(header) if generation else None
+                total = size(header) if length is None else length
+            elif length is None:
+                raise ValueError(f"Length of log page {log_id:#x} is required")
+            else:
+                total = length
+            total += -total % 4
+            # The event is cleared by the last command, the header read again if any
+            data_rae = rae if before is None else True
+
+            if path is not None:
+                status = self.read_to_file(log_id, total, path, nsid, lsp, lsi, data_rae)
+                data = path
+            else:
+                data = self.get_buffer(out, total)
+                status = self.submit_chunks(log_id, self.chunks(total), self.address(data),
+                                            nsid, lsp, lsi, data_rae)
+            if status != 0:
+                return status, None
+            if before is None:
+                return 0, data
+
+            status, header = self.read_header(log_id, nsid, lsp, lsi, rae)
+            if status != 0:
+                return status, None
+            if generation(header) == before:
+                return 0, data
+            logger.info(f"-- Log page {log_id:#x} changed while read ({before}), reading again")
+        raise LogPageChanged(f"Log page {log_id:#x} changed on each of {self.retries} reads")
+
+    @staticmethod
+    def get_buffer(out, length):
+        """ Buffer for a log page of length bytes: out, or a new ctypes array """
+        if out is None:
+            if length > LOG_PAGE_MAX_BUFFER:
+                raise ValueError(f"Log page of {length} bytes is larger than "
+                                 f"{LOG_PAGE_MAX_BUFFER} bytes, stream it to a file")
+            return (ctypes.c_ubyte * length)()
+        if len(memoryview(out).cast("B")) < length:
+            raise ValueError(f"Buffer of {len(memoryview(out).cast('B'))} bytes is "
+                             f"too small for a log page of {length} bytes")
+        return out
+
+    @staticmethod
+    def address(buffer):
+        """ Address of a writable buffer """
+        if isinstance(buffer, ctypes.Array):
+            return ctypes.addressof(buffer)
+        return ctypes.addressof(ctypes.c_char.from_buffer(buffer))
+
+    def read_to_file(self, log_id, length, path, nsid, lsp, lsi, rae):
+        """Reads a log page to a file, queue_depth chunks at a time through one
+            buffer.
+
+        Returns:
+            int: Status Code of the first failed command, or 0.
+        """
+        chunks = self.chunks(length)
+        window = self.queue_depth
+        buffer = (ctypes.c_ubyte * (self.get_chunk_size() * window))()
+        view = memoryview(buffer).cast("B")
+        with open(path, "wb") as log:
+            for start in range(0, len(chunks), window):
+                part = chunks[start:start + window]
+                last = start + window >= len(chunks)
+                status = self.submit_chunks(log_id, part, ctypes.addressof(buffer), nsid, lsp,
+                                            lsi, rae if last else True)
+                if status != 0:
+                    return status
+                log.write(view[:part[-1][0] + part[-1][1] - part[0][0]])
+        return 0
+
+    def read_telemetry(self, controller_initiated=False, data_area=3, create=False, out=None,
+                       path=None):
+        """Reads a telemetry log page up to the end of a data area.
+
+        Args:
+            controller_initiated (bool, optional): Read the Telemetry Controller-Initiated
+                log page instead of the Host-Initiated one.
+            data_area (int, optional): Last data area to read, 1 to 4.
+            create (bool, optional): Create new Host-Initiated telemetry data.
+            out, path (optional): See read().
+
+        Returns:
+            Tuple[int, Any]: See read().
+        """
+        if controller_initiated:
+            log_id, lsp = NVME_LOG_LID_TELEMETRY_CTRL, 0
+        else:
+            log_id, lsp = NVME_LOG_LID_TELEMETRY_HOST, int(create)
+        status, header = self.read_header(log_id, 0xFFFFFFFF, lsp, 0)
+        if status != 0:
+            return status, None
+        return self.read(log_id, telemetry_size(header, data_area), out=out, path=path)
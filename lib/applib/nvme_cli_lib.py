@@ -10,19 +10,28 @@ This library is designed to be used in the framework that requires interaction
 with NVMe devices, and it abstracts the complexities of dealing with the cli
 commands and responses.
 """
+import concurrent.futures
+import contextlib
 import ctypes
+import errno
+import shutil
 import sys
+import tempfile
 sys.path.insert(1, './')
-import subprocess
 from src.macros import *
 from utils.logging_module import logger
 from lib.structlib.nvme_struct_main_lib import NVMeCmdStruct
+from lib.structlib.struct_codec_lib import encode_status
+from lib.syslib.system_lib import SystemLib
 import re
 import os
 
 
 class NVMeCLILib():
 
+    # Submits I/O commands (submit_io_passthru, submit_batch with admin=False)
+    io_passthru = True
+
     def __init__(self, dev_path=None) -> None:
         """Initialize attributes for the CLI Library
 
@@ -40,6 +49,29 @@ class NVMeCLILib():
         self.err_code = 0
         self.nvme_list = []
         self.subsys_list = []
+        self.stdout = b""
+        self.stderr = b""
+        self.ret_code = 0
+        self.last_result = None
+        self.identify_cache = None
+
+    def reset(self):
+        """ Clears the state left by previously executed commands """
+        self.err_code = 0
+        self.stdout = b""
+        self.stderr = b""
+        self.ret_code = 0
+        self.last_result = None
+
+    def device_changed(self, dev_path=None):
+        """Drops the cached identify data if the device was (re)connected or
+            disconnected.
+
+        Args:
+            dev_path (str, optional): The device which changed. None if unknown.
+        """
+        if self.identify_cache and (dev_path is None or dev_path == self.dev_path):
+            self.identify_cache.invalidate()
 
     @staticmethod
     def mapping(value, start, end):
@@ -56,34 +88,70 @@ class NVMeCLILib():
         mask = (1 << end - start) - 1
         return (value >> start) & mask
 
-    def execute_cmd(self, command, async_run=False):
+    def run_cmd(self, argv, timeout=None, input=None, pass_fds=(), output=None):
+        """
+        Executes the command without a shell. The result is also kept as the
+        result of the last command, for get_response() and get_passthru_result().
+
+        Args:
+            argv (List[str]): Command and its arguments.
+            timeout (float, optional): Seconds after which the command is killed.
+            input (bytes, optional): Data written to the command's stdin.
+            pass_fds (Tuple[int], optional): Descriptors to keep open in the child.
+            output (optional): Buffer the standard output is read into, instead
+                of being captured in the result.
+
+        Returns:
+            CommandResult: Return code, output and timing of the command.
+        """
+        logger.info("-- Executing Command: {}", argv)
+        if output is not None:
+            result = SystemLib.run_into(argv, output, timeout=timeout, pass_fds=pass_fds)
+        else:
+            result = SystemLib.run(argv, timeout=timeout, input=input, pass_fds=pass_fds)
+        SystemLib.log_result(result)
+
+        self.last_result = result
+        self.stdout, self.stderr, self.ret_code = result.stdout, result.stderr, result.ret_code
+        return result
+
+    def execute_cmd(self, command, async_run=False, timeout=None):
         """
         Executes the given command and captures the stdout, stderr, and return code.
+        Commands given as a list are executed without a shell. Commands given as
+        a string are executed through the shell.
 
         Args:
-            command (str): The command to be executed.
+            command (List[str] | str): The command to be executed.
             async_run (bool, optional): If True, the command will be executed
                 asynchronously. Defaults to False.
+            timeout (float, optional): Seconds after which the command is killed.
 
         Returns:
-            int: 0 if the command execution is successful, 1 otherwise.
+            int: 0 if the command execution is successful, return code otherwise.
         """
-        logger.info("-- Executing Command: {}", command)
-        process = subprocess.Popen(
-                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+        argv = ["/bin/sh", "-c", command] if isinstance(command, str) else command
 
-        if not async_run:   
+        if async_run:
+            logger.info("-- Executing Command: {}", argv)
+            return SystemLib.spawn(argv)
 
-            self.stdout, self.stderr = process.communicate()
-            self.ret_code = process.returncode
+        return self.run_cmd(argv, timeout=timeout).status
 
-            if len(self.stderr) != 0 and self.ret_code != 0:
-                logger.warning(f"-- -- Command execution failed: {self.stderr[:self.stderr.find(b'\n')]}")
-                return self.ret_code
-            logger.success("-- -- Command execution success")
-            return 0
-        
-        return process
+    @staticmethod
+    def get_cmd_timeout(nvme_cmd):
+        """Computes the process timeout for a passthru command.
+
+        Args:
+            nvme_cmd: Command object, "nvme_cmd.timeout_ms" is used if set.
+
+        Returns:
+            float: Timeout in seconds, None if the command has no timeout.
+        """
+        if not nvme_cmd.timeout_ms:
+            return None
+        # Leave the driver time to time out the command first
+        return nvme_cmd.timeout_ms / 1000 + CLI_TIMEOUT_MARGIN
 
     def get_app_version(self):
         """Retrieves the version of the nvme-cli installation
@@ -91,24 +159,22 @@ class NVMeCLILib():
         Returns:
             str: nvme-cli version
         """
-        cmd = 'nvme version'
-        self.execute_cmd(cmd)
-        version = str(self.stdout)
-        version = version.split(" ")
+        result = self.run_cmd(["nvme", "version"])
+        version = result.stdout.decode().split(" ")
         return version[2].strip("\n")
 
     def get_driver_version(self):
-        """Retrieves version of the NVMe Driver
+        """Retrieves version of the NVMe Driver. In-tree modules have no version
+            of their own, the kernel release is reported for them.
 
         Returns:
             str: driver version
         """
-        cmd = ['modinfo nvme | grep -i version']
-        self.execute_cmd(cmd)
-
-        version = str(self.stdout.decode().split("\n")[0])
-        version = version.split(":")
-        return "NVMe" + str(version[1])
+        result = self.run_cmd(["modinfo", "-F", "version", "nvme"])
+        version = result.stdout.decode().split("\n")[0].strip()
+        if result.ret_code == 127:
+            logger.warning("-- modinfo not found, reporting the kernel release")
+        return "NVMe " + (version or os.uname().release)
 
     def get_app_path(self):
         """Retrieves the path of the nvme-cli installation
@@ -116,10 +182,7 @@ class NVMeCLILib():
         Returns:
             str: path
         """
-        cmd = ['which nvme']
-        self.execute_cmd(cmd)
-
-        return self.stdout.decode()
+        return shutil.which("nvme") or ""
 
     def get_response(self, nvme_cmd, rsp=None):
         """Parse the response and fill the CQE structure
@@ -132,24 +195,30 @@ class NVMeCLILib():
         Returns:
             bool: Indicates success or failure
         """
-        # nvme_cmd.rsp.response = nvme_cmd.rsp.response
+        return NVMeCLILib.parse_response(
+            nvme_cmd, self.ret_code, rsp if rsp else self.stderr)
+
+    @staticmethod
+    def parse_response(nvme_cmd, ret_code, stderr):
+        """Parse the nvme-cli error output and fill the CQE structure
+
+        Args:
+            nvme_cmd: Command object to fill response in
+            ret_code (int): Return code of nvme-cli.
+            stderr (bytes): Error output of nvme-cli.
+
+        Returns:
+            bool: Indicates success or failure
+        """
         try:
-            if self.ret_code != 0:
+            if ret_code != 0:
                 completion_val = list(
-                    bytes(rsp if rsp else self.stderr).decode('ascii').split(":"))
+                    bytes(stderr).decode('ascii').split(":"))
                 val = re.findall(r'\((.*?)\)', completion_val[-1])
                 src = int(val[0], 16)
-                nvme_cmd.rsp.response.sf.DNR = NVMeCLILib.mapping(src, 14, 15)
-                nvme_cmd.rsp.response.sf.M = NVMeCLILib.mapping(src, 13, 14)
-                nvme_cmd.rsp.response.sf.CRD = NVMeCLILib.mapping(src, 11, 13)
-                nvme_cmd.rsp.response.sf.SCT = NVMeCLILib.mapping(src, 8, 11)
-                nvme_cmd.rsp.response.sf.SC = NVMeCLILib.mapping(src, 0, 8)
+                encode_status(nvme_cmd.rsp.response, src)
             else:
-                nvme_cmd.rsp.response.sf.DNR = 0
-                nvme_cmd.rsp.response.sf.M = 0
-                nvme_cmd.rsp.response.sf.CRD = 0
-                nvme_cmd.rsp.response.sf.SCT = 0
-                nvme_cmd.rsp.response.sf.SC = 0
+                encode_status(nvme_cmd.rsp.response, 0)
         except Exception as e:
             logger.exception(e)
         return True
@@ -185,18 +254,14 @@ class NVMeCLILib():
                 admin passthru command.
 
         Returns:
-            The formatted command string for executing the admin passthru command.
+            List[str]: The argv for executing the admin passthru command.
         """
-        opcode = command.cdw0.OPC
-        nsid = command.NSID
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} admin-passthru {self.dev_path} --opcode={opcode} -n {nsid}"
-        cmd = f"{cmd} --cdw2={command.cdw2.raw} --cdw3={command.cdw3.raw}"
-        cmd = f"{cmd} --cdw10={command.cdw10.raw} --cdw11={command.cdw11.raw}"
-        cmd = f"{cmd} --cdw12={command.cdw12.raw} --cdw13={command.cdw13.raw}"
-        cmd = f"{cmd} --cdw14={command.cdw14.raw} --cdw15={command.cdw15.raw}"
-
-        return cmd
+        return ["nvme", "admin-passthru", self.dev_path,
+                f"--opcode={command.cdw0.OPC}", "-n", str(command.NSID),
+                f"--cdw2={command.cdw2.raw}", f"--cdw3={command.cdw3.raw}",
+                f"--cdw10={command.cdw10.raw}", f"--cdw11={command.cdw11.raw}",
+                f"--cdw12={command.cdw12.raw}", f"--cdw13={command.cdw13.raw}",
+                f"--cdw14={command.cdw14.raw}", f"--cdw15={command.cdw15.raw}"]
 
     def prepare_io_passthru_cmd(self, command: NVMeCmdStruct):
         """
@@ -207,20 +272,16 @@ class NVMeCLILib():
                 io passthru command.
 
         Returns:
-            The formatted command string for executing the io passthru command.
-        """
-        opcode = command.cdw0.OPC
-        nsid = command.NSID
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} io-passthru {self.dev_path} --opcode={opcode} --namespace-id={nsid}"
-        cmd = f"{cmd} --cdw2={command.cdw2.raw} --cdw3={command.cdw3.raw}"
-        cmd = f"{cmd} --cdw10={command.cdw10.raw} --cdw11={command.cdw11.raw}"
-        cmd = f"{cmd} --cdw12={command.cdw12.raw} --cdw13={command.cdw13.raw}"
-        cmd = f"{cmd} --cdw14={command.cdw14.raw} --cdw15={command.cdw15.raw}"
-
-        return cmd
+            List[str]: The argv for executing the io passthru command.
+        """
+        return ["nvme", "io-passthru", self.dev_path,
+                f"--opcode={command.cdw0.OPC}", f"--namespace-id={command.NSID}",
+                f"--cdw2={command.cdw2.raw}", f"--cdw3={command.cdw3.raw}",
+                f"--cdw10={command.cdw10.raw}", f"--cdw11={command.cdw11.raw}",
+                f"--cdw12={command.cdw12.raw}", f"--cdw13={command.cdw13.raw}",
+                f"--cdw14={command.cdw14.raw}", f"--cdw15={command.cdw15.raw}"]
     
-    def submit_discover_cmd(self, transport, address, svcid, hostnqn=None):
+    def submit_discover_cmd(self, transport, address, svcid, hostnqn=None, raw=False):
         """
         Submit a discover command to the NVMe device.
 
@@ -228,23 +289,27 @@ class NVMeCLILib():
             transport: The transport type.
             address: The address of the NVMe device.
             svcid: The service ID of the NVMe device.
+            raw (bool, optional): Return the binary discovery log page instead of
+                the text output, for decoding with discovery_log_lib.DiscoveryLog.
 
         Returns:
-            Tuple[int, bytes]: A tuple containing the status code and the stdout or stderr.
+            Tuple[int, bytes]: A tuple containing the status code and the stdout
+                (or log page) or stderr.
         """
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} discover"
-        cmd = f"{cmd} -t {transport}"
-        cmd = f"{cmd} -a {address}"
-        cmd = f"{cmd} -s {svcid}"
-
+        argv = ["nvme", "discover", "-t", transport, "-a", address, "-s", svcid]
         if hostnqn:
-            cmd = f"{cmd} -q {hostnqn}"
-        status = self.execute_cmd(cmd)
-        if status == 0:
-            return 0, self.stdout
-        else:
-            return status, self.stderr
+            argv += ["-q", hostnqn]
+        if not raw:
+            result = self.run_cmd(argv)
+            return (0, result.stdout) if result.status == 0 else (result.status, result.stderr)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "discovery.log")
+            result = self.run_cmd(argv + [f"--raw={path}"])
+            if result.status != 0:
+                return result.status, result.stderr
+            with open(path, "rb") as log:
+                return 0, log.read()
 
     def submit_list_subsys_cmd(self):
         """
@@ -258,14 +323,35 @@ class NVMeCLILib():
             Tuple[int, bytes]: A tuple containing the status code and the stdout or stderr.
 
         """
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} list-subsys -o json"
-        status = self.execute_cmd(cmd)
-        if status == 0:
-            return status, self.stdout
+        result = self.run_cmd(["nvme", "list-subsys", "-o", "json"])
+        if result.status == 0:
+            return 0, result.stdout
         else:
-            return status, self.stderr
+            return result.status, result.stderr
         
+    def get_cached_lba_size(self, dev):
+        """
+        Computes the block size from the cached Identify Namespace data, if the
+        device is a namespace (or the controller) of this object's controller.
+
+        Args:
+            dev (str): Device path whose block size is to be computed.
+
+        Returns:
+            int: The block size. None if not available from the cache.
+        """
+        if not self.identify_cache or not self.dev_path:
+            return None
+        ctrl = re.sub(r"n[0-9]+\Z", "", self.dev_path)
+        match = re.match(re.escape(ctrl) + r"(?:n([0-9]+))?\Z", dev)
+        if not match:
+            return None
+        try:
+            return self.identify_cache.get_namespace(int(match.group(1) or 1)).lba_size
+        except Exception as e:
+            logger.warning(f"-- Identify Namespace failed: {e}")
+            return None
+
     def get_device_lba_size(self, dev=None):
         """
         Submits an id-ns command to retrieve to calculate the block size. 
@@ -280,16 +366,18 @@ class NVMeCLILib():
         if not dev:
             dev = self.dev_path
 
+        lba_size = self.get_cached_lba_size(dev)
+        if lba_size:
+            return lba_size
+
         if not re.match(r"/dev/nvme[0-9]+n[0-9]+", dev):
             dev = dev + 'n1'
 
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} id-ns {dev}"
-        status = self.execute_cmd(cmd)
-        if status != 0:
+        result = self.run_cmd(["nvme", "id-ns", dev])
+        if result.status != 0:
             return -1
         else:
-            res = self.stdout.decode()
+            res = result.stdout.decode()
             l = res.find("lbads")
             r = res.find("rp:")
             res = res[l+6:r-1].strip()            
@@ -309,143 +397,239 @@ class NVMeCLILib():
                 absolute namespace paths.
             - If execution fails, tuple contains status code and stderr.
         """
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} list-ns"
-        cmd = f"{cmd} {self.dev_path}"
-        status = self.execute_cmd(cmd)
-        if status == 0:
+        result = self.run_cmd(["nvme", "list-ns", self.dev_path])
+        if result.status == 0:
             ns_paths = []
-            lines = self.stdout.decode().splitlines()
+            lines = result.stdout.decode().splitlines()
             for i in range(len(lines)):
                 ns_paths.append(self.dev_path+'n' +
                                 chr(ord(lines[i][lines[i].find(']')-1])+1))
-            return status, ns_paths
+            return 0, ns_paths
         else:
-            return status, self.stderr
+            return result.status, result.stderr
 
-    def submit_admin_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+    @staticmethod
+    @contextlib.contextmanager
+    def write_payload(nvme_cmd, admin=True):
         """
-        Submit admin passthru command to the NVMe device.
+        Stages the data of a write command in an anonymous memory file, which
+        nvme-cli reads through /proc/self/fd. Nothing is written to disk and
+        concurrent writes do not share any file.
 
         Args:
-            nvme_cmd: The NVMe command object to be submitted. The "NVMeCmdStruct" 
-                will be utilised from "nvme_cmd.cmd" and the reponse is moved to memory
-                specified in "nvme_cmd.buff".
-            verify_rsp: Flag indicating whether to verify the response. (TBD)
-            async_run: Flag indicating whether to run the command asynchronously. (TBD)
+            nvme_cmd: The NVMe command object to be submitted.
+            admin (bool, optional): Admin (or Fabric) command if True, else io command.
 
-        Returns:
-            int: Status Code of the command execution.
+        Yields:
+            Tuple[int]: Descriptor of the memory file to pass to nvme-cli,
+                empty for commands without data to write.
         """
-        command = nvme_cmd.cmd.generic_command
-        response = nvme_cmd.rsp.response
-        data_len = nvme_cmd.buff_size
+        if admin or nvme_cmd.cmd.generic_command.cdw0.OPC != 0x01:
+            yield ()
+            return
 
-        if 0 <= command.cdw0.OPC <= 0x0D:
-            # Admin Command
-            cmd = self.prepare_admin_passthru_cmd(command)
-            cmd = f"{cmd} --data-len={data_len} -r -b"
-            ret_status = self.execute_cmd(cmd, async_run=async_run)
+        fd = os.memfd_create("nvme-write", os.MFD_CLOEXEC)
+        try:
+            data = memoryview((ctypes.c_char * nvme_cmd.buff_size).from_address(nvme_cmd.buff))
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            yield (fd,)
+        finally:
+            os.close(fd)
 
-            if async_run:
-                return ret_status
-            
-            if ret_status != 0:
-                logger.warning("Command execution unsuccessful: ", ret_status)
-                return ret_status
+    @staticmethod
+    def read_buffer(nvme_cmd, admin=True):
+        """
+        Returns the memory nvme-cli's binary output is read into, for commands
+        which transfer data from the controller.
 
-            if verify_rsp:
-                # self.validate_response()
-                # raise Exception("Response invalid")
-                pass
+        Args:
+            nvme_cmd: The NVMe command object to be submitted.
+            admin (bool, optional): Admin (or Fabric) command if True, else io command.
 
-            if not response:
-                logger.warning("Empty response ")
-                return ret_status
+        Returns:
+            memoryview: View of "nvme_cmd.buff", None if no data is read.
+        """
+        opcode = nvme_cmd.cmd.generic_command.cdw0.OPC
+        if (admin and opcode == 0x7f) or (not admin and opcode == 0x01):
+            return None
+        if not nvme_cmd.buff or not nvme_cmd.buff_size:
+            return None
+        return memoryview((ctypes.c_char * nvme_cmd.buff_size).from_address(nvme_cmd.buff))
+
+    def build_passthru_argv(self, nvme_cmd, admin=True, pass_fds=()):
+        """
+        Builds the nvme-cli argv for a passthru command.
 
-            if data_len != 0:
-                ctypes.memmove(nvme_cmd.buff, self.stdout, data_len)
+        Args:
+            nvme_cmd: The NVMe command object to be submitted.
+            admin (bool, optional): Admin (or Fabric) command if True, else io command.
+            pass_fds (Tuple[int], optional): Descriptor from write_payload() with
+                the data to be written.
 
-            return 0
+        Returns:
+            List[str]: The argv for executing the passthru command.
+        """
+        command = nvme_cmd.cmd.generic_command
+        data_len = nvme_cmd.buff_size
 
-        if command.cdw0.OPC == 0x7f:
+        if admin:
+            argv = self.prepare_admin_passthru_cmd(command)
+        else:
+            argv = self.prepare_io_passthru_cmd(command)
+        if nvme_cmd.timeout_ms:
+            argv.append(f"--timeout={nvme_cmd.timeout_ms}")
+
+        if admin and command.cdw0.OPC == 0x7f:
             # Fabric Command
-            cmd = self.prepare_admin_passthru_cmd(command)
-            cmd = f"{cmd} -r"
-            ret_status = self.execute_cmd(cmd, async_run=async_run)
+            argv.append("-r")
+        elif not admin and command.cdw0.OPC == 0x01:
+            # Write Command, nvme-cli reads the data from the passed descriptor
+            argv += [f"--data-len={data_len}", f"--input-file=/proc/self/fd/{pass_fds[0]}", "-w"]
+        else:
+            argv += [f"--data-len={data_len}", "-r", "-b"]
+        return argv
 
-            if ret_status != 0:
-                logger.warning("Command execution unsuccessful: ", ret_status)
-                return ret_status
+    def complete_passthru(self, nvme_cmd, result, admin=True):
+        """
+        Moves the data returned by nvme-cli for a passthru command to the
+        memory specified in "nvme_cmd.buff".
 
-            if verify_rsp:
-                # self.validate_response()
-                # raise Exception("Response invalid")
-                pass
+        Args:
+            nvme_cmd: The NVMe command object which was submitted.
+            result (CommandResult): Result of the nvme-cli execution.
+            admin (bool, optional): Admin (or Fabric) command if True, else io command.
 
-            if not response:
-                logger.warning("Empty response ")
-                return ret_status
+        Returns:
+            int: Status Code of the command execution.
+        """
+        command = nvme_cmd.cmd.generic_command
+        data_len = nvme_cmd.buff_size
+
+        ret_status = result.status
+        if ret_status != 0:
+            logger.warning("Command execution unsuccessful: ", ret_status)
+            return ret_status
+
+        if not nvme_cmd.rsp.response:
+            logger.warning("Empty response ")
+            return ret_status
 
+        if admin and command.cdw0.OPC == 0x7f:
             if command.NSID == 0x04:
                 # Parse Property Get response
-                value = int(str(self.stderr[-9:-1])[2:-1], 16)
+                value = int(str(result.stderr[-9:-1])[2:-1], 16)
                 ctypes.memmove(nvme_cmd.buff, value.to_bytes(8, 'little'), 8)
+        elif (admin or command.cdw0.OPC != 0x01) and data_len != 0:
+            if result.received is None:
+                ctypes.memmove(nvme_cmd.buff, result.stdout, data_len)
+            elif result.received != data_len:
+                # Data was read directly into the buffer
+                logger.warning(f"Received {result.received} bytes of data, expected {data_len}")
+                return -errno.EIO
+
+        # Command specific result (CQE DW0), e.g. "NVMe command result:00000000"
+        match = re.search(rb"result:\s*(?:0x)?([0-9a-fA-F]+)", result.stderr)
+        if match:
+            nvme_cmd.rsp.response.command_specific.CommandSpecific64 = int(match.group(1), 16)
+
+        if admin and self.identify_cache:
+            self.identify_cache.admin_completed(nvme_cmd, 0)
 
-            return 0
-        
-    def submit_io_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        return 0
+
+    def run_async(self, function, nvme_cmd, verify_rsp):
+        """Runs the submission in a daemon thread, see SystemLib.run_in_thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the status code of the command.
         """
-        Submit io passthru command to the NVMe device.
+        return SystemLib.run_in_thread(function, nvme_cmd, verify_rsp, False)
+
+    def submit_admin_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """
+        Submit admin passthru command to the NVMe device.
 
         Args:
             nvme_cmd: The NVMe command object to be submitted. The "NVMeCmdStruct" 
                 will be utilised from "nvme_cmd.cmd" and the reponse is moved to memory
                 specified in "nvme_cmd.buff".
             verify_rsp: Flag indicating whether to verify the response. (TBD)
-            async_run: Flag indicating whether to run the command asynchronously. (TBD)
+            async_run: Flag indicating whether to run the command asynchronously.
+                If True, a Future resolving to the status code is returned.
+                See AsyncExecutor for awaitable, cancellable submissions.
 
         Returns:
             int: Status Code of the command execution.
         """
-        command = nvme_cmd.cmd.generic_command
-        response = nvme_cmd.rsp.response
-        data_len = nvme_cmd.buff_size
+        if async_run:
+            return self.run_async(self.submit_admin_passthru, nvme_cmd, verify_rsp)
 
-        if command.cdw0.OPC == 0x01:    
-            os.mkdir(TEMP_DIR) if not os.path.exists(TEMP_DIR) else None
-            input_file = f'{TEMP_DIR}/write_001.txt'
-            
-            with open(input_file, 'wb') as f:
-                f.write(ctypes.string_at(nvme_cmd.buff, nvme_cmd.buff_size))
+        argv = self.build_passthru_argv(nvme_cmd, admin=True)
+        result = self.run_cmd(argv, timeout=NVMeCLILib.get_cmd_timeout(nvme_cmd),
+                              output=NVMeCLILib.read_buffer(nvme_cmd, admin=True))
+        return self.complete_passthru(nvme_cmd, result, admin=True)
 
-            cmd = self.prepare_io_passthru_cmd(command)
-            cmd = f"{cmd} --data-len={data_len} --input-file={input_file} -w"
-            ret_status = self.execute_cmd(cmd, async_run=async_run)
-        
-        else:
-            cmd = self.prepare_io_passthru_cmd(command)
-            cmd = f"{cmd} --data-len={data_len} -r -b"
-            ret_status = self.execute_cmd(cmd, async_run=async_run)
-            
-            if data_len != 0:
-                ctypes.memmove(nvme_cmd.buff, self.stdout, data_len)
+    def submit_batch(self, nvme_cmds, queue_depth=None, admin=False):
+        """
+        Submit a batch of passthru commands to the NVMe device. The nvme-cli
+        processes of up to "queue_depth" commands run in parallel.
 
+        Args:
+            nvme_cmds (List[NVMeCommand]): Commands to submit. Data is transferred
+                from/to the memory specified in each "nvme_cmd.buff".
+            queue_depth (int, optional): Maximum commands in flight.
+                Defaults to CLI_BATCH_WORKERS.
+            admin (bool, optional): Submit as admin commands. Defaults to False.
 
-        if ret_status != 0:
-            logger.warning("Command execution unsuccessful: ", ret_status)
-            return ret_status
+        Returns:
+            List[int]: Status code of each command. The CQE of each command is filled.
+        """
+        queue_depth = min(queue_depth or CLI_BATCH_WORKERS, len(nvme_cmds)) or 1
+        logger.info(f"-- Executing batch of {len(nvme_cmds)} commands, {queue_depth} in parallel")
+
+        def run(nvme_cmd):
+            timeout = NVMeCLILib.get_cmd_timeout(nvme_cmd)
+            output = NVMeCLILib.read_buffer(nvme_cmd, admin)
+            with NVMeCLILib.write_payload(nvme_cmd, admin) as pass_fds:
+                argv = self.build_passthru_argv(nvme_cmd, admin, pass_fds)
+                if output is not None:
+                    result = SystemLib.run_into(argv, output, timeout=timeout)
+                else:
+                    result = SystemLib.run(argv, timeout=timeout, pass_fds=pass_fds)
+            NVMeCLILib.parse_response(nvme_cmd, result.ret_code, result.stderr)
+            return self.complete_passthru(nvme_cmd, result, admin)
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=queue_depth, thread_name_prefix="nvme-batch") as workers:
+            return list(workers.map(run, nvme_cmds))
+
+    def submit_io_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """
+        Submit io passthru command to the NVMe device.
 
-        if verify_rsp:
-            # self.validate_response()
-            # raise Exception("Response invalid")
-            pass
+        Args:
+            nvme_cmd: The NVMe command object to be submitted. The "NVMeCmdStruct" 
+                will be utilised from "nvme_cmd.cmd" and the reponse is moved to memory
+                specified in "nvme_cmd.buff".
+            verify_rsp: Flag indicating whether to verify the response. (TBD)
+            async_run: Flag indicating whether to run the command asynchronously.
+                If True, a Future resolving to the status code is returned.
+                See AsyncExecutor for awaitable, cancellable submissions.
 
-        if not response:
-            logger.warning("Empty response ")
-            return ret_status
-        
-        return 0
+        Returns:
+            int: Status Code of the command execution.
+        """
+        if async_run:
+            return self.run_async(self.submit_io_passthru, nvme_cmd, verify_rsp)
+
+        with NVMeCLILib.write_payload(nvme_cmd, admin=False) as pass_fds:
+            argv = self.build_passthru_argv(nvme_cmd, admin=False, pass_fds=pass_fds)
+            result = self.run_cmd(argv, timeout=NVMeCLILib.get_cmd_timeout(nvme_cmd),
+                                  pass_fds=pass_fds,
+                                  output=NVMeCLILib.read_buffer(nvme_cmd, admin=False))
+        return self.complete_passthru(nvme_cmd, result, admin=False)
 
     def submit_connect_cmd(self, transport, address, svcid, nqn, kato=None,
                            duplicate=False, hostnqn=None, hostid=None, nr_io_queues=None,
@@ -468,39 +652,37 @@ class NVMeCLILib():
         Returns:
             Tuple[int, bytes]: A tuple containing the status code and the stdout or stderr.
         """
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} connect"
-        cmd = f"{cmd} -t {transport}"
-        cmd = f"{cmd} -a {address}"
-        cmd = f"{cmd} -s {svcid}"
-        cmd = f"{cmd} -n {nqn}"
+        argv = ["nvme", "connect", "-t", transport, "-a", address, "-s", svcid, "-n", nqn]
         if kato != None:
-            cmd = f"{cmd} -k {kato}"
+            argv += ["-k", str(kato)]
         if hostnqn != None:
-            cmd = f"{cmd} -q {hostnqn}"
+            argv += ["-q", hostnqn]
         if hostid != None:
-            cmd = f"{cmd} -I {hostid}"
+            argv += ["-I", hostid]
         if nr_io_queues != None:
-            cmd = f"{cmd} -i {nr_io_queues}"
+            argv += ["-i", str(nr_io_queues)]
         if dhchap_host:
-            cmd = f"{cmd} -S {dhchap_host}"
+            argv += ["-S", dhchap_host]
         if dhchap_ctrl:
-            cmd = f"{cmd} -C {dhchap_ctrl}"
+            argv += ["-C", dhchap_ctrl]
         if duplicate:
-            cmd = f"{cmd} -D"
+            argv.append("-D")
 
-        status = self.execute_cmd(cmd)
+        result = self.run_cmd(argv)
+        status = result.status
 
-        alreadyConnected = self.stderr.decode().strip().endswith(
+        alreadyConnected = result.stderr.decode().strip().endswith(
             "Operation already in progress")
 
         if status == 0:
-            ind = self.stdout.decode().find(':')
-            return 0, "/dev/"+self.stdout[ind+2:-1].decode()
+            ind = result.stdout.decode().find(':')
+            dev_path = "/dev/"+result.stdout[ind+2:-1].decode()
+            self.device_changed(dev_path)
+            return 0, dev_path
         else:
             if alreadyConnected:
                 return status, "Already connected to device."
-            return status, self.stderr
+            return status, result.stderr
 
     def submit_disconnect_cmd(self, nqn=None, device_path=None):
         """
@@ -519,24 +701,25 @@ class NVMeCLILib():
         Raises:
             NameError: If device path is not in correct format.
         """
-        cmd_base = "nvme"
-        cmd = f"{cmd_base} disconnect"
+        argv = ["nvme", "disconnect"]
         if nqn:
-            cmd = f"{cmd} -n {nqn}"
+            argv += ["-n", nqn]
         elif device_path:
             if not re.match(r"\A/dev/nvme[0-9]+\Z", device_path):
                 raise NameError(
                     f"Cannot disconnect this device: {device_path}")
-            cmd = f"{cmd} -d {device_path}"
+            argv += ["-d", device_path]
         else:
             if not re.match(r"\A/dev/nvme[0-9]+\Z", self.dev_path):
                 raise NameError(
                     f"Cannot disconnect this device: {self.dev_path}")
-            cmd = f"{cmd} -d {self.dev_path}"
+            argv += ["-d", self.dev_path]
 
-        status = self.execute_cmd(cmd)
+        result = self.run_cmd(argv)
 
-        if status == 0:
-            return status, self.stdout
+        if result.status == 0:
+            # Disconnected by NQN, the device is not known
+            self.device_changed(None if nqn else argv[-1])
+            return 0, result.stdout
         else:
-            return status, self.stderr
+            return result.status, result.stderr
@@ -0,0 +1,491 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Command trace library.
+
+Library that records the passthru commands submitted through an application
+library to a binary trace, and replays a trace without any device. Replays
+serve the recorded completions and data at memory speed, so the parsing and
+verification of the test cases can be re-run deterministically, framework
+regressions bisected and failing runs shared as a single file.
+
+Trace format (little endian):
+
+    header   "NVMTRACE", version (u16), reserved (u16)
+    record   flags (u8), reserved (u8, u16), status (i32), buff_size (u32),
+             timeout_ms (u32), start (f64), duration (f64), data out length (u32),
+             data in length (u32), SQE (64 bytes), CQE (16 bytes), data out, data in
+
+The SQE is recorded as submitted by the test, with the data pointer cleared.
+Data out is recorded for opcodes transferring data to the controller, data in
+for opcodes transferring data from it (opcode bits 1:0, fabrics commands both).
+
+Only passthru commands are traced. Fabric management (discover, connect,
+disconnect, list-subsys) is executed by the application when recording and
+is not available when replaying.
+"""
+import collections
+import concurrent.futures
+import ctypes
+import os
+import struct
+import sys
+import threading
+import time
+sys.path.insert(1, './')
+from src.macros import *
+from utils.logging_module import logger
+from lib.structlib.struct_base_lib import GenericCommand
+from lib.structlib.struct_codec_lib import encode_status, pack_cqe, unpack_cqe
+
+TRACE_MAGIC         = b"NVMTRACE"
+TRACE_VERSION       = 1
+HEADER              = struct.Struct("<8sHH")
+RECORD              = struct.Struct("<BBHiIIddII")
+SQE_SIZE            = 64
+CQE_SIZE            = 16
+DPTR_ADDR           = GenericCommand.dptr.offset
+
+FLAG_ADMIN          = 1 << 0
+FLAG_BATCH          = 1 << 1
+FLAG_ASYNC          = 1 << 2
+
+
+class TraceMismatch(Exception):
+    """ A replayed command differs from the recorded commands """
+
+
+class TraceRecord():
+    """
+    One traced command.
+
+    Attributes:
+        flags (int): FLAG_ADMIN, FLAG_BATCH and FLAG_ASYNC.
+        status (int): Status code returned by the application.
+        buff_size (int): Size of the data buffer of the command.
+        timeout_ms (int): Timeout of the command.
+        start (float): Submission time in seconds since the start of the trace.
+        duration (float): Execution time in seconds.
+        sqe (bytes): Submission queue entry.
+        cqe (bytes): Completion queue entry.
+        data_out (bytes): Data transferred to the controller.
+        data_in (bytes): Data transferred from the controller.
+    """
+
+    def __init__(self, flags, status, buff_size, timeout_ms, start, duration, sqe, cqe,
+                 data_out=b"", data_in=b""):
+        """ Constructor """
+        self.flags = flags
+        self.status = status
+        self.buff_size = buff_size
+        self.timeout_ms = timeout_ms
+        self.start = start
+        self.duration = duration
+        self.sqe = sqe
+        self.cqe = cqe
+        self.data_out = data_out
+        self.data_in = data_in
+
+    @property
+    def admin(self):
+        """ True for admin (and fabrics) commands """
+        return bool(self.flags & FLAG_ADMIN)
+
+    @property
+    def opcode(self):
+        """ Opcode of the command """
+        return self.sqe[0]
+
+    @property
+    def nsid(self):
+        """ Namespace ID of the command """
+        return struct.unpack_from("<I", self.sqe, 4)[0]
+
+    def key(self):
+        """ Identifies the command for replay """
+        return (self.admin, self.sqe, self.buff_size)
+
+    def pack(self):
+        """ Serializes the record """
+        return RECORD.pack(self.flags, 0, 0, self.status, self.buff_size, self.timeout_ms,
+                           self.start, self.duration, len(self.data_out), len(self.data_in)) \
+            + self.sqe + self.cqe + self.data_out + self.data_in
+
+
+def transfers_out(sqe):
+    """ True if the opcode transfers data to the controller """
+    return bool(sqe[0] & 0x01)
+
+
+def transfers_in(sqe):
+    """ True if the opcode transfers data from the controller """
+    return bool(sqe[0] & 0x02)
+
+
+def capture_sqe(nvme_cmd):
+    """ Submission queue entry of the command, with the data pointer cleared """
+    sqe = bytearray(ctypes.string_at(ctypes.addressof(nvme_cmd.cmd.generic_command), SQE_SIZE))
+    sqe[DPTR_ADDR:DPTR_ADDR + 8] = bytes(8)
+    return bytes(sqe)
+
+
+def capture_buffer(nvme_cmd):
+    """ Contents of the data buffer of the command """
+    if not nvme_cmd.buff or not nvme_cmd.buff_size:
+        return b""
+    return ctypes.string_at(nvme_cmd.buff, nvme_cmd.buff_size)
+
+
+class TraceWriter():
+    """
+    Appends records to a trace file. Records are flushed as they are written,
+    a trace is usable up to the last command even if the run is killed.
+    """
+
+    def __init__(self, path) -> None:
+        """Constructor
+
+        Args:
+            path (str): Path of the trace file, replaced if it exists.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, 0))
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.count = 0
+
+    def write(self, record):
+        """ Appends the record to the trace """
+        data = record.pack()
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(data)
+            self.file.flush()
+            self.count += 1
+
+    def close(self):
+        """ Closes the trace file """
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                logger.info(f"-- Recorded {self.count} commands to {self.path}")
+
+
+def read_trace(path):
+    """Reads the records of a trace file.
+
+    Args:
+        path (str): Path of the trace file.
+
+    Returns:
+        List[TraceRecord]: The records, in the order the commands completed.
+
+    Raises:
+        ValueError: If the file is not a trace of a supported version.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a command trace")
+    magic, version, _ = HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"{path} is not a command trace of version {TRACE_VERSION}")
+
+    records = []
+    view = memoryview(data)
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        flags, _, _, status, buff_size, timeout_ms, start, duration, out_len, in_len = \
+            RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        end = offset + SQE_SIZE + CQE_SIZE + out_len + in_len
+        if end > len(data):
+            logger.warning(f"-- Trace {path} is truncated after {len(records)} commands")
+            break
+        sqe = bytes(view[offset:offset + SQE_SIZE])
+        offset += SQE_SIZE
+        cqe = bytes(view[offset:offset + CQE_SIZE])
+        offset += CQE_SIZE
+        data_out = bytes(view[offset:offset + out_len])
+        offset += out_len
+        data_in = bytes(view[offset:offset + in_len])
+        offset += in_len
+        records.append(TraceRecord(flags, status, buff_size, timeout_ms, start, duration,
+                                   sqe, cqe, data_out, data_in))
+    return records
+
+
+class RecordingApp():
+    """
+    Application library wrapper which records every passthru command to a
+    trace. Everything else is delegated to the wrapped application.
+
+    Attributes:
+        app: The wrapped application library.
+        writer (TraceWriter): Writer of the trace.
+    """
+
+    def __init__(self, app, path) -> None:
+        """Constructor
+
+        Args:
+            app: Application library the commands are submitted with.
+            path (str): Path of the trace file.
+        """
+        object.__setattr__(self, "app", app)
+        object.__setattr__(self, "writer", TraceWriter(path))
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
+
+    def __setattr__(self, name, value):
+        # State such as dev_path or identify_cache belongs to the wrapped application
+        setattr(self.app, name, value)
+
+    def begin(self, nvme_cmd):
+        """ State of the command before its submission """
+        sqe = capture_sqe(nvme_cmd)
+        data_out = capture_buffer(nvme_cmd) if transfers_out(sqe) else b""
+        return sqe, data_out, time.perf_counter()
+
+    def complete(self, nvme_cmd, flags, began, status, end=None):
+        """ Records the command once it completed """
+        sqe, data_out, start = began
+        end = end or time.perf_counter()
+        data_in = capture_buffer(nvme_cmd) if transfers_in(sqe) else b""
+        self.writer.write(TraceRecord(flags, status, nvme_cmd.buff_size, nvme_cmd.timeout_ms,
+                                      start - self.writer.origin, end - start, sqe,
+                                      pack_cqe(nvme_cmd.rsp.response), data_out, data_in))
+
+    def submit(self, function, nvme_cmd, verify_rsp, async_run, flags):
+        """ Submits the command with the function of the application and records it """
+        began = self.begin(nvme_cmd)
+        if async_run:
+            future = function(nvme_cmd, verify_rsp, async_run=True)
+            future.add_done_callback(lambda f: None if f.cancelled() or f.exception() else
+                                     self.complete(nvme_cmd, flags | FLAG_ASYNC, began, f.result()))
+            return future
+
+        status = function(nvme_cmd, verify_rsp)
+        end = time.perf_counter()
+        # Some applications fill the CQE only when the response is requested
+        self.app.get_response(nvme_cmd)
+        self.complete(nvme_cmd, flags, began, status, end)
+        return status
+
+    def submit_passthru(self, nvme_cmd, verify_rsp=False, async_run=False):
+        """ Submit a passthru command to the NVMe device and record it """
+        return self.submit(self.app.submit_passthru, nvme_cmd, verify_rsp, async_run, FLAG_ADMIN)
+
+    def submit_admin_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """ Submit admin passthru command to the NVMe device and record it. Applications
+            without submit_admin_passthru (libnvme) submit it with submit_passthru. """
+        submit = getattr(self.app, "submit_admin_passthru", None) or self.app.submit_passthru
+        return self.submit(submit, nvme_cmd, verify_rsp, async_run, FLAG_ADMIN)
+
+    def submit_io_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """ Submit io passthru command to the NVMe device and record it """
+        return self.submit(self.app.submit_io_passthru, nvme_cmd, verify_rsp, async_run, 0)
+
+    def submit_batch(self, nvme_cmds, queue_depth=None, admin=False):
+        """ Submit a batch of passthru commands to the NVMe device and record them.
+            The duration of each command is the duration of the batch. """
+        began = [self.begin(nvme_cmd) for nvme_cmd in nvme_cmds]
+        statuses = self.app.submit_batch(nvme_cmds, queue_depth, admin)
+        end = time.perf_counter()
+        flags = FLAG_BATCH | (FLAG_ADMIN if admin else 0)
+        for nvme_cmd, command_began, status in zip(nvme_cmds, began, statuses):
+            self.complete(nvme_cmd, flags, command_began, status, end)
+        return statuses
+
+    def close(self):
+        """ Closes the trace and the wrapped application """
+        self.writer.close()
+        if hasattr(self.app, "close"):
+            self.app.close()
+
+
+class ReplayApp():
+    """
+    Application library serving the completions and data of a trace, without
+    any device.
+
+    A submitted command is matched to the next recorded command with the same
+    SQE and buffer size, so commands submitted concurrently may complete in
+    a different order than recorded. A command which was not recorded, or
+    whose data out differs from the recording (if strict), raises TraceMismatch.
+
+    Attributes:
+        path (str): Path of the trace file.
+        strict (bool): Compare the data out of the commands to the recording.
+        pending (Dict[tuple, Deque[TraceRecord]]): Recorded commands not replayed yet.
+        replayed (int): Number of commands replayed.
+    """
+
+    # I/O commands are served from the trace like admin commands
+    io_passthru = True
+
+    def __init__(self, path, dev_path=None, strict=True) -> None:
+        """Constructor
+
+        Args:
+            path (str): Path of the trace file.
+            dev_path (str, optional): Device path reported to the test cases.
+            strict (bool, optional): Compare the data out of the commands to the
+                recording. Defaults to True.
+        """
+        self.path = path
+        self.dev_path = dev_path
+        self.dev_name = dev_path[5:] if dev_path and dev_path.startswith("/dev/") else dev_path
+        self.strict = strict
+        self.identify_cache = None
+        self.records = read_trace(path)
+        self.lock = threading.Lock()
+        self.rewind()
+        logger.info(f"-- Replaying {len(self.records)} commands from {path}")
+
+    def rewind(self):
+        """ Makes every recorded command available again """
+        with self.lock:
+            self.pending = collections.defaultdict(collections.deque)
+            for record in self.records:
+                self.pending[record.key()].append(record)
+            self.replayed = 0
+        self.ret_status = 0
+        self.result = 0
+        self.last_record = None
+
+    def reset(self):
+        """ Clears the state left by previously executed commands """
+        self.ret_status = 0
+        self.result = 0
+
+    def close(self):
+        """ Logs the recorded commands which were not replayed """
+        remaining = sum(len(records) for records in self.pending.values())
+        logger.info(f"-- Replayed {self.replayed} commands, {remaining} not replayed")
+
+    def replay(self, nvme_cmd, admin):
+        """Completes the command from the trace.
+
+        Returns:
+            int: Status code of the recorded command.
+
+        Raises:
+            TraceMismatch: If no recorded command matches.
+        """
+        sqe = capture_sqe(nvme_cmd)
+        with self.lock:
+            records = self.pending.get((admin, sqe, nvme_cmd.buff_size))
+            if not records:
+                raise TraceMismatch(
+                    f"Command not in trace: {'admin' if admin else 'io'} OPC:{sqe[0]:#x} "
+                    f"NSID:{struct.unpack_from('<I', sqe, 4)[0]} after {self.replayed} commands")
+            record = records.popleft()
+            self.replayed += 1
+
+        if self.strict and transfers_out(sqe) and capture_buffer(nvme_cmd) != record.data_out:
+            raise TraceMismatch(f"Data of command OPC:{sqe[0]:#x} differs from the trace")
+        if record.data_in:
+            ctypes.memmove(nvme_cmd.buff, record.data_in,
+                           min(len(record.data_in), nvme_cmd.buff_size))
+        unpack_cqe(record.cqe, nvme_cmd.rsp.response)
+
+        self.last_record = record
+        self.ret_status = record.status
+        self.result = nvme_cmd.rsp.response.command_specific.CommandSpecific64
+        if admin and self.identify_cache:
+            self.identify_cache.admin_completed(nvme_cmd, record.status)
+        return record.status
+
+    def run_async(self, function, nvme_cmd, verify_rsp):
+        """ Completes the command immediately, as a resolved Future """
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(function(nvme_cmd, verify_rsp, False))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit_passthru(self, nvme_cmd, verify_rsp=False, async_run=False):
+        """ Replay a passthru command, same as submit_admin_passthru """
+        return self.submit_admin_passthru(nvme_cmd, verify_rsp, async_run)
+
+    def submit_admin_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """
+        Replay admin passthru command from the trace.
+
+        Args:
+            nvme_cmd: The NVMe command object. The recorded data is moved to
+                memory specified in "nvme_cmd.buff" and the CQE is filled.
+            verify_rsp: Unused.
+            async_run: Flag indicating whether a Future resolving to the status
+                code is returned.
+
+        Returns:
+            int: Status Code of the recorded command.
+        """
+        if async_run:
+            return self.run_async(self.submit_admin_passthru, nvme_cmd, verify_rsp)
+        return self.replay(nvme_cmd, admin=True)
+
+    def submit_io_passthru(self, nvme_cmd, verify_rsp=True, async_run=False):
+        """ Replay io passthru command from the trace, see submit_admin_passthru """
+        if async_run:
+            return self.run_async(self.submit_io_passthru, nvme_cmd, verify_rsp)
+        return self.replay(nvme_cmd, admin=False)
+
+    def submit_batch(self, nvme_cmds, queue_depth=None, admin=False):
+        """ Replay a batch of passthru commands from the trace """
+        return [self.replay(nvme_cmd, admin) for nvme_cmd in nvme_cmds]
+
+    def get_response(self, nvme_cmd, rsp=None):
+        """Fill the CQE structure. Replayed commands already have the recorded CQE.
+
+        Args:
+            nvme_cmd: Command object to fill response in
+            rsp (int, optional): Manually provide the status. Defaults to None.
+
+        Returns:
+            bool: Indicates success or failure
+        """
+        status = self.ret_status if rsp is None else rsp
+        if rsp is not None and status >= 0:
+            encode_status(nvme_cmd.rsp.response, status)
+        return status >= 0
+
+    def get_passthru_result(self):
+        """ Returns the result (CQE DW0) of the last command as a hex string """
+        return f"0x{self.result & 0xFFFFFFFF:08x}" if self.ret_status == 0 else None
+
+
+def trace_path(directory, name, app_name):
+    """ Path of the trace of a controller, named after its device or target """
+    return os.path.join(directory, f"{name.replace('/dev/', '')}_{app_name.lower()}.nvmtrace")
+
+
+def main():
+    """ Lists the commands of a trace """
+    import argparse
+    parser = argparse.ArgumentParser(description="List the commands of a command trace")
+    parser.add_argument("trace", help="Path of the trace file")
+    args = parser.parse_args()
+
+    print(f"{'#':>6} {'start(s)':>10} {'time(us)':>10} {'type':<5} {'opc':>4} {'nsid':>10} "
+          f"{'status':>7} {'out':>8} {'in':>8}")
+    for i, record in enumerate(read_trace(args.trace)):
+        kind = "admin" if record.admin else "io"
+        print(f"{i:>6} {record.start:>10.6f} {record.duration*1e6:>10.1f} {kind:<5} "
+              f"{record.opcode:#04x} {record.nsid:>10} {record.status:>#7x} "
+              f"{len(record.data_out):>8} {len(record.data_in):>8}")
+
+
+if __name__ == "__main__":
+    main()
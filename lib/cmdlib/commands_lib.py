@@ -6,11 +6,219 @@ Command Library.
 
 Library for maintaing commands supported by framework. Provides functions for
 retrieving command structures and command utilities.
+
+Commands submitted in tight loops can be checked out of the CommandPool of
+the library instead: a preallocated command is reset from a template built
+once per command type, and returned to the pool afterwards, so no structure
+or data buffer is allocated per command.
 """
+import ctypes
+import mmap
+import threading
+from src.macros import *
 from lib.structlib.nvme_struct_main_lib import NVMeCommand
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
+from lib.structlib.struct_codec_lib import pack_sqe
 from utils.logging_module import logger
 
+class CommandTemplate():
+    """
+    Commands of one type, preallocated in contiguous arrays with a data
+    buffer each. The image of each command, the template with the address of
+    its data buffer, is kept so that a command is reset with one copy.
+
+    Args:
+        nvme_cmd (NVMeCommand): Template of the commands.
+        buff_size (int): Size of the data buffer of each command, 0 for none.
+        capacity (int): Commands allocated at a time.
+    """
+
+    def __init__(self, nvme_cmd, buff_size, capacity) -> None:
+        """ Constructor """
+        nvme_cmd.buff_size = buff_size
+        self.template = NVMeCommand.from_buffer_copy(nvme_cmd)
+        self.buff_size = buff_size
+        self.stride = -(-buff_size // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+        self.capacity = capacity
+        self.commands = []
+        self.memory = []
+        self.images = []
+        self.views = []
+        self.free = []
+        self.in_use = bytearray()
+        self.slabs = []
+        self.grow()
+
+    def grow(self):
+        """Allocates capacity more commands and their data buffers. The new
+            slots are not free yet, see CommandPool.publish().
+
+        Returns:
+            range: Slots of the new commands.
+        """
+        first = len(self.commands)
+        commands = (NVMeCommand * self.capacity)()
+        self.slabs.append(commands)
+        self.commands.extend(commands)
+        command_size = ctypes.sizeof(NVMeCommand)
+        memory = memoryview(commands).cast("B")
+        self.memory.extend(memory[index * command_size:(index + 1) * command_size]
+                           for index in range(self.capacity))
+
+        image = NVMeCommand.from_buffer_copy(self.template)
+        if self.stride:
+            # Anonymous mappings are page aligned, as required for direct I/O
+            buffers = mmap.mmap(-1, self.stride * self.capacity)
+            address = ctypes.addressof(ctypes.c_char.from_buffer(buffers))
+            view = memoryview(buffers)
+            self.slabs.append(buffers)
+            for index in range(self.capacity):
+                image.buff = address + index * self.stride
+                self.images.append(bytes(image))
+                self.views.append(view[index * self.stride:index * self.stride + self.buff_size])
+        else:
+            self.images.extend([bytes(image)] * self.capacity)
+        self.in_use.extend(bytes(self.capacity))
+        return range(first, len(self.commands))
+
+
+class CommandPool():
+    """
+    Pool of commands of preset types, checked out as copies of a template and
+    returned after use. Commands and data buffers are allocated in batches of
+    COMMAND_POOL_SIZE per type, only when all are checked out.
+
+    Args:
+        cmdlib (NVMeCommandLib): Library building the templates.
+        capacity (int, optional): Commands allocated at a time per type.
+
+    Attributes:
+        allocations (int): Commands allocated by the pool.
+    """
+
+    # Preset types: builder of the template and size of the data buffer
+    PRESETS = {
+        "identify": ("get_identify_cmd", 4096),
+        "identify_controller": ("get_identify_controller_cmd", 4096),
+        "property_get": ("get_property_get_cmd", 8),
+        "property_set": ("get_property_set_cmd", 0),
+        "get_features": ("get_get_features_cmd", 0),
+        "set_features": ("get_set_features_cmd", 0),
+        "read": ("get_read_cmd", COMMAND_POOL_IO_SIZE),
+        "write": ("get_write_cmd", COMMAND_POOL_IO_SIZE),
+        "flush": ("get_flush_cmd", 0),
+        "abort": ("get_abort_cmd", 0),
+        "aer": ("get_aer_cmd", 0),
+    }
+
+    def __init__(self, cmdlib, capacity=COMMAND_POOL_SIZE) -> None:
+        """ Constructor """
+        self.cmdlib = cmdlib
+        self.capacity = capacity
+        # Held to create templates and commands only, list pop/append are atomic
+        self.lock = threading.Lock()
+        self.templates = {}
+        # Checked out command object: its template and slot
+        self.slots = {}
+        self.allocations = 0
+
+    def register(self, name, nvme_cmd, buff_size=None):
+        """Adds a command type to the pool, e.g. a Get Log Page of a given log.
+
+        Args:
+            name (str): Name the commands are checked out with.
+            nvme_cmd (NVMeCommand): Template of the commands.
+            buff_size (int, optional): Size of the data buffer of each command.
+                Defaults to the buff_size of the template.
+        """
+        buff_size = nvme_cmd.buff_size if buff_size is None else buff_size
+        template = CommandTemplate(nvme_cmd, buff_size, self.capacity)
+        with self.lock:
+            self.publish(template, range(len(template.commands)))
+            self.templates[name] = template
+
+    def add_preset(self, name):
+        """ Creates the template of a preset type on first checkout """
+        if name not in CommandPool.PRESETS:
+            raise KeyError(f"Unknown command type: {name}")
+        builder, buff_size = CommandPool.PRESETS[name]
+        with self.lock:
+            if name not in self.templates:
+                template = CommandTemplate(getattr(self.cmdlib, builder)(), buff_size, self.capacity)
+                self.publish(template, range(len(template.commands)))
+                self.templates[name] = template
+            return self.templates[name]
+
+    def grow(self, template):
+        """ Allocates more commands of a template once all are checked out """
+        with self.lock:
+            if not template.free:
+                self.publish(template, template.grow())
+
+    def publish(self, template, slots):
+        """Maps the command objects of new slots to their template, then makes
+            the slots free. checkout() does not hold the lock, a slot must be
+            mapped before it can be checked out.
+        """
+        for slot in slots:
+            self.slots[id(template.commands[slot])] = (template, slot)
+        self.allocations += len(slots)
+        template.free.extend(reversed(slots))
+
+    def checkout(self, name):
+        """Returns a command of the type, reset to its template. The data
+            buffer of the command, aligned for direct I/O, is set in
+            "nvme_cmd.buff". Read and Write commands have a buffer of
+            COMMAND_POOL_IO_SIZE bytes, "nvme_cmd.buff_size" is set to the
+            transfer length by the caller.
+
+        Args:
+            name (str): Preset or registered command type.
+
+        Returns:
+            NVMeCommand: The command, to be returned with checkin().
+
+        Raises:
+            KeyError: If the type is neither a preset nor registered.
+        """
+        template = self.templates.get(name) or self.add_preset(name)
+        while True:
+            try:
+                slot = template.free.pop()
+                break
+            except IndexError:
+                self.grow(template)
+        template.in_use[slot] = 1
+        template.memory[slot][:] = template.images[slot]
+        return template.commands[slot]
+
+    def checkin(self, nvme_cmd):
+        """Returns a checked out command to the pool.
+
+        Args:
+            nvme_cmd (NVMeCommand): Command returned by checkout().
+
+        Raises:
+            ValueError: If the command is not from the pool or already returned.
+        """
+        template, slot = self.slots.get(id(nvme_cmd), (None, 0))
+        if template is None or not template.in_use[slot]:
+            raise ValueError("Command not checked out of the pool")
+        template.in_use[slot] = 0
+        template.free.append(slot)
+
+    def data(self, nvme_cmd):
+        """ Data buffer of a checked out command, as a memoryview """
+        template, slot = self.slots[id(nvme_cmd)]
+        return template.views[slot]
+
+    def stats(self):
+        """ Commands allocated and checked out per type """
+        return {name: {"allocated": len(template.commands),
+                       "checked_out": len(template.commands) - len(template.free)}
+                for name, template in self.templates.items()}
+
+
 class NVMeCommandLib:
     """Initialize attributes
 
@@ -23,6 +231,7 @@ class NVMeCommandLib:
         """ Constructor """
         self.dev_name = dev_name
         self.app_name = app_name.lower()
+        self.pool = CommandPool(self)
         if app_name.lower() == "nvme-cli" or app_name.lower() == "nvmecli":
             pass  # self.app = NVMeCLILib(dev_name)
         elif app_name.lower() == "libnvme":
@@ -50,8 +259,7 @@ class NVMeCommandLib:
         """
         nvme_cmd = self.get_nvme_cmd()
         nvme_cmd.buff_size = 4096
-        nvme_cmd.cmd.identify_cmd.cdw0.OPC = 0x06
-        nvme_cmd.cmd.identify_cmd.NSID = 0
+        pack_sqe(nvme_cmd.cmd, 0x06, nsid=0)
 
         logger.trace("nvme_cmd returned from Commands Lib")
         return nvme_cmd
@@ -65,11 +273,8 @@ class NVMeCommandLib:
         """
         nvme_cmd = self.get_nvme_cmd()
         nvme_cmd.buff_size = 4096
-        nvme_cmd.cmd.identify_cmd.cdw0.OPC = 0x06
-        nvme_cmd.cmd.identify_cmd.NSID = 0
-
         # Making it identify-controller command
-        nvme_cmd.cmd.identify_cmd.cdw10.raw = 0x01
+        pack_sqe(nvme_cmd.cmd, 0x06, nsid=0, cdw10=0x01)
 
         logger.trace("nvme_cmd returned from Commands Lib")
         return nvme_cmd
@@ -82,9 +287,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Property Get command.
         """
         nvme_cmd = self.get_nvme_cmd()
-
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x7f
-        nvme_cmd.cmd.generic_command.NSID = 0x04
+        pack_sqe(nvme_cmd.cmd, 0x7f, nsid=0x04)
 
         logger.trace("nvme_cmd returned from Commands Lib")
 
@@ -98,23 +301,31 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Property Set command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x7f
-        nvme_cmd.cmd.generic_command.NSID = 0x00
+        pack_sqe(nvme_cmd.cmd, 0x7f, nsid=0x00)
 
         logger.trace("nvme_cmd returned from Commands Lib")
 
         return nvme_cmd
     
-    def get_get_log_cmd(self, log_id, log_len):
+    def get_get_log_cmd(self, log_id, log_len, offset=0, nsid=0xFFFFFFFF, lsp=0, rae=False,
+                        lsi=0):
         """Retrieves the main NVMeCommand Structure with the required fields set for making
             it a Get Log command
 
+        Args:
+            log_id (int): Log page identifier.
+            log_len (int): Number of bytes to transfer.
+            offset (int, optional): Log page offset (LPO) in bytes, dword aligned.
+            nsid (int, optional): Namespace ID. Defaults to all namespaces.
+            lsp (int, optional): Log specific field.
+            rae (bool, optional): Retain Asynchronous Event, the event is not
+                cleared by this command.
+            lsi (int, optional): Log specific identifier.
+
         Returns:
             NVMeCommand: Structure for Get Log command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x02
-        nvme_cmd.cmd.generic_command.NSID = 0xFFFFFFFF  
 
         upper = 0
         n_dwords = log_len // 4 - 1
@@ -122,8 +333,10 @@ class NVMeCommandLib:
             upper = n_dwords >> 16
         lower = n_dwords & 0x0000FFFF
 
-        nvme_cmd.cmd.generic_command.cdw10.raw = (lower << 16) | (log_id & 0xFFFF)
-        nvme_cmd.cmd.generic_command.cdw11.raw = upper & 0xFFFF
+        cdw10 = (lower << 16) | (log_id & 0xFFFF) | (lsp & 0x7F) << 8 | int(rae) << 15
+        pack_sqe(nvme_cmd.cmd, 0x02, nsid=nsid, cdw10=cdw10,
+                 cdw11=(lsi & 0xFFFF) << 16 | (upper & 0xFFFF),
+                 cdw12=offset & 0xFFFFFFFF, cdw13=offset >> 32)
         nvme_cmd.buff_size = log_len
 
         logger.trace("nvme_cmd returned from Commands Lib")
@@ -138,12 +351,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Get Features command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x0A
-        nvme_cmd.cmd.generic_command.NSID = 0xFFFFFFFF  
-
-        if feature_id:
-            nvme_cmd.cmd.generic_command.cdw10.raw = feature_id
-        
+        pack_sqe(nvme_cmd.cmd, 0x0A, nsid=0xFFFFFFFF, cdw10=feature_id or 0)
         nvme_cmd.buff_size = 0
         
         logger.trace("nvme_cmd returned from Commands Lib")
@@ -158,12 +366,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Set Features command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x09
-        nvme_cmd.cmd.generic_command.NSID = 0xFFFFFFFF  
-
-        if feature_id:
-            nvme_cmd.cmd.generic_command.cdw10.raw = feature_id
-        
+        pack_sqe(nvme_cmd.cmd, 0x09, nsid=0xFFFFFFFF, cdw10=feature_id or 0)
         nvme_cmd.buff_size = 0
         
         logger.trace("nvme_cmd returned from Commands Lib")
@@ -178,8 +381,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Read command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x02
-        nvme_cmd.cmd.generic_command.NSID = 1 
+        pack_sqe(nvme_cmd.cmd, 0x02, nsid=1)
 
         # For libnvme, use these in test case
         # nvme_cmd.cmd.generic_command.dptr.sgl.data_len = nvme_cmd.buff_size
@@ -197,8 +399,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Write command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x01
-        nvme_cmd.cmd.generic_command.NSID = 1 
+        pack_sqe(nvme_cmd.cmd, 0x01, nsid=1)
 
         # For libnvme, use these in test case
         # nvme_cmd.cmd.generic_command.dptr.sgl.data_len = nvme_cmd.buff_size
@@ -216,8 +417,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Flush command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x00
-        nvme_cmd.cmd.generic_command.NSID = 1
+        pack_sqe(nvme_cmd.cmd, 0x00, nsid=1)
  
         logger.trace("nvme_cmd returned from Commands Lib")
 
@@ -231,13 +431,15 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Abort command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x08
 
+        cdw10 = 0
         if sqid:
-            nvme_cmd.cmd.generic_command.cdw10.raw = sqid & ((1<<16)-1)
+            cdw10 = sqid & ((1<<16)-1)
 
         if cid:
-            nvme_cmd.cmd.generic_command.cdw10.raw = cid << 16
+            cdw10 = cid << 16
+
+        pack_sqe(nvme_cmd.cmd, 0x08, cdw10=cdw10)
 
         logger.trace("nvme_cmd returned from Commands Lib")
 
@@ -251,7 +453,7 @@ class NVMeCommandLib:
             NVMeCommand: Structure for Abort command.
         """
         nvme_cmd = self.get_nvme_cmd()
-        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x0C
+        pack_sqe(nvme_cmd.cmd, 0x0C)
 
  
         logger.trace("nvme_cmd returned from Commands Lib")
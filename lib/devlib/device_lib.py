@@ -7,13 +7,177 @@ Device Library.
 Library for maintaing device related objects. Provides 
 abstraction to the device layer.
 """
+import ctypes
+import threading
+from src.macros import *
 from lib.applib.libnvme_lib import Libnvme
 from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.applib.ioctl_lib import IoctlLib
+from lib.applib.io_uring_lib import IoUringLib
+from lib.applib.trace_lib import RecordingApp, ReplayApp, trace_path
 from lib.cmdlib.commands_lib import NVMeCommandLib
+from lib.structlib.struct_admin_data_lib import IdentifyControllerData, IdentifyNamespaceData
+from lib.structlib.struct_codec_lib import replicate, set_lba_ranges
 from lib.syslib.system_lib import SystemLib
 from utils.logging_module import logger
 
 
+class IdentifyCache():
+    """
+    Identify data of a controller and its namespaces. Read from the device on
+    first access and kept until it may be stale: after a reconnect, a Format
+    NVM, a namespace or firmware change, or a Namespace Attribute Changed event.
+
+    Args:
+        app: Application library the identify commands are submitted with.
+        cmdlib (NVMeCommandLib): Command library of the controller.
+    """
+
+    # Admin opcodes which change identify data when they succeed
+    INVALIDATING_OPCODES = {0x0D: "Namespace Management", 0x10: "Firmware Commit",
+                            0x15: "Namespace Attachment", 0x80: "Format NVM"}
+
+    def __init__(self, app, cmdlib) -> None:
+        """ Constructor """
+        self.app = app
+        self.cmdlib = cmdlib
+        self.lock = threading.RLock()
+        self.controller = None
+        self.namespaces = {}
+        self.max_transfer_size = None
+        self.reads = 0
+
+    def get_controller(self):
+        """Returns the Identify Controller data, read on first access.
+
+        Returns:
+            IdentifyControllerData: Identify Controller data structure.
+
+        Raises:
+            Exception: If the Identify command fails.
+        """
+        with self.lock:
+            if self.controller is None:
+                data = IdentifyControllerData()
+                self.submit_identify(0x01, 0, data)
+                self.controller = data
+            return self.controller
+
+    def get_namespace(self, nsid=1):
+        """Returns the Identify Namespace data, read on first access.
+
+        Args:
+            nsid (int, optional): Namespace ID. Defaults to 1.
+
+        Returns:
+            IdentifyNamespaceData: Identify Namespace data structure.
+
+        Raises:
+            Exception: If the Identify command fails.
+        """
+        with self.lock:
+            if nsid not in self.namespaces:
+                data = IdentifyNamespaceData()
+                self.submit_identify(0x00, nsid, data)
+                self.namespaces[nsid] = data
+            return self.namespaces[nsid]
+
+    def get_max_transfer_size(self):
+        """Returns the Maximum Data Transfer Size in bytes, read on first access.
+
+        Returns:
+            int: MDTS in bytes, 0 if the controller does not limit transfers.
+        """
+        with self.lock:
+            if self.max_transfer_size is None:
+                mdts = self.get_controller().MDTS
+                self.max_transfer_size = self.get_memory_page_size() << mdts if mdts else 0
+            return self.max_transfer_size
+
+    def get_memory_page_size(self):
+        """Minimum memory page size of the controller (CAP.MPSMIN), the unit of
+            MDTS. Read with a Property Get, 4 KiB if the property cannot be read.
+
+        Returns:
+            int: Page size in bytes.
+        """
+        nvme_cmd = self.cmdlib.get_property_get_cmd()
+        value = ctypes.c_uint64()
+        nvme_cmd.buff = ctypes.addressof(value)
+        nvme_cmd.cmd.generic_command.cdw10.raw = 1  # 8 byte property
+        nvme_cmd.cmd.generic_command.cdw11.raw = OFFSET_CONTROLLER_CAPABILITIES
+        submit = getattr(self.app, "submit_admin_passthru", None) or self.app.submit_passthru
+        try:
+            status = submit(nvme_cmd, verify_rsp=True, async_run=False)
+        except Exception as e:
+            logger.warning(f"-- CAP could not be read, 4 KiB pages assumed: {e}")
+            return 4096
+        if status != 0:
+            logger.warning(f"-- CAP could not be read ({status}), 4 KiB pages assumed")
+            return 4096
+        return 1 << (12 + ((value.value >> 48) & 0xF))
+
+    def submit_identify(self, cns, nsid, data):
+        """ Reads the identify data structure selected by CNS into data """
+        nvme_cmd = self.cmdlib.get_identify_cmd()
+        nvme_cmd.cmd.identify_cmd.cdw10.raw = cns
+        nvme_cmd.cmd.identify_cmd.NSID = nsid
+        nvme_cmd.buff = ctypes.addressof(data)
+        nvme_cmd.buff_size = ctypes.sizeof(data)
+
+        submit = getattr(self.app, "submit_admin_passthru", None) or self.app.submit_passthru
+        status = submit(nvme_cmd, verify_rsp=True, async_run=False)
+        if status != 0:
+            logger.error(f"-- Identify (CNS {cns:#x}, NSID {nsid}) failed: {status}")
+            raise Exception(f"Identify (CNS {cns:#x}, NSID {nsid}) failed: {status}")
+        self.reads += 1
+
+    def invalidate(self, nsid=None):
+        """Drops cached identify data.
+
+        Args:
+            nsid (int, optional): Namespace whose data is dropped. Drops the
+                controller and all namespaces if None.
+        """
+        with self.lock:
+            if nsid is None:
+                self.controller = None
+                self.max_transfer_size = None
+                self.namespaces.clear()
+            else:
+                self.namespaces.pop(nsid, None)
+
+    def admin_completed(self, nvme_cmd, status):
+        """Drops the identify data made stale by a completed admin command.
+            Called by the application library for every admin command.
+
+        Args:
+            nvme_cmd: The completed command.
+            status (int): Status code of the command.
+        """
+        opcode = nvme_cmd.cmd.generic_command.cdw0.OPC
+        if status != 0:
+            return
+        if opcode in IdentifyCache.INVALIDATING_OPCODES:
+            logger.info(f"-- {IdentifyCache.INVALIDATING_OPCODES[opcode]} completed, identify data dropped")
+            self.invalidate()
+        elif opcode == 0x0C:
+            self.event_received(nvme_cmd.rsp.response.command_specific.CommandSpecific64)
+
+    def event_received(self, result):
+        """Drops the namespace data on a Namespace Attribute Changed event.
+
+        Args:
+            result (int): Dword 0 of the Asynchronous Event Request completion.
+        """
+        event_type = result & 0x07
+        event_info = (result >> 8) & 0xFF
+        if event_type == 0x02 and event_info == 0x00:
+            logger.info("-- Namespace Attribute Changed, namespace identify data dropped")
+            with self.lock:
+                self.namespaces.clear()
+
+
 class Controller():
     """
     Represents a controller object that interacts with a device using different applications.
@@ -21,28 +185,331 @@ class Controller():
     Args:
         dev_name (str): The name of the device.
         app_name (str): The name of the application to be used for interaction.
+        trace (dict, optional): Command trace configuration, "mode" ("off", "record"
+            or "replay") and "dir" the traces are kept in. See lib/applib/trace_lib.py.
+        trace_name (str, optional): Name the trace is kept under, stable across
+            sessions (e.g. the target), as the device connected to may change.
+            Defaults to the device name.
 
     Attributes:
         cmdlib: An instance of the NVMeCommandLib class.
         dev_name (str): The name of the device.
         app_name (str): The name of the application.
         app: An instance of the application class based on the provided app_name.
+        identify_cache (IdentifyCache): Identify data of the controller and its namespaces.
     """
 
-    def __init__(self, dev_name, app_name) -> None:
+    def __init__(self, dev_name, app_name, trace=None, trace_name=None) -> None:
         """ Constructor """
         self.cmdlib = NVMeCommandLib(dev_name, app_name)
         self.dev_name = dev_name
         self.app_name = app_name
         self.sys = SystemLib()
-        if app_name.lower() == "nvme-cli"  or app_name.lower() == "nvmecli":
+        trace_mode = (trace or {}).get("mode", "off").lower()
+        if trace_mode == "replay":
+            # Commands are served from the trace, no device is used
+            self.app = ReplayApp(trace_path(trace["dir"], trace_name or dev_name, app_name),
+                                 dev_name)
+            logger.trace("replay selected")
+        elif app_name.lower() == "nvme-cli"  or app_name.lower() == "nvmecli":
             self.app = NVMeCLILib(dev_name)
             logger.trace("nvme-cli selected")
         elif app_name.lower() == "libnvme":
             self.app = Libnvme(dev_name)
             logger.trace("libnvme selected")
+        elif app_name.lower() == "ioctl":
+            self.app = IoctlLib(dev_name)
+            logger.trace("ioctl selected")
+        elif app_name.lower() == "io_uring":
+            self.app = IoUringLib(dev_name)
+            logger.trace("io_uring selected")
         else:
             logger.error("Error : {}", app_name)
+            self.app = None
+
+        if self.app and trace_mode == "record":
+            self.app = RecordingApp(self.app,
+                                    trace_path(trace["dir"], trace_name or dev_name, app_name))
+
+        # The application reports completed admin commands to the cache
+        self.identify_cache = IdentifyCache(self.app, self.cmdlib)
+        if self.app:
+            self.app.identify_cache = self.identify_cache
+
+        # Device the application was created for, restored by reset()
+        self.app_device = {attr: getattr(self.app, attr) for attr in ("dev_path", "dev_name")
+                           if hasattr(self.app, attr)}
+
+    @property
+    def identify(self):
+        """ Identify Controller data, read from the device on first access """
+        return self.identify_cache.get_controller()
+
+    @property
+    def max_transfer_size(self):
+        """ Maximum Data Transfer Size in bytes, 0 if transfers are not limited """
+        return self.identify_cache.get_max_transfer_size()
+
+    def namespace_io(self, nsid=1, queue_depth=NAMESPACE_IO_QUEUE_DEPTH):
+        """Read/Write interface of a namespace, see NamespaceIO.
+
+        Args:
+            nsid (int, optional): Namespace ID. Defaults to 1.
+            queue_depth (int, optional): Maximum commands in flight.
+
+        Returns:
+            NamespaceIO: Interface for transfers of any size.
+
+        Raises:
+            ValueError: If the application cannot submit I/O commands.
+        """
+        if not getattr(self.app, "io_passthru", False):
+            raise ValueError(f"{self.app_name} cannot submit I/O commands")
+        return NamespaceIO(self, nsid, queue_depth)
+
+    def namespace(self, nsid=1):
+        """Identify Namespace data, read from the device on first access.
+
+        Args:
+            nsid (int, optional): Namespace ID. Defaults to 1.
+
+        Returns:
+            IdentifyNamespaceData: Identify Namespace data structure.
+        """
+        return self.identify_cache.get_namespace(nsid)
+
+    def reset(self):
+        """ Returns the controller to the state it was created in, for reuse by another test """
+        for attr, value in self.app_device.items():
+            setattr(self.app, attr, value)
+        if hasattr(self.app, "reset"):
+            self.app.reset()
+        self.sys.reset()
+
+    def close(self):
+        """ Releases the resources held by the application """
+        if hasattr(self.app, "close"):
+            self.app.close()
+
+
+class NamespaceIO():
+    """
+    Reads and writes a namespace with transfers of any size. A transfer is
+    split in commands of the Maximum Data Transfer Size of the controller,
+    built in batches from a template command and submitted with up to
+    queue_depth commands in flight. Data is transferred directly from/to the
+    memory of the buffer given, a memoryview of a large buffer is not copied.
+
+    Args:
+        controller (Controller): Controller the namespace is attached to.
+        nsid (int, optional): Namespace ID. Defaults to 1.
+        queue_depth (int, optional): Maximum commands in flight.
+        max_chunk (int, optional): Upper bound of the transfer size of one
+            command, used alone if MDTS does not limit transfers.
+
+    Attributes:
+        lba_size (int): Logical block size of the namespace.
+        chunk_blocks (int): Logical blocks transferred per command.
+        commands (int): Number of commands submitted.
+    """
+
+    def __init__(self, controller, nsid=1, queue_depth=NAMESPACE_IO_QUEUE_DEPTH,
+                 max_chunk=NAMESPACE_IO_MAX_CHUNK) -> None:
+        """ Constructor """
+        self.controller = controller
+        self.nsid = nsid
+        self.queue_depth = queue_depth
+        self.lba_size = controller.namespace(nsid).lba_size
+        chunk_size = min(controller.max_transfer_size or max_chunk, max_chunk)
+        # NLB is a 16 bit field
+        self.chunk_blocks = min(max(chunk_size // self.lba_size, 1), 0x10000)
+        self.commands = 0
+
+    @staticmethod
+    def buffer_address(buffer):
+        """Address of the memory of a buffer.
+
+        Args:
+            buffer: Contiguous buffer (bytes, bytearray, memoryview, mmap, ctypes array).
+                A read-only buffer is mapped with NumPy, only valid as write() data.
+
+        Returns:
+            Tuple[int, Any]: Address, and the object keeping it valid. No buffer
+                is copied.
+        """
+        view = memoryview(buffer).cast("B")
+        if view.readonly:
+            # ctypes only maps writable buffers, a NumPy array maps any buffer
+            import numpy as np
+            ref = np.frombuffer(view, np.uint8)
+            return ref.ctypes.data, ref
+        ref = ctypes.c_char.from_buffer(view)
+        return ctypes.addressof(ref), ref
+
+    def submit(self, nvme_cmd, lba, address, nbytes):
+        """Transfers nbytes starting at lba with commands copied from nvme_cmd.
+
+        Args:
+            nvme_cmd (NVMeCommand): Read or Write command used as template.
+            lba (int): Starting LBA.
+            address (int): Address of the data.
+            nbytes (int): Bytes to transfer, a multiple of the LBA size.
+
+        Returns:
+            int: Status Code of the first failed command, or 0.
+
+        Raises:
+            ValueError: If nbytes is not a multiple of the LBA size.
+        """
+        nblocks, rest = divmod(nbytes, self.lba_size)
+        if rest:
+            raise ValueError(f"{nbytes} bytes is not a multiple of the LBA size {self.lba_size}")
+        nvme_cmd.cmd.generic_command.NSID = self.nsid
+        chunk_blocks = self.chunk_blocks
+        chunk_bytes = chunk_blocks * self.lba_size
+
+        for first in range(0, nblocks, chunk_blocks * NAMESPACE_IO_BATCH):
+            count = min(-(-(nblocks - first) // chunk_blocks), NAMESPACE_IO_BATCH)
+            start = address + first * self.lba_size
+            nvme_cmds = replicate(nvme_cmd, count)
+            set_lba_ranges(nvme_cmds, range(lba + first, lba + first + count * chunk_blocks,
+                                            chunk_blocks),
+                           chunk_blocks, range(start, start + count * chunk_bytes, chunk_bytes),
+                           chunk_bytes)
+            last_blocks = min(nblocks - first - (count - 1) * chunk_blocks, chunk_blocks)
+            if last_blocks != chunk_blocks:
+                cdw12 = nvme_cmds[count - 1].cmd.generic_command.cdw12
+                cdw12.raw = (cdw12.raw & 0xFFFF0000) | (last_blocks - 1)
+                nvme_cmds[count - 1].buff_size = last_blocks * self.lba_size
+
+            self.commands += count
+            statuses = self.controller.app.submit_batch(nvme_cmds, self.queue_depth)
+            for index, status in enumerate(statuses):
+                if status != 0:
+                    slba = lba + first + index * chunk_blocks
+                    logger.error(f"-- Transfer at LBA {slba:#x} failed: {status}")
+                    return status
+        return 0
+
+    def read(self, lba, nbytes=None, out=None):
+        """Reads data from the namespace.
+
+        Args:
+            lba (int): Starting LBA.
+            nbytes (int, optional): Bytes to read, a multiple of the LBA size.
+                Defaults to the size of out.
+            out (optional): Writable buffer the data is read into. A bytearray
+                is allocated if None.
+
+        Returns:
+            Tuple[int, memoryview]: Status Code of the first failed command or 0,
+                and the data read.
+
+        Raises:
+            ValueError: If out is read-only or smaller than nbytes, or neither is given.
+        """
+        if out is None:
+            if nbytes is None:
+                raise ValueError("Either nbytes or out is required")
+            out = bytearray(nbytes)
+        view = memoryview(out).cast("B")
+        if view.readonly:
+            raise ValueError("Buffer to read into is read-only")
+        if nbytes is None:
+            nbytes = len(view)
+        if nbytes > len(view):
+            raise ValueError(f"Buffer of {len(view)} bytes is too small for {nbytes} bytes")
+        view = view[:nbytes]
+        if not nbytes:
+            return 0, view
+        address, _ref = self.buffer_address(view)
+        return self.submit(self.controller.cmdlib.get_read_cmd(), lba, address, nbytes), view
+
+    def write(self, lba, data):
+        """Writes data to the namespace.
+
+        Args:
+            lba (int): Starting LBA.
+            data: Buffer with the data, its size a multiple of the LBA size.
+
+        Returns:
+            int: Status Code of the first failed command, or 0.
+        """
+        nbytes = memoryview(data).nbytes
+        if not nbytes:
+            return 0
+        address, _ref = self.buffer_address(data)
+        return self.submit(self.controller.cmdlib.get_write_cmd(), lba, address, nbytes)
+
+
+class ControllerPool():
+    """
+    Session wide registry of controllers, keyed by device and application.
+    Tests get a warm controller, reset to the state it was created in,
+    instead of building the application and command libraries again.
+    """
+
+    def __init__(self) -> None:
+        """ Constructor """
+        self.controllers = {}
+        self.lock = threading.Lock()
+        # Command trace configuration of the controllers created
+        self.trace = None
+        # Device name: name of its trace, see Controller
+        self.trace_names = {}
+        self.created = 0
+        self.reused = 0
+
+    def get(self, dev_name, app_name):
+        """Returns the controller for the device and application.
+
+        Args:
+            dev_name (str): The name of the device.
+            app_name (str): The name of the application.
+
+        Returns:
+            Controller: Controller created on first use, reset on later uses.
+        """
+        key = (dev_name, app_name.lower())
+        with self.lock:
+            controller = self.controllers.get(key)
+            if controller is None:
+                controller = Controller(dev_name, app_name, self.trace,
+                                        self.trace_names.get(dev_name))
+                self.controllers[key] = controller
+                self.created += 1
+            else:
+                controller.reset()
+                self.reused += 1
+        return controller
+
+    def discard(self, dev_name):
+        """Closes and removes the controllers of a device, e.g. after it was disconnected.
+
+        Args:
+            dev_name (str): The name of the device.
+        """
+        with self.lock:
+            keys = [key for key in self.controllers if key[0] == dev_name]
+            controllers = [self.controllers.pop(key) for key in keys]
+        for controller in controllers:
+            controller.close()
+
+    def close_all(self):
+        """ Closes every controller. Called at session teardown. """
+        with self.lock:
+            controllers = list(self.controllers.values())
+            self.controllers.clear()
+        for controller in controllers:
+            controller.close()
+
+    def stats(self):
+        """ Returns the number of controllers created and reused """
+        return {"created": self.created, "reused": self.reused}
+
+
+# Controllers shared by the test cases of a session
+controller_pool = ControllerPool()
 
 
 class DeviceConfig:
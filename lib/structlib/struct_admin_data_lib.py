@@ -38,7 +38,7 @@ class NVMeManagementInterface(ctypes.Structure): #NVMe MI Figure 136
     """Structure representing NVMe Management Interface."""
     
     # _pack_ = 1
-    _fields_ = [("Reserved", ctypes.c_uint32 *13), #B252-240
+    _fields_ = [("Reserved", ctypes.c_uint8 *13), #B252-240
                 ("NVMSR", NVMSR), #B253 #NVM Subsystem Report
                 ("VWCI", VWCI), #B254 #VPD Write Cycle Information
                 ("MEC", MEC), #B255 #Management Endpoint Capabilities 
@@ -71,7 +71,7 @@ class IdentifyControllerData(ctypes.Structure): #Figure 247
                 ("CRDT1", ctypes.c_uint16), #129-128 #Command Retry Delay Time 1
                 ("CRDT2", ctypes.c_uint16), #131-130 #Command Retry Delay Time 2
                 ("CRDT3", ctypes.c_uint16), #133-132 #Command Retry Delay Time 3
-                ("Reserved2", ctypes.c_uint32*106), #239-134 #Reserved
+                ("Reserved2", ctypes.c_uint8*106), #239-134 #Reserved
                 ("NVMeManagementInterface", NVMeManagementInterface), #255-240 #NVMe Management Interface Identify Controller
                 ("OACS", ctypes.c_uint16), #B257-256 #Optional Admin Command Support
                 ("ACL", ctypes.c_uint8), #B258 #Abort Command Limit
@@ -90,3 +90,61 @@ class IdentifyControllerData(ctypes.Structure): #Figure 247
                 # Need to define from 280 Byte onwards Page 180 of Fig. 247
                 ("Remaining", ctypes.c_uint8 * 3816)
                 ]
+
+
+class LBAFormat(ctypes.Structure): #Figure 276
+    """Structure representing an LBA Format Data Structure."""
+
+    # _pack_ = 1
+    _fields_ = [("MS", ctypes.c_uint16), #B1-0 #Metadata Size
+                ("LBADS", ctypes.c_uint8), #B2 #LBA Data Size, as a power of two
+                ("RP", ctypes.c_uint8, 2), #B3 bits 1-0 #Relative Performance
+                ("Reserved", ctypes.c_uint8, 6), #B3 bits 7-2
+                ]
+
+
+class IdentifyNamespaceData(ctypes.Structure): #Figure 275
+    """Structure representing Identify Namespace Data."""
+
+    # _pack_ = 1
+    _fields_ = [("NSZE", ctypes.c_uint64), #B7-0 #Namespace Size
+                ("NCAP", ctypes.c_uint64), #B15-8 #Namespace Capacity
+                ("NUSE", ctypes.c_uint64), #B23-16 #Namespace Utilization
+                ("NSFEAT", ctypes.c_uint8), #B24 #Namespace Features
+                ("NLBAF", ctypes.c_uint8), #B25 #Number of LBA Formats
+                ("FLBAS", ctypes.c_uint8), #B26 #Formatted LBA Size
+                ("MC", ctypes.c_uint8), #B27 #Metadata Capabilities
+                ("DPC", ctypes.c_uint8), #B28 #End-to-end Data Protection Capabilities
+                ("DPS", ctypes.c_uint8), #B29 #End-to-end Data Protection Type Settings
+                ("NMIC", ctypes.c_uint8), #B30 #Namespace Multi-path I/O and Namespace Sharing Capabilities
+                ("RESCAP", ctypes.c_uint8), #B31 #Reservation Capabilities
+                ("FPI", ctypes.c_uint8), #B32 #Format Progress Indicator
+                ("DLFEAT", ctypes.c_uint8), #B33 #Deallocate Logical Block Features
+                ("NAWUN", ctypes.c_uint16), #B35-34 #Namespace Atomic Write Unit Normal
+                ("NAWUPF", ctypes.c_uint16), #B37-36 #Namespace Atomic Write Unit Power Fail
+                ("NACWU", ctypes.c_uint16), #B39-38 #Namespace Atomic Compare & Write Unit
+                ("NABSN", ctypes.c_uint16), #B41-40 #Namespace Atomic Boundary Size Normal
+                ("NABO", ctypes.c_uint16), #B43-42 #Namespace Atomic Boundary Offset
+                ("NABSPF", ctypes.c_uint16), #B45-44 #Namespace Atomic Boundary Size Power Fail
+                ("NOIOB", ctypes.c_uint16), #B47-46 #Namespace Optimal I/O Boundary
+                ("NVMCAP", ctypes.c_uint64*2), #B63-48 #NVM Capacity
+                ("NPWG", ctypes.c_uint16), #B65-64 #Namespace Preferred Write Granularity
+                ("NPWA", ctypes.c_uint16), #B67-66 #Namespace Preferred Write Alignment
+                ("NPDG", ctypes.c_uint16), #B69-68 #Namespace Preferred Deallocate Granularity
+                ("NPDA", ctypes.c_uint16), #B71-70 #Namespace Preferred Deallocate Alignment
+                ("NOWS", ctypes.c_uint16), #B73-72 #Namespace Optimal Write Size
+                # Need to define from 74 Byte onwards
+                ("Reserved1", ctypes.c_uint8*54), #B127-74
+                ("LBAF", LBAFormat*64), #B383-128 #LBA Format Support
+                ("Remaining", ctypes.c_uint8 * 3712)
+                ]
+
+    @property
+    def lba_format(self):
+        """ Index of the formatted LBA Format, FLBAS bits 3:0 and 6:5 """
+        return (self.FLBAS & 0x0F) | ((self.FLBAS >> 1) & 0x30)
+
+    @property
+    def lba_size(self):
+        """ Block size of the formatted LBA Format in bytes """
+        return 2**self.LBAF[self.lba_format].LBADS
@@ -125,6 +125,29 @@ class GenericCommand(ctypes.Structure):
                 ]
 
 
+class GenericCommand64(ctypes.Structure):
+    """GenericCommand structure with a 64 bit result, as used by the 64 bit
+    passthru ioctls (struct nvme_passthru_cmd64)."""
+
+    # _pack_ = 1
+    _fields_ = [("cdw0", CDW0),  # 0 - 3
+                ("NSID", ctypes.c_uint32),  # 4 - 7
+                ("cdw2", CDW2),  # 8 - 11
+                ("cdw3", CDW3),  # 12 - 15
+                ("mptr", ctypes.c_uint64),  # 16 - 23
+                ("dptr", DPTR),  # 24 - 39
+                ("cdw10", CDW10),  # 40 - 43
+                ("cdw11", CDW11),  # 44 - 47
+                ("cdw12", CDW12),  # 48 - 51
+                ("cdw13", CDW13),  # 52 - 55
+                ("cdw14", CDW14),  # 56 - 59
+                ("cdw15", CDW15),  # 60 - 63
+                ("timeout_ms", ctypes.c_uint32),
+                ("rsvd2", ctypes.c_uint32),
+                ("result", ctypes.c_uint64),
+                ]
+
+
 class StatusField(ctypes.Structure):
     """StatusField structure."""
 
@@ -0,0 +1,273 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Codec structures library.
+
+Precompiled struct codecs for the submission and completion queue entries.
+A whole SQE is packed into a GenericCommand, and a whole Response is filled
+or read, with a single pack_into/unpack_from call instead of a Python level
+attribute access per field of the nested ctypes structures.
+
+For batches, commands are kept in a contiguous ctypes array (for example
+NVMeCommand * n) which is filled from a template command in one copy, after
+which only the fields varying between the commands are packed, and whose
+statuses are read in one pass.
+
+The codecs write the memory of the ctypes structures directly, so both can
+be used on the same command. Status codes are in the format returned by the
+application libraries: SC in bits 7:0, SCT in 10:8, CRD in 12:11, M in 13
+and DNR in 14, which is the status field of the CQE shifted right by one.
+"""
+
+import array
+import ctypes
+import struct
+import sys
+sys.path.insert(1, "./")
+from lib.structlib.struct_base_lib import GenericCommand, Response
+
+# OPC, FUSE/PSDT, CID, NSID, CDW2, CDW3, MPTR, DPTR (addr, metadata_len, data_len),
+# CDW10 - CDW15. The first 64 bytes of GenericCommand.
+SQE = struct.Struct("<BBHIIIQQIIIIIIII")
+# DW0-1 (command specific), SQHD, SQID, CID, status field with the phase tag
+# in bit 0. The CQE as transferred by the controller.
+CQE = struct.Struct("<QHHHH")
+# Command specific, SQID, SQHD, DNR/M/CRD/SCT bits, SC, phase tag, CID.
+# The memory layout of the Response structure.
+RESPONSE = struct.Struct("<QHHBBBxH6x")
+# Status field bytes of the Response structure
+STATUS = struct.Struct("<BB")
+STATUS_OFFSET = Response.sf.offset
+# Data pointer, timeout and result of GenericCommand
+DPTR = struct.Struct("<QII")
+DPTR_OFFSET = GenericCommand.dptr.offset
+TIMEOUT_RESULT = struct.Struct("<II")
+TIMEOUT_OFFSET = GenericCommand.timeout_ms.offset
+# Opcode and NSID, CID of GenericCommand
+OPC_NSID = struct.Struct("<BxxxI")
+CID = struct.Struct("<2xH")
+
+# SLBA (CDW10-11) and NLB (CDW12) of I/O commands
+LBA_RANGE_OFFSET = GenericCommand.cdw10.offset
+CDW12_OFFSET = GenericCommand.cdw12.offset
+
+# DNR, M, CRD and SCT (bits 14:8 of a status code) to the first byte of
+# StatusField, and back
+SF_BYTE = tuple((value >> 6 & 0x1) | (value >> 5 & 0x1) << 1 | (value >> 3 & 0x3) << 2
+                | (value & 0x7) << 4 for value in range(128))
+SF_STATUS = {sf: value << 8 for value, sf in enumerate(SF_BYTE)}
+SF_BYTE_STATUS = tuple(SF_STATUS[sf & 0x7F] for sf in range(256))
+
+
+def check_layout():
+    """Verifies that the codecs match the ctypes structures.
+
+    Raises:
+        AssertionError: If a structure was changed without its codec.
+    """
+    assert SQE.size == GenericCommand.cdw15.offset + 4
+    assert RESPONSE.size == ctypes.sizeof(Response)
+    assert (Response.SQID.offset, Response.SQHD.offset, Response.CID.offset) == (8, 10, 16)
+    assert TIMEOUT_OFFSET == SQE.size and DPTR_OFFSET == 24
+    # Fields written through strided views of command arrays must be aligned
+    assert LBA_RANGE_OFFSET % 8 == 0 and STATUS_OFFSET % 2 == 0
+
+    response = Response()
+    response.sf.DNR, response.sf.M, response.sf.CRD, response.sf.SCT, response.sf.SC = 1, 0, 2, 5, 0x81
+    assert decode_status(response) == 0x5581
+
+
+def pack_sqe(command, opcode, nsid=0, cdw10=0, cdw11=0, cdw12=0, cdw13=0, cdw14=0, cdw15=0,
+             addr=0, data_len=0, cid=0, flags=0, cdw2=0, cdw3=0, mptr=0, metadata_len=0):
+    """Packs a whole SQE into the command, all fields not given are cleared.
+
+    Args:
+        command: GenericCommand, or any structure or buffer starting with it
+            (e.g. NVMeCmdStruct, NVMeCommand).
+        opcode (int): Opcode of the command.
+        nsid (int, optional): Namespace ID.
+        cdw10 - cdw15 (int, optional): Command dwords 10 to 15.
+        addr (int, optional): Address of the data buffer.
+        data_len (int, optional): Length of the data.
+        cid (int, optional): Command identifier.
+        flags (int, optional): FUSE (bits 1:0) and PSDT (bits 7:6).
+        cdw2, cdw3 (int, optional): Command dwords 2 and 3.
+        mptr (int, optional): Metadata pointer.
+        metadata_len (int, optional): Length of the metadata.
+    """
+    SQE.pack_into(command, 0, opcode, flags, cid, nsid, cdw2, cdw3, mptr, addr, metadata_len,
+                  data_len, cdw10, cdw11, cdw12, cdw13, cdw14, cdw15)
+
+
+def unpack_sqe(command):
+    """Reads a whole SQE.
+
+    Args:
+        command: GenericCommand, or any structure or buffer starting with it.
+
+    Returns:
+        Tuple[int]: OPC, FUSE/PSDT, CID, NSID, CDW2, CDW3, MPTR, data address,
+            metadata length, data length, CDW10 - CDW15.
+    """
+    return SQE.unpack_from(command)
+
+
+def opcode_nsid(command):
+    """ Opcode and NSID of the command """
+    return OPC_NSID.unpack_from(command)
+
+
+def set_data(command, addr, data_len):
+    """ Sets the data pointer (SGL address and length) of the command """
+    DPTR.pack_into(command, DPTR_OFFSET, addr, 0, data_len)
+
+
+def encode_status(response, status):
+    """Fills the status field of the Response.
+
+    Args:
+        response (Response): Structure to fill.
+        status (int): Status code, see the module documentation.
+    """
+    STATUS.pack_into(response, STATUS_OFFSET, SF_BYTE[status >> 8 & 0x7F], status & 0xFF)
+
+
+def decode_status(response):
+    """ Status code of the Response, see the module documentation """
+    sf, sc = STATUS.unpack_from(response, STATUS_OFFSET)
+    return SF_STATUS[sf & 0x7F] | sc
+
+
+def encode_response(response, status=0, result=0, cid=0, sqid=0, sqhd=0, phase=0):
+    """Fills the whole Response.
+
+    Args:
+        response (Response): Structure to fill.
+        status (int, optional): Status code, see the module documentation.
+        result (int, optional): Command specific result (DW0-1).
+        cid (int, optional): Command identifier.
+        sqid (int, optional): Submission queue identifier.
+        sqhd (int, optional): Submission queue head pointer.
+        phase (int, optional): Phase tag.
+    """
+    RESPONSE.pack_into(response, 0, result, sqid, sqhd, SF_BYTE[status >> 8 & 0x7F],
+                       status & 0xFF, phase, cid)
+
+
+def decode_response(response):
+    """Reads the whole Response.
+
+    Args:
+        response (Response): Structure to read.
+
+    Returns:
+        Tuple[int]: Status code, command specific result, CID, SQID, SQHD, phase tag.
+    """
+    result, sqid, sqhd, sf, sc, phase, cid = RESPONSE.unpack_from(response)
+    return SF_STATUS[sf & 0x7F] | sc, result, cid, sqid, sqhd, phase & 0x01
+
+
+def complete_response(response, command, status, result=None):
+    """Fills the Response of a completed command: result, CID of the command
+        and status. The status is left unchanged if it is a negative errno,
+        the command did not reach the controller.
+
+    Args:
+        response (Response): Structure to fill.
+        command: GenericCommand the response is for.
+        status (int): Status code or negative errno.
+        result (int, optional): Command specific result. Left unchanged if None.
+    """
+    old_result, sqid, sqhd, sf, sc, phase, _ = RESPONSE.unpack_from(response)
+    if status >= 0:
+        sf, sc = SF_BYTE[status >> 8 & 0x7F], status & 0xFF
+    RESPONSE.pack_into(response, 0, old_result if result is None else result, sqid, sqhd,
+                       sf, sc, phase, CID.unpack_from(command)[0])
+
+
+def pack_cqe(response):
+    """ CQE as transferred by the controller, from the Response """
+    status, result, cid, sqid, sqhd, phase = decode_response(response)
+    return CQE.pack(result, sqhd, sqid, cid, status << 1 | phase)
+
+
+def unpack_cqe(cqe, response, offset=0):
+    """Fills the Response from a CQE as transferred by the controller.
+
+    Args:
+        cqe: Buffer containing the CQE.
+        response (Response): Structure to fill.
+        offset (int, optional): Offset of the CQE in the buffer.
+    """
+    result, sqhd, sqid, cid, status = CQE.unpack_from(cqe, offset)
+    encode_response(response, status >> 1, result, cid, sqid, sqhd, status & 0x01)
+
+
+def replicate(template, count):
+    """Creates a contiguous array of commands, each a copy of the template.
+
+    Args:
+        template: Command to copy (e.g. NVMeCommand).
+        count (int): Number of commands.
+
+    Returns:
+        ctypes.Array: The commands. The array can be indexed and iterated as
+            a list of commands, e.g. for submit_batch.
+    """
+    commands = (type(template) * count)()
+    ctypes.memmove(commands, bytes(template) * count, ctypes.sizeof(commands))
+    return commands
+
+
+def set_lba_ranges(commands, slbas, nlb, buffers=None, buff_size=0):
+    """Sets the LBA range, and optionally the data buffer, of each command of
+        an array. Each field is written for all commands at once, through a
+        strided view of the array.
+
+    Args:
+        commands (ctypes.Array): Array of NVMeCommand.
+        slbas (Iterable[int]): Starting LBA of each command, one per command.
+        nlb (int): Number of logical blocks of each command (1 based). The
+            other fields of CDW12 are kept from the first command.
+        buffers (Iterable[int], optional): Address of the data buffer of each
+            command, one per command.
+        buff_size (int, optional): Size of the data buffers.
+
+    Raises:
+        ValueError: If slbas or buffers do not have one value per command.
+    """
+    count = len(commands)
+    if not count:
+        return
+    command_type = commands._type_
+    stride = ctypes.sizeof(command_type)
+    view = memoryview(commands).cast("B")
+    qwords, dwords = view.cast("Q"), view.cast("I")
+
+    cdw12 = dwords[CDW12_OFFSET // 4]
+    qwords[LBA_RANGE_OFFSET // 8::stride // 8] = array.array("Q", slbas)
+    dwords[CDW12_OFFSET // 4::stride // 4] = array.array("I", [(cdw12 & 0xFFFF0000) | (nlb - 1)]) * count
+    if buffers is not None:
+        qwords[command_type.buff.offset // 8::stride // 8] = array.array("Q", buffers)
+        dwords[command_type.buff_size.offset // 4::stride // 4] = array.array("I", [buff_size]) * count
+
+
+def decode_statuses(commands):
+    """Status codes of all commands of an array.
+
+    Args:
+        commands (ctypes.Array): Array of NVMeCommand.
+
+    Returns:
+        List[int]: Status code of each command, see the module documentation.
+    """
+    if not len(commands):
+        return []
+    command_type = commands._type_
+    offset = command_type.rsp.offset + STATUS_OFFSET
+    fields = memoryview(commands).cast("B").cast("H")[offset // 2::ctypes.sizeof(command_type) // 2]
+    return [SF_BYTE_STATUS[field & 0xFF] | field >> 8 for field in fields]
+
+
+check_layout()
@@ -257,7 +257,7 @@ class NVMF_DISCOVERY_LOG(ctypes.Structure):
     """
 
     # _pack_ = 1
-    _fields = [("genctr", ctypes.c_uint64),
+    _fields_ = [("genctr", ctypes.c_uint64),
                 ("numrec", ctypes.c_uint64),
                 ("recfmt", ctypes.c_uint16),
                 ("rsvd14", ctypes.c_uint8 * 1006),
@@ -0,0 +1,164 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Network namespace library.
+
+Library that isolates a target behind a veth pair in its own network
+namespace, so that link faults are injected on the pair only instead of the
+interface of the host's default route.
+
+    host (init namespace)                 namespace <name>
+    <name>-h  <host_addr>  <--- veth --->  <name>-t  <target_addr>
+                                           target process
+
+The target is a userspace process run in the namespace (for example SPDK
+nvmf_tgt, or any NVMe/TCP target listening on <target_addr>). The kernel NVMe
+target cannot be used: nvmet-tcp listens in the initial namespace only, where
+the host's traffic to it would never cross the veth pair.
+
+Each harness uses its own namespace and subnet, derived from its index, so
+several harnesses can be used in parallel on one host.
+"""
+
+import shlex
+import socket
+import subprocess
+import sys
+import time
+sys.path.insert(1, "./")
+from src.macros import *
+from utils.logging_module import logger
+from lib.syslib.system_lib import SystemLib
+
+
+class NetnsHarness():
+    """
+    Network namespace with a veth pair to the host and a target process.
+
+    Attributes:
+        name (str): Name of the namespace, prefix of the veth interfaces.
+        host_if (str): Host side of the veth pair. Faults are injected on it.
+        target_if (str): Namespace side of the veth pair.
+        host_addr (str): Address of the host side.
+        target_addr (str): Address of the namespace side, where the target listens.
+        target (subprocess.Popen): The target process, None if not started.
+    """
+
+    def __init__(self, index=0, prefix=NETNS_PREFIX) -> None:
+        """Constructor
+
+        Args:
+            index (int, optional): Index of the harness, selects the namespace
+                name and the 10.<NETNS_SUBNET>.<index>.0/30 subnet. Defaults to 0.
+            prefix (str, optional): Prefix of the namespace name.
+        """
+        self.name = f"{prefix}{index}"
+        self.host_if = f"{self.name}-h"
+        self.target_if = f"{self.name}-t"
+        self.host_addr = f"10.{NETNS_SUBNET}.{index}.1"
+        self.target_addr = f"10.{NETNS_SUBNET}.{index}.2"
+        self.target = None
+        self.sys = SystemLib()
+
+    def __enter__(self):
+        self.setup()
+        return self
+
+    def __exit__(self, *exc):
+        self.teardown()
+
+    def netns_exec(self, argv):
+        """ Command prefix to execute argv in the namespace """
+        return ["ip", "netns", "exec", self.name] + list(argv)
+
+    def setup(self):
+        """Creates the namespace and the veth pair, left over ones being removed first.
+
+        Returns:
+            int: Status Code of the execution
+        """
+        logger.info(f"-- Setting up network namespace {self.name}")
+        self.remove()
+        steps = [
+            ["ip", "netns", "add", self.name],
+            ["ip", "link", "add", self.host_if, "type", "veth", "peer", "name", self.target_if],
+            ["ip", "link", "set", self.target_if, "netns", self.name],
+            ["ip", "addr", "add", f"{self.host_addr}/30", "dev", self.host_if],
+            ["ip", "link", "set", self.host_if, "up"],
+            self.netns_exec(["ip", "addr", "add", f"{self.target_addr}/30", "dev", self.target_if]),
+            self.netns_exec(["ip", "link", "set", self.target_if, "up"]),
+            self.netns_exec(["ip", "link", "set", "lo", "up"]),
+        ]
+        for argv in steps:
+            status = self.sys.execute_cmd(argv)
+            if status != 0:
+                logger.error(f"-- Network namespace setup failed: {self.sys.stderr}")
+                self.remove()
+                return status
+        return 0
+
+    def start_target(self, command, svcid, timeout=10):
+        """Starts the target process in the namespace and waits until it listens.
+
+        Args:
+            command (str): Command of the target. "{addr}" and "{svcid}" are
+                replaced by the address and port the target has to listen on.
+            svcid (str): Port of the target.
+            timeout (float, optional): Seconds to wait for the target to listen.
+
+        Returns:
+            int: 0 if the target listens, 1 otherwise.
+        """
+        argv = shlex.split(command.format(addr=self.target_addr, svcid=svcid))
+        logger.info(f"-- Starting target in {self.name}: {argv}")
+        self.target = SystemLib.spawn(self.netns_exec(argv), stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.target.poll() is not None:
+                logger.error(f"-- Target exited with {self.target.returncode}")
+                return 1
+            try:
+                with socket.create_connection((self.target_addr, int(svcid)), timeout=1):
+                    return 0
+            except OSError:
+                time.sleep(0.05)
+        logger.error(f"-- Target not listening on {self.target_addr}:{svcid}")
+        return 1
+
+    def stop_target(self):
+        """ Stops the target process """
+        if self.target and self.target.poll() is None:
+            self.target.terminate()
+            try:
+                self.target.wait(5)
+            except subprocess.TimeoutExpired:
+                self.target.kill()
+                self.target.wait()
+        self.target = None
+
+    def set_link(self, mode):
+        """Sets the host side of the veth pair up or down.
+
+        Args:
+            mode: String "up" or "down" indicating what the link should be set to.
+
+        Returns:
+            int: Status Code of the execution
+        """
+        return self.sys.set_link(mode, self.host_if)
+
+    def remove(self):
+        """ Removes the namespace, which also removes the veth pair """
+        if SystemLib.run(["ip", "netns", "pids", self.name]).ret_code == 0:
+            self.sys.execute_cmd(["ip", "netns", "del", self.name])
+        if SystemLib.run(["ip", "link", "show", self.host_if]).ret_code == 0:
+            self.sys.execute_cmd(["ip", "link", "del", self.host_if])
+
+    def teardown(self):
+        """ Stops the target and removes the namespace """
+        logger.info(f"-- Removing network namespace {self.name}")
+        self.stop_target()
+        self.remove()
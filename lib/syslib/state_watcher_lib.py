@@ -0,0 +1,172 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Controller state watcher library.
+
+Library that waits for NVMe controller state transitions ("live",
+"connecting", "resetting", "deleting", ...) without sleeping for fixed times.
+
+The state attribute of the controller (/sys/class/nvme/nvmeX/state) is polled
+for sysfs notifications, and kernel uevents of the nvme class wake the watcher
+as well. As not every kernel notifies every state change, the attribute is
+also re-read at a short interval, which bounds the latency of a wake-up.
+Every observed transition is recorded with its timestamp.
+"""
+
+import os
+import select
+import socket
+import sys
+import time
+sys.path.insert(1, "./")
+from src.macros import *
+from utils.logging_module import logger
+from lib.syslib.topology_lib import SysfsController, topology
+
+
+class StateWatcher():
+    """
+    Waits for state transitions of NVMe controllers.
+
+    Attributes:
+        topology (Topology): Topology in which controllers are looked up.
+        poll_interval (float): Seconds after which the state is re-read if no
+            notification arrived.
+        transitions (dict): Per controller name, list of (timestamp, state)
+            observed. Timestamps are from time.perf_counter(), a state of None
+            means the controller was removed.
+    """
+
+    def __init__(self, topo=topology, poll_interval=STATE_POLL_INTERVAL) -> None:
+        """ Constructor """
+        self.topology = topo
+        self.poll_interval = poll_interval
+        self.transitions = {}
+        self.uevents = StateWatcher.open_uevent_socket()
+
+    @staticmethod
+    def open_uevent_socket():
+        """Subscribes to the kernel uevents.
+
+        Returns:
+            socket.socket: Non blocking netlink socket, None if not available.
+        """
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK,
+                                 NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, 1))
+            return sock
+        except (OSError, AttributeError) as e:
+            logger.debug(f"-- uevents not available, polling the state only: {e}")
+            return None
+
+    def close(self):
+        """ Closes the uevent socket """
+        if self.uevents:
+            self.uevents.close()
+            self.uevents = None
+
+    def drain_uevents(self):
+        """Reads the pending uevents.
+
+        Returns:
+            bool: True if any event was of an NVMe controller.
+        """
+        nvme_event = False
+        while True:
+            try:
+                event = self.uevents.recv(8192)
+            except OSError:
+                # Nothing pending (EAGAIN)
+                return nvme_event
+            nvme_event = nvme_event or b"SUBSYSTEM=nvme" in event
+
+    def record(self, name, state, timestamp):
+        """ Records the state if it changed since the last observation """
+        history = self.transitions.setdefault(name, [])
+        if not history or history[-1][1] != state:
+            history.append((timestamp, state))
+            logger.info(f"-- {name} state: {state}")
+
+    def last_transition(self, ctrl):
+        """Returns the last observed transition of the controller.
+
+        Returns:
+            Tuple[float, str]: Timestamp and state, None if none observed.
+        """
+        name = ctrl.name if isinstance(ctrl, SysfsController) else os.path.basename(ctrl)
+        history = self.transitions.get(name)
+        return history[-1] if history else None
+
+    def wait_for_state(self, ctrl, states, timeout=None):
+        """Waits until the controller is in one of the given states.
+
+        Args:
+            ctrl (SysfsController | str): The controller, its name or device path.
+            states (str | Iterable[str]): State(s) to wait for, e.g. "live" or
+                ("connecting", "resetting").
+            timeout (float, optional): Seconds to wait at most. Defaults to None
+                (wait forever).
+
+        Returns:
+            float: time.perf_counter() timestamp at which the state was
+                observed, None if the timeout expired first.
+        """
+        states = {states} if isinstance(states, str) else set(states)
+        if not isinstance(ctrl, SysfsController):
+            ctrl = self.topology.controller(ctrl)
+            if ctrl is None:
+                logger.warning("-- Controller not found")
+                return None
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        poller = select.poll()
+        if self.uevents:
+            poller.register(self.uevents, select.POLLIN)
+        fd = None
+        try:
+            while True:
+                if fd is None:
+                    fd = self.open_state(ctrl.name)
+                    if fd is not None:
+                        poller.register(fd, select.POLLPRI | select.POLLERR)
+                state = None
+                if fd is not None:
+                    try:
+                        state = os.pread(fd, 64, 0).decode().strip()
+                    except OSError:
+                        # Controller removed, reopened once it is re-created
+                        poller.unregister(fd)
+                        os.close(fd)
+                        fd = None
+                now = time.perf_counter()
+                self.record(ctrl.name, state, now)
+                if state in states:
+                    return now
+
+                wait = self.poll_interval
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = min(wait, deadline - now)
+                for event_fd, _ in poller.poll(wait * 1000):
+                    if self.uevents and event_fd == self.uevents.fileno():
+                        self.drain_uevents()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def open_state(self, name):
+        """Opens the state attribute of the controller.
+
+        Returns:
+            int: The descriptor, None if the controller does not exist.
+        """
+        ctrl = self.topology.refresh().controllers.get(name)
+        if ctrl is None:
+            return None
+        try:
+            return os.open(os.path.join(ctrl.path, "state"), os.O_RDONLY)
+        except OSError:
+            return None
@@ -1,7 +1,7 @@
 # Copyright (c) 2024 Samsung Electronics Corporation
 # SPDX-License-Identifier: BSD-2-Clause
 
-""" 
+"""
 System interface library.
 
 Library that provides an interface for runnning system commands.
@@ -10,44 +10,284 @@ This library is designed to be used in the framework that requires interaction
 with the system for any network, driver or miscellenous requirements.
 """
 
+import concurrent.futures
+import os
+import selectors
+import shutil
 import sys
 sys.path.insert(1, "./")
 import subprocess
+import threading
+import time
+from time import sleep as time_sleep
 from utils.logging_module import logger
 
 
+class CommandResult():
+    """
+    Result of an executed command.
+
+    Attributes:
+        argv (List[str] | str): The command which was executed.
+        ret_code (int): Return code of the process. Negative if killed by a signal.
+        stdout (bytes): Captured standard output.
+        stderr (bytes): Captured standard error.
+        timed_out (bool): True if the command was killed on timeout.
+        duration (float): Wall time of the execution in seconds.
+        received (int): Bytes of output the command produced when it was read
+            into a buffer instead of stdout (see SystemLib.run_into). None otherwise.
+    """
+
+    def __init__(self, argv, ret_code=0, stdout=b"", stderr=b"", timed_out=False, duration=0.0,
+                 received=None):
+        """ Constructor """
+        self.argv = argv
+        self.ret_code = ret_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.duration = duration
+        self.received = received
+
+    @property
+    def status(self):
+        """ 0 if the command execution is successful, return code otherwise """
+        if self.ret_code != 0 and (len(self.stderr) != 0 or self.timed_out):
+            return self.ret_code
+        return 0
+
+    def first_error_line(self):
+        """ First line of stderr, used for logging failures """
+        return self.stderr[:self.stderr.find(b'\n')] if b'\n' in self.stderr else self.stderr
+
+
 class SystemLib():
-    
+
+    # Absolute paths of executables, resolved once per process
+    executables = {}
+
     def __init__(self) -> None:
         """
         Initialize attributes for the System Library
         """
         self.stdout = None
         self.stderr = None
+        self.ret_code = 0
+
+    def reset(self):
+        """ Clears the state left by previously executed commands """
+        self.stdout = None
+        self.stderr = None
+        self.ret_code = 0
+
+    @staticmethod
+    def resolve_executable(name):
+        """Resolves the absolute path of an executable once per process.
+            Spawning by absolute path lets subprocess use posix_spawn.
+
+        Args:
+            name (str): Name or path of the executable.
+
+        Returns:
+            str: Absolute path to the executable, or the name if not found in PATH.
+        """
+        path = SystemLib.executables.get(name)
+        if not path:
+            path = shutil.which(name) or shutil.which(name, path="/usr/sbin:/sbin") or name
+            SystemLib.executables[name] = path
+        return path
+
+    @staticmethod
+    def run_in_thread(function, *args, name="nvme-async"):
+        """Runs the function in a new daemon thread.
+            A command blocked in the driver (e.g. an outstanding AER) cannot be
+            interrupted, and the threads of concurrent.futures executors are
+            joined at interpreter exit. A daemon thread is left behind instead.
+
+        Args:
+            function: Function to run.
+            args: Arguments of the function.
+            name (str, optional): Name of the thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the return value of the function.
+        """
+        future = concurrent.futures.Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=name, daemon=True).start()
+        return future
+
+    @staticmethod
+    def spawn(argv, stdin=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=()):
+        """Starts the command without a shell.
+
+        Args:
+            argv (List[str]): Command and its arguments.
+            stdin, stdout, stderr: Same as subprocess.Popen. Defaults to pipes
+                for the outputs.
+            pass_fds (Tuple[int], optional): Descriptors to keep open in the child.
+
+        Returns:
+            subprocess.Popen: The started process.
+        """
+        argv = [SystemLib.resolve_executable(argv[0])] + list(argv[1:])
+        # Without descriptors to pass, close_fds=False allows posix_spawn. Descriptors
+        # created by Python are non-inheritable, so nothing else leaks to the child.
+        return subprocess.Popen(argv, stdin=stdin, stdout=stdout, stderr=stderr,
+                                close_fds=bool(pass_fds), pass_fds=pass_fds)
+
+    @staticmethod
+    def not_found(argv, error, received=None):
+        """Result of a command whose executable does not exist, with the
+            status 127 a shell reports for it.
+
+        Args:
+            argv (List[str]): Command and its arguments.
+            error (FileNotFoundError): Error raised when starting the command.
+            received (int, optional): See CommandResult.
+
+        Returns:
+            CommandResult: Return code 127 and the error message in stderr.
+        """
+        return CommandResult(argv, 127, b"", f"{argv[0]}: {error.strerror}\n".encode(),
+                             received=received)
+
+    @staticmethod
+    def run(argv, timeout=None, input=None, pass_fds=()):
+        """Executes the command without a shell and captures its output.
+
+        Args:
+            argv (List[str]): Command and its arguments.
+            timeout (float, optional): Seconds after which the command is killed.
+                Defaults to None (no timeout).
+            input (bytes, optional): Data written to the command's stdin.
+            pass_fds (Tuple[int], optional): Descriptors to keep open in the child.
+
+        Returns:
+            CommandResult: Return code, output and timing of the command. Return
+                code 127 if the executable does not exist.
+        """
+        start = time.perf_counter()
+        try:
+            process = SystemLib.spawn(argv, stdin=subprocess.PIPE if input is not None else None,
+                                      pass_fds=pass_fds)
+        except FileNotFoundError as e:
+            return SystemLib.not_found(argv, e)
+        timed_out = False
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            stdout, stderr = process.communicate()
+            timed_out = True
+        return CommandResult(argv, process.returncode, stdout, stderr, timed_out,
+                             time.perf_counter() - start)
+
+    @staticmethod
+    def run_into(argv, output, timeout=None, pass_fds=()):
+        """Executes the command without a shell and reads its output directly
+            into the given buffer, in chunks as the pipe delivers them. Output
+            beyond the size of the buffer is counted and discarded.
+
+        Args:
+            argv (List[str]): Command and its arguments.
+            output: Writable buffer (ctypes array, bytearray or memoryview).
+            timeout (float, optional): Seconds after which the command is killed.
+                Defaults to None (no timeout).
+            pass_fds (Tuple[int], optional): Descriptors to keep open in the child.
 
-    def execute_cmd(self, command):
+        Returns:
+            CommandResult: Return code, error output, bytes of output received
+                and timing of the command.
+        """
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        view = memoryview(output).cast("B")
+        try:
+            process = SystemLib.spawn(argv, pass_fds=pass_fds)
+        except FileNotFoundError as e:
+            return SystemLib.not_found(argv, e, received=0)
+
+        received = 0
+        stderr = []
+        timed_out = False
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ)
+            selector.register(process.stderr, selectors.EVENT_READ)
+            while selector.get_map():
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    timed_out = True
+                    process.kill()
+                    break
+                for key, _ in selector.select(remaining):
+                    fd = key.fileobj.fileno()
+                    if key.fileobj is process.stdout:
+                        if received < len(view):
+                            count = os.readv(fd, [view[received:]])
+                        else:
+                            count = len(os.read(fd, 65536))
+                        received += count
+                    else:
+                        chunk = os.read(fd, 65536)
+                        stderr.append(chunk)
+                        count = len(chunk)
+                    if count == 0:
+                        selector.unregister(key.fileobj)
+
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+        return CommandResult(argv, process.returncode, b"", b"".join(stderr), timed_out,
+                             time.perf_counter() - start, received)
+
+    @staticmethod
+    def log_result(result):
+        """Logs the outcome of the command.
+
+        Args:
+            result (CommandResult): Result of the command.
+
+        Returns:
+            int: 0 if the command execution is successful, return code otherwise.
+        """
+        if result.timed_out:
+            logger.warning(f"-- -- Command timed out after {result.duration:.3f}s")
+        elif result.status != 0:
+            logger.warning(f"-- -- Command execution failed: {result.first_error_line()}")
+        else:
+            logger.success("-- -- Command execution success")
+        return result.status
+
+    def execute_cmd(self, command, timeout=None):
         """
         Executes the given command and captures the stdout, stderr, and return code.
+        Commands given as a list are executed without a shell. Commands given as
+        a string are executed through the shell (for pipelines).
 
         Args:
-            command (str): The command to be executed.
-            async_run (bool, optional): If True, the command will be executed
-                asynchronously. Defaults to False.
+            command (List[str] | str): The command to be executed.
+            timeout (float, optional): Seconds after which the command is killed.
 
         Returns:
-            int: 0 if the command execution is successful, 1 otherwise.
+            int: 0 if the command execution is successful, return code otherwise.
         """
         logger.info("-- Executing Command: {}", command)
-        process = subprocess.Popen(
-            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-        self.stdout, self.stderr = process.communicate()
-        self.ret_code = process.returncode
+        if isinstance(command, str):
+            result = SystemLib.run(["/bin/sh", "-c", command], timeout=timeout)
+        else:
+            result = SystemLib.run(command, timeout=timeout)
 
-        if len(self.stderr) != 0 and self.ret_code != 0:
-            logger.warning(f"-- -- Command execution failed: {self.stderr[:112]}")
-            return self.ret_code
-        logger.success("-- -- Command execution success")
-        return 0
+        self.stdout, self.stderr, self.ret_code = result.stdout, result.stderr, result.ret_code
+        return SystemLib.log_result(result)
 
     def get_network_interface(self):
         """
@@ -59,12 +299,12 @@ class SystemLib():
         Returns:
             str: The active network interface name
         """
-        cmd = "route | grep \'^default\' | grep -o \'[^ ]*$\'"
+        self.execute_cmd(["ip", "route", "show", "default"])
 
-        self.execute_cmd(cmd)
+        # Format: "default via <gateway> dev <iface> ..."
+        words = self.stdout.decode().split()
+        return words[words.index("dev") + 1] if "dev" in words else ""
 
-        return self.stdout.decode()[:-1]
-    
     def set_link(self,  mode: str, iface: str):
         """
         Submits a system command to set the network interface
@@ -74,22 +314,82 @@ class SystemLib():
             mode: String "up" or "down indicating what the link
                 should be set to.
             iface: The network interface name whose link is to be set.
-                
+
         Returns:
             int: Status Code of the execution
         """
-        cmd = f"ip link set {iface} {mode.strip().lower()}"
-        return self.execute_cmd(cmd)
-    
+        return self.execute_cmd(["ip", "link", "set", iface, mode.strip().lower()])
+
+    @staticmethod
+    def netem_args(profile):
+        """
+        Translates a fault profile into the arguments of the netem queueing discipline.
+
+        Args:
+            profile (dict): Fault profile with any of the keys "delay_ms",
+                "jitter_ms", "loss_pct", "reorder_pct" and "rate" (e.g. "100mbit").
+
+        Returns:
+            List[str]: The netem arguments.
+
+        Raises:
+            ValueError: If reorder_pct or jitter_ms is given without a delay.
+                netem reorders packets by sending them without the delay of
+                the others, and jitter is a variation of the delay.
+        """
+        args = []
+        for name in ("reorder_pct", "jitter_ms"):
+            if profile.get(name) and not profile.get("delay_ms"):
+                raise ValueError(f"Fault profile {profile}: {name} requires a non-zero delay_ms")
+        if profile.get("delay_ms"):
+            args += ["delay", f"{profile['delay_ms']}ms"]
+            if profile.get("jitter_ms"):
+                args += [f"{profile['jitter_ms']}ms"]
+        if profile.get("loss_pct"):
+            args += ["loss", f"{profile['loss_pct']}%"]
+        if profile.get("reorder_pct"):
+            args += ["reorder", f"{profile['reorder_pct']}%"]
+        if profile.get("rate"):
+            args += ["rate", str(profile["rate"])]
+        return args
+
+    def set_fault_profile(self, iface: str, profile: dict):
+        """
+        Submits a system command to shape the egress traffic of the network
+        interface with netem: delay, jitter, loss, reordering and rate limit.
+        Replaces the profile previously set on the interface.
+
+        Args:
+            iface: The network interface name to be shaped.
+            profile: Fault profile, see netem_args.
+
+        Returns:
+            int: Status Code of the execution
+        """
+        return self.execute_cmd(["tc", "qdisc", "replace", "dev", iface, "root", "netem"]
+                                + SystemLib.netem_args(profile))
+
+    def clear_fault_profile(self, iface: str):
+        """
+        Submits a system command to remove the fault profile of the network interface.
+
+        Args:
+            iface: The network interface name.
+
+        Returns:
+            int: Status Code of the execution
+        """
+        return self.execute_cmd(["tc", "qdisc", "del", "dev", iface, "root"])
+
     def sleep(self, time: int):
         """
-        Submits a system command to sleep/wait for specified seconds.
+        Sleep/wait for specified seconds.
 
         Args:
             time: Time to sleep for in seconds
         Returns:
             int: Status Code of the execution
         """
-
-        cmd = f"sleep {time}"
-        return self.execute_cmd(cmd)
+        logger.info(f"-- Sleeping {time} seconds")
+        time_sleep(time)
+        return 0
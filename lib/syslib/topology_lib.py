@@ -0,0 +1,208 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+NVMe topology library.
+
+Library that reads the NVMe controllers and subsystems known to the host from
+sysfs (/sys/class/nvme and /sys/class/nvme-subsystem) into a model indexed by
+controller name, subsystem NQN and transport address.
+
+The model is refreshed incrementally: only controllers which appeared or were
+re-created since the last refresh are read. The state of a controller is read
+from its sysfs attribute on every query, so no process is spawned and no JSON
+is parsed to follow a controller.
+"""
+
+import os
+import re
+import sys
+sys.path.insert(1, "./")
+from utils.logging_module import logger
+
+
+def read_attribute(path):
+    """Reads a sysfs attribute.
+
+    Args:
+        path (str): Path to the attribute file.
+
+    Returns:
+        str: The stripped contents of the attribute, None if it cannot be read.
+    """
+    try:
+        with open(path, "rb", buffering=0) as f:
+            return f.read(4096).decode().strip()
+    except OSError:
+        return None
+
+
+class SysfsController():
+    """
+    NVMe controller as described by sysfs.
+
+    Attributes:
+        name (str): Controller name (nvmeX).
+        transport (str): Transport type ("tcp", "rdma", "loop", "pcie", ...).
+        address (str): Raw address attribute ("traddr=...,trsvcid=..." for fabrics).
+        traddr (str): Transport address. None if not a fabrics controller.
+        trsvcid (str): Transport service id. None if not given.
+        subsysnqn (str): NQN of the subsystem of the controller.
+        cntlid (int): Controller ID.
+        subsystem (str): Name of the subsystem (nvme-subsysX). None if not found.
+    """
+
+    def __init__(self, path, name, inode) -> None:
+        """ Reads the static attributes of the controller """
+        self.path = path
+        self.name = name
+        self.inode = inode
+        self.transport = read_attribute(os.path.join(path, "transport"))
+        self.address = read_attribute(os.path.join(path, "address")) or ""
+        self.subsysnqn = read_attribute(os.path.join(path, "subsysnqn"))
+        cntlid = read_attribute(os.path.join(path, "cntlid"))
+        self.cntlid = int(cntlid) if cntlid and cntlid.isdigit() else None
+        self.subsystem = None
+
+        fields = dict(item.split("=", 1) for item in self.address.split(",") if "=" in item)
+        self.traddr = fields.get("traddr")
+        self.trsvcid = fields.get("trsvcid")
+
+    @property
+    def dev_path(self):
+        """ Character device of the controller """
+        return "/dev/" + self.name
+
+    @property
+    def state(self):
+        """ Current state of the controller ("live", "connecting", ...), None if removed """
+        return read_attribute(os.path.join(self.path, "state"))
+
+    def __repr__(self):
+        return (f"SysfsController({self.name}, {self.transport}, {self.address!r}, "
+                f"{self.subsysnqn})")
+
+
+class Topology():
+    """
+    Model of the NVMe controllers and subsystems of the host.
+
+    Attributes:
+        sysfs (str): Mount point of sysfs. Defaults to "/sys".
+        controllers (dict): Controllers indexed by name.
+    """
+
+    def __init__(self, sysfs="/sys") -> None:
+        """ Constructor """
+        self.sysfs = sysfs
+        self.controllers = {}
+        self.by_nqn = {}
+        self.by_address = {}
+
+    def refresh(self):
+        """Updates the model from sysfs. Only controllers which are new or were
+            re-created since the last refresh are read.
+
+        Returns:
+            Topology: This object, to chain queries.
+        """
+        class_dir = os.path.join(self.sysfs, "class", "nvme")
+        found = {}
+        try:
+            with os.scandir(class_dir) as entries:
+                for entry in entries:
+                    found[entry.name] = entry.inode()
+        except FileNotFoundError:
+            pass
+
+        changed = found.keys() != self.controllers.keys()
+        controllers = {}
+        for name, inode in found.items():
+            ctrl = self.controllers.get(name)
+            if ctrl is None or ctrl.inode != inode:
+                ctrl = SysfsController(os.path.join(class_dir, name), name, inode)
+                changed = True
+            controllers[name] = ctrl
+
+        if changed:
+            self.controllers = controllers
+            self.index()
+        return self
+
+    def index(self):
+        """ Rebuilds the indexes and links the controllers to their subsystems """
+        subsys_dir = os.path.join(self.sysfs, "class", "nvme-subsystem")
+        try:
+            with os.scandir(subsys_dir) as subsystems:
+                for subsystem in subsystems:
+                    with os.scandir(subsystem.path) as entries:
+                        for entry in entries:
+                            if entry.name in self.controllers:
+                                self.controllers[entry.name].subsystem = subsystem.name
+        except OSError as e:
+            logger.debug(f"-- Reading NVMe subsystems failed: {e}")
+
+        self.by_nqn = {}
+        self.by_address = {}
+        for ctrl in self.controllers.values():
+            self.by_nqn.setdefault(ctrl.subsysnqn, []).append(ctrl)
+            key = (ctrl.transport, ctrl.traddr, ctrl.trsvcid)
+            self.by_address.setdefault(key, []).append(ctrl)
+
+    def names(self):
+        """ Names of the controllers of the host """
+        return self.controllers.keys()
+
+    def controller(self, name):
+        """Looks up a controller by name.
+
+        Args:
+            name (str): Controller name (nvmeX) or device path (/dev/nvmeX, /dev/nvmeXnY
+                or the generic device /dev/ngXnY).
+
+        Returns:
+            SysfsController: The controller, None if not found.
+        """
+        name = os.path.basename(name)
+        if name not in self.controllers:
+            match = re.match(r"\A(?:nvme|ng)([0-9]+)", name)
+            name = f"nvme{match.group(1)}" if match else name
+        ctrl = self.controllers.get(name)
+        if ctrl is None:
+            ctrl = self.refresh().controllers.get(name)
+        return ctrl
+
+    def find(self, nqn, transport=None, traddr=None, trsvcid=None):
+        """Looks up the controllers connected to a subsystem.
+
+        Args:
+            nqn (str): NQN of the subsystem.
+            transport, traddr, trsvcid (str, optional): Only controllers with
+                this transport address if given.
+
+        Returns:
+            List[SysfsController]: The controllers, sorted by name.
+        """
+        self.refresh()
+        if transport is None:
+            ctrls = self.by_nqn.get(nqn, [])
+        else:
+            ctrls = [ctrl for ctrl in self.by_address.get((transport, traddr, str(trsvcid)), [])
+                     if ctrl.subsysnqn == nqn]
+        return sorted(ctrls, key=lambda ctrl: int(ctrl.name[4:]) if ctrl.name[4:].isdigit() else 0)
+
+    def state(self, name):
+        """Reads the current state of a controller.
+
+        Args:
+            name (str): Controller name (nvmeX) or device path.
+
+        Returns:
+            str: The state ("live", "connecting", "resetting", ...), None if
+                the controller does not exist.
+        """
+        ctrl = self.controller(name)
+        return ctrl.state if ctrl else None
+
+
+topology = Topology()
@@ -0,0 +1,758 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+NVMe/TCP target library.
+
+Library that provides a lightweight userspace NVMe over TCP target, to test
+and benchmark the framework without a real NVMe-oF target. The kernel
+initiator (nvme connect) and therefore all application libraries can be run
+against it on localhost, or in the namespace of a NetnsHarness.
+
+Supported:
+- ICReq/ICResp, without header and data digests.
+- Fabrics Connect, Property Get/Set and Disconnect.
+- Admin Identify (CNS 00h-03h), Get Log Page (01h-03h, 05h, 70h), Get/Set
+  Features, Keep Alive (the keep alive timeout is enforced), Asynchronous
+  Event Request and Abort.
+- I/O Read, Write and Flush on one namespace, backed by a sparse anonymous
+  memory map or a memory mapped (sparse) file.
+- A discovery controller whose log page lists the subsystem.
+
+Usage (from project directory):
+    python lib/targetlib/nvme_tcp_target_lib.py --addr 127.0.0.1 --svcid 4420
+"""
+
+import argparse
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+sys.path.insert(1, "./")
+from src.macros import *
+from utils.logging_module import logger
+from lib.structlib.struct_admin_data_lib import IdentifyControllerData, IdentifyNamespaceData
+
+# NVMe/TCP PDU types and flags
+PDU_ICREQ                   = 0x00
+PDU_ICRESP                  = 0x01
+PDU_H2C_TERM_REQ            = 0x02
+PDU_C2H_TERM_REQ            = 0x03
+PDU_CAPSULE_CMD             = 0x04
+PDU_CAPSULE_RESP            = 0x05
+PDU_H2C_DATA                = 0x06
+PDU_C2H_DATA                = 0x07
+PDU_R2T                     = 0x09
+PDU_FLAG_DATA_LAST          = 1 << 2
+MAX_H2C_DATA                = 128 * 1024
+MAX_C2H_DATA                = 128 * 1024
+INLINE_DATA_SIZE            = 8192
+
+# Fabrics command types
+FCTYPE_PROPERTY_SET         = 0x00
+FCTYPE_CONNECT              = 0x01
+FCTYPE_PROPERTY_GET         = 0x04
+FCTYPE_DISCONNECT           = 0x08
+
+# Status codes, generic (SCT 0) unless noted
+SC_SUCCESS                  = 0x00
+SC_INVALID_OPCODE           = 0x01
+SC_INVALID_FIELD            = 0x02
+SC_SEQUENCE_ERROR           = 0x0C
+SC_INVALID_NS               = 0x0B
+SC_SGL_LENGTH_INVALID       = 0x0F
+SC_LBA_OUT_OF_RANGE         = 0x80
+SC_AER_LIMIT_EXCEEDED       = 0x105 # SCT 1
+SC_INVALID_LOG_PAGE         = 0x109 # SCT 1
+SC_NOT_SAVEABLE             = 0x10D # SCT 1
+SC_CONNECT_INVALID_PARAM    = 0x182 # SCT 1
+
+QUEUE_SIZE                  = 128
+MAX_IO_QUEUES               = 64
+AERL                        = 3
+TARGET_NQN                  = "nqn.2024-01.io.nvmfabtest:target"
+FEATURES = {0x01: 0, 0x02: 0, 0x04: 0x157, 0x05: 0, 0x07: 0, 0x08: 0, 0x0A: 0, 0x0B: 0, 0x0F: 0}
+
+
+def status(sc, dnr=True):
+    """ Status field of a completion, "sc" carrying the SCT in bits 10:8 """
+    return sc | (dnr << 14 if sc else 0)
+
+
+def cstr(data):
+    """ NUL terminated string of a fixed size field """
+    return bytes(data).split(b"\0", 1)[0].decode(errors="replace").strip()
+
+
+class Namespace():
+    """
+    Namespace backed by a sparse anonymous memory map, or by a memory mapped
+    file extended to the size of the namespace without allocating it.
+
+    Attributes:
+        lba_size (int): Size of a logical block.
+        nlb (int): Number of logical blocks.
+    """
+
+    def __init__(self, size, lba_size=512, path=None) -> None:
+        """ Constructor """
+        self.lba_size = lba_size
+        self.nlb = size // lba_size
+        size = self.nlb * lba_size
+        self.file = None
+        if path:
+            self.file = open(path, "a+b")
+            if os.fstat(self.file.fileno()).st_size < size:
+                self.file.truncate(size)
+            self.data = mmap.mmap(self.file.fileno(), size)
+        else:
+            self.data = mmap.mmap(-1, size)
+
+    def in_range(self, slba, nlb):
+        """ True if the blocks are in the namespace """
+        return slba + nlb <= self.nlb
+
+    def read(self, slba, nlb):
+        """ Data of the blocks """
+        return self.data[slba * self.lba_size:(slba + nlb) * self.lba_size]
+
+    def write(self, slba, data):
+        """ Writes the data from the first block """
+        self.data[slba * self.lba_size:slba * self.lba_size + len(data)] = data
+
+    def flush(self):
+        """ Writes the data to the backing file """
+        if self.file:
+            self.data.flush()
+
+    def close(self):
+        """ Unmaps the namespace """
+        self.data.close()
+        if self.file:
+            self.file.close()
+
+
+class TargetController():
+    """
+    Controller created by the Connect command of an admin queue.
+
+    Attributes:
+        cntlid (int): Controller ID.
+        subnqn (str): NQN of the subsystem (or the discovery subsystem).
+        hostnqn (str): NQN of the host.
+        kato (int): Keep Alive Timeout in milliseconds, 0 if disabled.
+        queues (list): Queues of the controller, the admin queue first.
+        aers (list): Outstanding Asynchronous Event Requests as (queue, CID).
+        events (list): Events (completion DW0) waiting for a request.
+    """
+
+    def __init__(self, target, cntlid, subnqn, hostnqn, kato) -> None:
+        """ Constructor """
+        self.target = target
+        self.cntlid = cntlid
+        self.subnqn = subnqn
+        self.hostnqn = hostnqn
+        self.discovery = subnqn == NVME_DISCOVERY_NQN
+        self.kato = kato
+        self.cc = 0
+        self.csts = 0
+        self.io_queues = 0
+        self.features = dict(FEATURES)
+        self.queues = []
+        self.aers = []
+        self.events = []
+        self.lock = threading.Lock()
+
+    def get_property(self, offset, size):
+        """ Value of a property, None for an invalid offset or size """
+        if offset == 0x00 and size == 8:
+            # CAP: MQES, CQR, TO = 15s, CSS = NVM command set
+            return (QUEUE_SIZE - 1) | (1 << 16) | (30 << 24) | (1 << 37)
+        if offset == 0x08 and size == 4:
+            return 0x10400
+        if offset == 0x14 and size == 4:
+            return self.cc
+        if offset == 0x1C and size == 4:
+            return self.csts
+        return None
+
+    def set_property(self, offset, size, value):
+        """ Sets a property. Returns False for an invalid offset or size """
+        if offset != 0x14 or size != 4:
+            return False
+        self.cc = value & 0xFFFFFFFF
+        # CSTS.RDY follows CC.EN, CSTS.SHST reports a completed shutdown
+        self.csts = (self.cc & 0x1) | (0x8 if (self.cc >> 14) & 0x3 else 0)
+        return True
+
+    def identify_controller(self):
+        """ Identify Controller data structure """
+        data = IdentifyControllerData()
+        data.SN = self.target.serial.encode().ljust(20)
+        data.MN = b"nvmFabTest NVMe/TCP target".ljust(40)
+        data.FR = b"1.0".ljust(8)
+        data.MDTS = 5
+        data.CNTLID = self.cntlid
+        data.VER = 0x10400
+        data.OAES = (1 << 31) if self.discovery else (1 << 8)
+        data.CNTRLTYPE = 2 if self.discovery else 1
+        data.AERL = AERL
+        data.LPA = 0x06
+        raw = bytearray(data)
+        struct.pack_into("<H", raw, 320, 1)                  # KAS, 100 ms
+        struct.pack_into("<BBHI", raw, 512, 0x66, 0x44, QUEUE_SIZE, 0 if self.discovery else 1)
+        struct.pack_into("<I", raw, 536, 0x100001)           # SGLS
+        raw[768:1024] = self.subnqn.encode().ljust(256, b"\0")
+        struct.pack_into("<IIHBB", raw, 1792, (64 + INLINE_DATA_SIZE) // 16, 1, 0, 0, 1)
+        return raw
+
+    def identify_namespace(self):
+        """ Identify Namespace data structure of namespace 1 """
+        ns = self.target.namespace
+        data = IdentifyNamespaceData()
+        data.NSZE = data.NCAP = data.NUSE = ns.nlb
+        data.LBAF[0].LBADS = ns.lba_size.bit_length() - 1
+        raw = bytearray(data)
+        raw[104:120] = self.target.nguid
+        return raw
+
+    def log_page(self, lid):
+        """ Contents of a log page, None if not supported """
+        if self.discovery:
+            return self.target.discovery_log() if lid == 0x70 else None
+        if lid == 0x01:
+            return bytes(64)
+        if lid == 0x02:
+            log = bytearray(512)
+            struct.pack_into("<BHBB", log, 0, 0, 313, 100, 10)
+            # Data Units Read and Written are 128 bit fields at bytes 32 and 48
+            struct.pack_into("<Q", log, 32, self.target.data_units[0])
+            struct.pack_into("<Q", log, 48, self.target.data_units[1])
+            return log
+        if lid == 0x03:
+            log = bytearray(512)
+            log[0] = 1
+            log[8:16] = b"1.0".ljust(8)
+            return log
+        if lid == 0x05:
+            log = bytearray(4096)
+            for opc in (0x02, 0x06, 0x08, 0x09, 0x0A, 0x0C, 0x18):
+                struct.pack_into("<I", log, opc * 4, 1)
+            for opc, effects in ((0x00, 1), (0x01, 3), (0x02, 1)):
+                struct.pack_into("<I", log, 1024 + opc * 4, effects)
+            return log
+        return None
+
+    def post_event(self, dw0):
+        """ Completes an outstanding Asynchronous Event Request, or keeps the event """
+        with self.lock:
+            if not self.aers:
+                self.events.append(dw0)
+                return
+            queue, cid = self.aers.pop(0)
+        queue.send_response(cid, SC_SUCCESS, dw0)
+
+    def close(self):
+        """ Closes all queues of the controller """
+        for queue in list(self.queues):
+            queue.close()
+
+
+class NVMeTCPQueue(socketserver.BaseRequestHandler):
+    """
+    Queue (TCP connection) of a controller. PDUs are handled in order, data
+    of commands without in-capsule data is requested with R2T PDUs.
+    """
+
+    def setup(self):
+        """ Initializes the queue """
+        self.target = self.server.target
+        self.ctrl = None
+        self.qid = None
+        self.sqhd = 0
+        self.hpda = 0
+        self.pending = {}
+        self.closing = False
+        self.send_lock = threading.Lock()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.target.queues.add(self)
+
+    def handle(self):
+        """ Initializes the connection and handles PDUs until it is closed """
+        try:
+            if not self.initialize():
+                return
+            while not self.closing:
+                pdu = self.recv_pdu()
+                if pdu is None:
+                    break
+                self.dispatch(*pdu)
+        except socket.timeout:
+            logger.warning(f"-- Target: keep alive timeout of controller {self.ctrl.cntlid}")
+        except OSError as e:
+            logger.debug(f"-- Target: queue {self.qid} closed: {e}")
+
+    def finish(self):
+        """ Removes the queue, and its controller if it is the admin queue """
+        self.target.queues.discard(self)
+        if self.ctrl is None:
+            return
+        if self in self.ctrl.queues:
+            self.ctrl.queues.remove(self)
+        if self.qid == 0:
+            self.target.remove_controller(self.ctrl)
+
+    def close(self):
+        """ Closes the connection, which ends the handling of the queue """
+        self.closing = True
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def recv_exact(self, size):
+        """ Receives exactly size bytes, None if the connection was closed """
+        buff = bytearray(size)
+        view = memoryview(buff)
+        received = 0
+        while received < size:
+            count = self.request.recv_into(view[received:])
+            if count == 0:
+                return None
+            received += count
+        return buff
+
+    def recv_pdu(self):
+        """ Receives a PDU. Returns its type, flags, HLEN, PDO, PLEN and bytes """
+        header = self.recv_exact(8)
+        if header is None:
+            return None
+        pdu_type, flags, hlen, pdo, plen = struct.unpack("<BBBBI", header)
+        rest = self.recv_exact(plen - 8) if plen > 8 else bytearray()
+        if rest is None:
+            return None
+        return pdu_type, flags, hlen, pdo, plen, header + rest
+
+    def send(self, *buffers):
+        """ Sends the buffers of a PDU """
+        with self.send_lock:
+            self.send_locked(buffers)
+
+    def send_locked(self, buffers):
+        """Sends the buffers with the send lock held. sendmsg may send only
+            part of them, as the socket has a timeout, so it is repeated with
+            the rest until everything is sent.
+        """
+        if self.closing:
+            return
+        views = [memoryview(buffer).cast("B") for buffer in buffers]
+        while views:
+            sent = self.request.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            if views:
+                views[0] = views[0][sent:]
+
+    def initialize(self):
+        """ Answers the ICReq with an ICResp """
+        pdu = self.recv_pdu()
+        if pdu is None or pdu[0] != PDU_ICREQ:
+            logger.warning("-- Target: connection not initialized with ICReq")
+            return False
+        pfv, self.hpda, digest, maxr2t = struct.unpack_from("<HBBI", pdu[5], 8)
+        if digest:
+            logger.warning("-- Target: header and data digests are not supported")
+        response = struct.pack("<BBBBIHBBI", PDU_ICRESP, 0, 128, 0, 128, 0, 0, 0, MAX_H2C_DATA)
+        self.send(response.ljust(128, b"\0"))
+        return True
+
+    def dispatch(self, pdu_type, flags, hlen, pdo, plen, pdu):
+        """ Handles a PDU of the host """
+        if pdu_type == PDU_CAPSULE_CMD:
+            self.capsule(hlen, pdo, plen, pdu)
+        elif pdu_type == PDU_H2C_DATA:
+            cid, ttag, offset, length = struct.unpack_from("<HHII", pdu, 8)
+            sqe, buff = self.pending[ttag]
+            buff[offset:offset + length] = pdu[pdo:pdo + length]
+            if flags & PDU_FLAG_DATA_LAST:
+                del self.pending[ttag]
+                self.execute(sqe, buff)
+        elif pdu_type == PDU_H2C_TERM_REQ:
+            logger.warning("-- Target: connection terminated by the host")
+            self.closing = True
+        else:
+            logger.warning(f"-- Target: unexpected PDU type {pdu_type}")
+            self.closing = True
+
+    def capsule(self, hlen, pdo, plen, pdu):
+        """ Handles a command capsule, requesting its data if not in the capsule """
+        sqe = pdu[8:72]
+        length = struct.unpack_from("<I", sqe, 32)[0]
+        if self.host_to_controller(sqe) and length:
+            if plen > hlen:
+                self.execute(sqe, pdu[pdo:plen])
+                return
+            cid = struct.unpack_from("<H", sqe, 2)[0]
+            self.pending[cid] = (sqe, bytearray(length))
+            self.send(struct.pack("<BBBBIHHIII", PDU_R2T, 0, 24, 0, 24, cid, cid, 0, length, 0))
+            return
+        self.execute(sqe, None)
+
+    @staticmethod
+    def host_to_controller(sqe):
+        """ True if the command transfers data from the host """
+        if sqe[0] == 0x7F:
+            return sqe[4] == FCTYPE_CONNECT
+        return sqe[0] & 0x3 == 0x1
+
+    def execute(self, sqe, data):
+        """ Executes the command and sends its data and completion """
+        cid = struct.unpack_from("<H", sqe, 2)[0]
+        if sqe[0] == 0x7F:
+            result = self.fabrics(sqe, data)
+        elif self.ctrl is None:
+            result = (SC_SEQUENCE_ERROR, 0, None)
+        elif self.qid == 0:
+            result = self.admin(sqe, cid)
+        else:
+            result = self.io(sqe, data)
+        if result is None:
+            # Asynchronous Event Request, completed by an event
+            return
+
+        sc, dw0, out = result
+        if out is not None and sc == SC_SUCCESS:
+            length = min(len(out), struct.unpack_from("<I", sqe, 32)[0])
+            pdo = -(-24 // ((self.hpda + 1) * 4)) * ((self.hpda + 1) * 4)
+            view = memoryview(out)
+            for offset in range(0, length, MAX_C2H_DATA):
+                chunk = view[offset:min(offset + MAX_C2H_DATA, length)]
+                flags = PDU_FLAG_DATA_LAST if offset + len(chunk) == length else 0
+                header = struct.pack("<BBBBIHHIII", PDU_C2H_DATA, flags, 24, pdo, pdo + len(chunk),
+                                     cid, 0, offset, len(chunk), 0)
+                self.send(header.ljust(pdo, b"\0"), chunk)
+        self.send_response(cid, sc, dw0)
+        if sqe[0] == 0x7F and sqe[4] == FCTYPE_DISCONNECT and sc == SC_SUCCESS:
+            # The queue is closed once the Disconnect is completed
+            self.closing = True
+
+    def send_response(self, cid, sc, dw0=0):
+        """Sends the completion of a command. Events are completed from other
+            threads, the SQ head is advanced under the send lock.
+        """
+        with self.send_lock:
+            self.sqhd = (self.sqhd + 1) % QUEUE_SIZE
+            self.send_locked([struct.pack("<BBBBIQHHHH", PDU_CAPSULE_RESP, 0, 24, 0, 24,
+                                          dw0, self.sqhd, self.qid or 0, cid, status(sc) << 1)])
+
+    def fabrics(self, sqe, data):
+        """ Executes a Fabrics command """
+        fctype = sqe[4]
+        if fctype == FCTYPE_CONNECT:
+            return self.connect(sqe, data)
+        if self.ctrl is None:
+            return SC_SEQUENCE_ERROR, 0, None
+        attrib, offset = sqe[40], struct.unpack_from("<I", sqe, 44)[0]
+        size = 8 if attrib & 0x7 == 1 else 4
+        if fctype == FCTYPE_PROPERTY_GET:
+            value = self.ctrl.get_property(offset, size)
+            return (SC_INVALID_FIELD, 0, None) if value is None else (SC_SUCCESS, value, None)
+        if fctype == FCTYPE_PROPERTY_SET:
+            value = struct.unpack_from("<Q", sqe, 48)[0]
+            ok = self.ctrl.set_property(offset, size, value)
+            return (SC_SUCCESS if ok else SC_INVALID_FIELD), 0, None
+        if fctype == FCTYPE_DISCONNECT:
+            return SC_SUCCESS, 0, None
+        return SC_INVALID_OPCODE, 0, None
+
+    def connect(self, sqe, data):
+        """ Executes a Connect command, creating the controller on the admin queue """
+        qid, sqsize = struct.unpack_from("<HH", sqe, 42)
+        kato = struct.unpack_from("<I", sqe, 48)[0]
+        if self.ctrl is not None or data is None or len(data) < 1024:
+            return SC_SEQUENCE_ERROR, 0, None
+        cntlid = struct.unpack_from("<H", data, 16)[0]
+        subnqn, hostnqn = cstr(data[256:512]), cstr(data[512:768])
+
+        # Invalid parameter: DW0 holds its offset and whether it is in the data (bit 16)
+        if subnqn not in (self.target.subnqn, NVME_DISCOVERY_NQN):
+            return SC_CONNECT_INVALID_PARAM, (1 << 16) | 256, None
+        if sqsize >= QUEUE_SIZE:
+            return SC_CONNECT_INVALID_PARAM, 44, None
+
+        if qid == 0:
+            self.ctrl = self.target.add_controller(subnqn, hostnqn, kato)
+            self.request.settimeout(kato / 1000 if kato else None)
+        else:
+            ctrl = self.target.controllers.get(cntlid)
+            if ctrl is None or ctrl.subnqn != subnqn or ctrl.hostnqn != hostnqn:
+                return SC_CONNECT_INVALID_PARAM, (1 << 16) | 16, None
+            if qid > ctrl.io_queues:
+                return SC_CONNECT_INVALID_PARAM, 42, None
+            self.ctrl = ctrl
+        self.qid = qid
+        self.ctrl.queues.append(self)
+        logger.info(f"-- Target: {hostnqn} connected queue {qid} of controller {self.ctrl.cntlid}")
+        return SC_SUCCESS, self.ctrl.cntlid, None
+
+    def admin(self, sqe, cid):
+        """ Executes an Admin command """
+        ctrl = self.ctrl
+        opc = sqe[0]
+        nsid = struct.unpack_from("<I", sqe, 4)[0]
+        cdw10, cdw11, cdw12, cdw13 = struct.unpack_from("<IIII", sqe, 40)
+
+        if opc == 0x06:
+            cns = cdw10 & 0xFF
+            if cns == 0x01:
+                return SC_SUCCESS, 0, ctrl.identify_controller()
+            if ctrl.discovery:
+                return SC_INVALID_FIELD, 0, None
+            if cns == 0x00 or cns == 0x03:
+                if nsid != 1:
+                    return SC_INVALID_NS, 0, None
+                if cns == 0x00:
+                    return SC_SUCCESS, 0, ctrl.identify_namespace()
+                # Namespace Identification Descriptor: NGUID
+                return SC_SUCCESS, 0, (struct.pack("<BBH", 2, 16, 0) + self.target.nguid).ljust(4096, b"\0")
+            if cns == 0x02:
+                return SC_SUCCESS, 0, struct.pack("<I", 1 if nsid < 1 else 0).ljust(4096, b"\0")
+            if (cns == 0x05 or cns == 0x06) and cdw11 >> 24 == 0:
+                # NVM Command Set specific data structures, nothing reported
+                return SC_SUCCESS, 0, bytes(4096)
+            return SC_INVALID_FIELD, 0, None
+
+        if opc == 0x02:
+            log = ctrl.log_page(cdw10 & 0xFF)
+            if log is None:
+                return SC_INVALID_LOG_PAGE, 0, None
+            length = (((cdw10 >> 16) | ((cdw11 & 0xFFFF) << 16)) + 1) * 4
+            offset = cdw12 | (cdw13 << 32)
+            return SC_SUCCESS, 0, bytes(log[offset:offset + length]).ljust(length, b"\0")
+
+        if opc == 0x09 or opc == 0x0A:
+            fid = cdw10 & 0xFF
+            if fid not in ctrl.features:
+                return SC_INVALID_FIELD, 0, None
+            if opc == 0x0A:
+                return SC_SUCCESS, (0 if (cdw10 >> 8) & 0x7 == 3 else ctrl.features[fid]), None
+            if cdw10 >> 31:
+                return SC_NOT_SAVEABLE, 0, None
+            if fid == 0x07:
+                # Number of Queues: allocated queues, 0's based
+                count = min(cdw11 & 0xFFFF, cdw11 >> 16, MAX_IO_QUEUES - 1)
+                ctrl.io_queues = count + 1
+                cdw11 = count | (count << 16)
+            elif fid == 0x0F:
+                ctrl.kato = cdw11
+                self.request.settimeout(cdw11 / 1000 if cdw11 else None)
+            ctrl.features[fid] = cdw11
+            return SC_SUCCESS, cdw11, None
+
+        if opc == 0x18:
+            return SC_SUCCESS, 0, None
+
+        if opc == 0x0C:
+            with ctrl.lock:
+                if ctrl.events:
+                    return SC_SUCCESS, ctrl.events.pop(0), None
+                if len(ctrl.aers) > AERL:
+                    return SC_AER_LIMIT_EXCEEDED, 0, None
+                ctrl.aers.append((self, cid))
+            return None
+
+        if opc == 0x08:
+            # Abort: command not aborted
+            return SC_SUCCESS, 1, None
+
+        return SC_INVALID_OPCODE, 0, None
+
+    def io(self, sqe, data):
+        """ Executes an I/O command on the namespace """
+        ns = self.target.namespace
+        opc = sqe[0]
+        nsid = struct.unpack_from("<I", sqe, 4)[0]
+        cdw10, cdw11, cdw12 = struct.unpack_from("<III", sqe, 40)
+        if nsid != 1:
+            return SC_INVALID_NS, 0, None
+        if opc == 0x00:
+            ns.flush()
+            return SC_SUCCESS, 0, None
+        if opc not in (0x01, 0x02):
+            return SC_INVALID_OPCODE, 0, None
+
+        slba = cdw10 | (cdw11 << 32)
+        nlb = (cdw12 & 0xFFFF) + 1
+        if not ns.in_range(slba, nlb):
+            return SC_LBA_OUT_OF_RANGE, 0, None
+        if opc == 0x01:
+            if data is None or len(data) != nlb * ns.lba_size:
+                return SC_SGL_LENGTH_INVALID, 0, None
+            ns.write(slba, data)
+            self.target.count(1, nlb)
+            return SC_SUCCESS, 0, None
+        self.target.count(0, nlb)
+        return SC_SUCCESS, 0, ns.read(slba, nlb)
+
+
+class TargetServer(socketserver.ThreadingTCPServer):
+    """ TCP server running every queue in a thread of its own """
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class NVMeTCPTarget():
+    """
+    Userspace NVMe/TCP target with one subsystem of one namespace.
+
+    Attributes:
+        addr (str): Address the target listens on.
+        svcid (int): Port the target listens on.
+        subnqn (str): NQN of the subsystem.
+        namespace (Namespace): Namespace 1 of the subsystem.
+        controllers (dict): Controllers indexed by Controller ID.
+    """
+
+    def __init__(self, addr="127.0.0.1", svcid=4420, subnqn=TARGET_NQN, size=1 << 30,
+                 lba_size=512, path=None) -> None:
+        """Constructor
+
+        Args:
+            addr (str, optional): Address to listen on. Defaults to "127.0.0.1".
+            svcid (int, optional): Port to listen on. Defaults to 4420.
+            subnqn (str, optional): NQN of the subsystem.
+            size (int, optional): Size of the namespace in bytes. Defaults to 1 GiB.
+            lba_size (int, optional): Size of a logical block. Defaults to 512.
+            path (str, optional): File backing the namespace. Defaults to None
+                (sparse anonymous memory).
+        """
+        self.addr = addr
+        self.svcid = int(svcid)
+        self.subnqn = subnqn
+        self.namespace = Namespace(size, lba_size, path)
+        self.serial = f"NVMFABTEST{self.svcid:05d}"
+        self.nguid = os.urandom(16)
+        self.controllers = {}
+        self.queues = set()
+        self.next_cntlid = 1
+        self.data_units = [0, 0]
+        self.blocks = [0, 0]
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def listen(self):
+        """ Creates the listening socket """
+        TargetServer.address_family = socket.AF_INET6 if ":" in self.addr else socket.AF_INET
+        self.server = TargetServer((self.addr, self.svcid), NVMeTCPQueue)
+        self.server.target = self
+        self.svcid = self.server.server_address[1]
+        logger.info(f"-- Target: {self.subnqn} listening on {self.addr}:{self.svcid}")
+
+    def start(self):
+        """ Starts the target in a background thread """
+        self.listen()
+        self.thread = threading.Thread(target=self.server.serve_forever, name="nvme-tcp-target",
+                                       daemon=True)
+        self.thread.start()
+
+    def serve_forever(self):
+        """ Runs the target in the calling thread """
+        self.listen()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """ Stops the target, closing all connections """
+        if self.server:
+            if self.thread:
+                self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for queue in list(self.queues):
+            queue.close()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def add_controller(self, subnqn, hostnqn, kato):
+        """ Creates a controller with a new Controller ID """
+        with self.lock:
+            cntlid = self.next_cntlid
+            self.next_cntlid = self.next_cntlid % 0xFFEF + 1
+            ctrl = TargetController(self, cntlid, subnqn, hostnqn, kato)
+            self.controllers[cntlid] = ctrl
+        return ctrl
+
+    def remove_controller(self, ctrl):
+        """ Removes the controller and closes its I/O queues """
+        with self.lock:
+            self.controllers.pop(ctrl.cntlid, None)
+        ctrl.close()
+        logger.info(f"-- Target: controller {ctrl.cntlid} removed")
+
+    def count(self, write, nlb):
+        """ Accounts the blocks read or written, in the units of the SMART log page """
+        with self.lock:
+            self.blocks[write] += nlb * self.namespace.lba_size // 512
+            self.data_units[write] = -(-self.blocks[write] // 1000)
+
+    def post_event(self, event_type=0x2, event_info=0x0, lid=0x04):
+        """Posts an asynchronous event to every controller of the subsystem.
+            Defaults to a Namespace Attribute Changed notice.
+
+        Args:
+            event_type (int, optional): Asynchronous Event Type.
+            event_info (int, optional): Asynchronous Event Information.
+            lid (int, optional): Log page associated with the event.
+        """
+        for ctrl in list(self.controllers.values()):
+            if not ctrl.discovery:
+                ctrl.post_event(event_type | (event_info << 8) | (lid << 16))
+
+    def discovery_log(self):
+        """ Discovery log page with the entry of the subsystem """
+        entry = bytearray(1024)
+        adrfam = 2 if ":" in self.addr else 1
+        # TRTYPE TCP, NVM subsystem, port 1, dynamic controller, admin queue size
+        struct.pack_into("<BBBBHHH", entry, 0, 3, adrfam, 2, 0, 1, 0xFFFF, QUEUE_SIZE)
+        entry[32:64] = str(self.svcid).encode().ljust(32)
+        entry[256:512] = self.subnqn.encode().ljust(256, b"\0")
+        entry[512:768] = self.addr.encode().ljust(256)
+        header = struct.pack("<QQH", 1, 1, 0).ljust(1024, b"\0")
+        return header + entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Userspace NVMe/TCP target")
+    parser.add_argument("--addr", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--svcid", type=int, default=4420, help="Port to listen on")
+    parser.add_argument("--nqn", default=TARGET_NQN, help="NQN of the subsystem")
+    parser.add_argument("--size", type=int, default=1024, help="Namespace size in MiB")
+    parser.add_argument("--lba-size", type=int, default=512, help="Logical block size")
+    parser.add_argument("--file", default=None, help="File backing the namespace")
+    args = parser.parse_args()
+
+    target = NVMeTCPTarget(args.addr, args.svcid, args.nqn, args.size << 20, args.lba_size,
+                           args.file)
+    try:
+        target.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Micro-benchmark for the process spawning overhead of the nvme-cli backend.
+
+Compares the previous execution path (command string run through the shell)
+with the argv execution path of SystemLib (no shell, executable resolved once
+so that posix_spawn can be used). "nvme version" is used if nvme-cli is
+installed, else "uname". No device is required.
+
+Usage (from project directory):
+    python scripts/benchmark_cli_exec.py [iterations]
+"""
+
+import shutil
+import subprocess
+import sys
+import time
+sys.path.insert(1, "./")
+from lib.syslib.system_lib import SystemLib
+
+
+def shell_exec(argv, iterations):
+    """ Previous behaviour: command string executed with shell=True """
+    cmd = " ".join(argv)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+        process.communicate()
+    return time.perf_counter() - start
+
+
+def argv_exec(argv, iterations):
+    """ Current behaviour: argv executed without a shell """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        SystemLib.run(argv)
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    argv = ["nvme", "version"] if shutil.which("nvme") else ["uname"]
+
+    before = shell_exec(argv, iterations)
+    after = argv_exec(argv, iterations)
+
+    print(f"command          : {' '.join(argv)}")
+    print(f"shell=True       : {iterations/before:.1f} commands/s")
+    print(f"argv, no shell   : {iterations/after:.1f} commands/s")
+    print(f"speed-up         : {before/after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Micro-benchmark for building SQEs and filling/decoding CQEs.
+
+Compares the attribute access through the nested ctypes structures (previous
+behaviour) with the precompiled struct codecs of struct_codec_lib, for single
+commands and for a batch of Read commands in a contiguous array. No device is
+required.
+
+Usage (from project directory):
+    python scripts/benchmark_codec.py [batch size]
+"""
+
+import ctypes
+import sys
+import time
+sys.path.insert(1, "./")
+from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.structlib.nvme_struct_main_lib import NVMeCommand
+from lib.structlib.struct_codec_lib import (decode_statuses, encode_status, pack_sqe,
+                                            replicate, set_lba_ranges)
+
+BLOCKS = 8
+LBA_SIZE = 512
+
+
+def build_attributes(nvme_cmds, addr):
+    """ Previous behaviour: Read commands built field by field """
+    start = time.perf_counter()
+    for i, nvme_cmd in enumerate(nvme_cmds):
+        nvme_cmd.cmd.generic_command.cdw0.OPC = 0x02
+        nvme_cmd.cmd.generic_command.NSID = 1
+        nvme_cmd.cmd.generic_command.cdw10.raw = (i * BLOCKS) & 0xFFFFFFFF
+        nvme_cmd.cmd.generic_command.cdw11.raw = (i * BLOCKS) >> 32
+        nvme_cmd.cmd.generic_command.cdw12.raw = BLOCKS - 1
+        nvme_cmd.buff = addr
+        nvme_cmd.buff_size = BLOCKS * LBA_SIZE
+    return time.perf_counter() - start
+
+
+def build_codec(nvme_cmds, addr):
+    """ Read commands packed with pack_sqe, one command at a time """
+    start = time.perf_counter()
+    for i, nvme_cmd in enumerate(nvme_cmds):
+        pack_sqe(nvme_cmd, 0x02, 1, (i * BLOCKS) & 0xFFFFFFFF, (i * BLOCKS) >> 32, BLOCKS - 1)
+        nvme_cmd.buff = addr
+        nvme_cmd.buff_size = BLOCKS * LBA_SIZE
+    return time.perf_counter() - start
+
+
+def build_batch(batch, addr):
+    """ Read commands copied from a template, only the LBA ranges are packed """
+    start = time.perf_counter()
+    template = NVMeCommand()
+    pack_sqe(template, 0x02, 1)
+    template.buff = addr
+    template.buff_size = BLOCKS * LBA_SIZE
+    nvme_cmds = replicate(template, batch)
+    set_lba_ranges(nvme_cmds, range(0, batch * BLOCKS, BLOCKS), BLOCKS)
+    return time.perf_counter() - start, nvme_cmds
+
+
+def fill_attributes(nvme_cmds, statuses):
+    """ Previous behaviour: status field filled with five bit extractions """
+    start = time.perf_counter()
+    for nvme_cmd, status in zip(nvme_cmds, statuses):
+        response = nvme_cmd.rsp.response
+        response.sf.DNR = NVMeCLILib.mapping(status, 14, 15)
+        response.sf.M = NVMeCLILib.mapping(status, 13, 14)
+        response.sf.CRD = NVMeCLILib.mapping(status, 11, 13)
+        response.sf.SCT = NVMeCLILib.mapping(status, 8, 11)
+        response.sf.SC = NVMeCLILib.mapping(status, 0, 8)
+    return time.perf_counter() - start
+
+
+def fill_codec(nvme_cmds, statuses):
+    """ Status field filled with encode_status """
+    start = time.perf_counter()
+    for nvme_cmd, status in zip(nvme_cmds, statuses):
+        encode_status(nvme_cmd.rsp.response, status)
+    return time.perf_counter() - start
+
+
+def decode_attributes(nvme_cmds):
+    """ Previous behaviour: status read field by field """
+    start = time.perf_counter()
+    statuses = []
+    for nvme_cmd in nvme_cmds:
+        sf = nvme_cmd.rsp.response.sf
+        statuses.append(sf.DNR << 14 | sf.M << 13 | sf.CRD << 11 | sf.SCT << 8 | sf.SC)
+    return time.perf_counter() - start, statuses
+
+
+def decode_batch(nvme_cmds):
+    """ Statuses of the array read in one pass """
+    start = time.perf_counter()
+    statuses = decode_statuses(nvme_cmds)
+    return time.perf_counter() - start, statuses
+
+
+def report(name, before, after, batch):
+    """ Prints the time per command and the speed-up """
+    print(f"{name:<34}: {before/batch*1e6:.3f} -> {after/batch*1e6:.3f} us/command "
+          f"({before/after:.1f}x)")
+
+
+def main():
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    data = ctypes.create_string_buffer(BLOCKS * LBA_SIZE)
+    addr = ctypes.addressof(data)
+    statuses = [(i * 0x1F3) & 0x7FFF for i in range(batch)]
+
+    reference = (NVMeCommand * batch)()
+    build_before = build_attributes(reference, addr)
+    nvme_cmds = (NVMeCommand * batch)()
+    build_after = build_codec(nvme_cmds, addr)
+    assert bytes(nvme_cmds) == bytes(reference)
+    build_array, nvme_cmds = build_batch(batch, addr)
+    assert bytes(nvme_cmds) == bytes(reference)
+
+    fill_before = fill_attributes(reference, statuses)
+    fill_after = fill_codec(nvme_cmds, statuses)
+    assert bytes(nvme_cmds) == bytes(reference)
+
+    decode_before, decoded = decode_attributes(reference)
+    assert decoded == statuses
+    decode_after, decoded = decode_batch(nvme_cmds)
+    assert decoded == statuses
+
+    print(f"{batch} Read commands of {BLOCKS} blocks, Python {sys.version.split()[0]}")
+    report("build, pack_sqe", build_before, build_after, batch)
+    report("build, replicate + set_lba_ranges", build_before, build_array, batch)
+    report("fill status, encode_status", fill_before, fill_after, batch)
+    report("decode status, decode_statuses", decode_before, decode_after, batch)
+
+
+if __name__ == "__main__":
+    main()
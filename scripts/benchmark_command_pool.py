@@ -0,0 +1,97 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Micro-benchmark for getting commands in tight loops.
+
+Compares building a new command for each submission with the get_*_cmd
+functions of NVMeCommandLib (previous behaviour) with checking commands out of
+the CommandPool and returning them, for the AER loop and a Property Get sweep.
+Also reports the memory allocated while 1000 commands are held at once. No
+device is required.
+
+Usage (from project directory):
+    python scripts/benchmark_command_pool.py [commands]
+"""
+
+import ctypes
+import sys
+import time
+import tracemalloc
+sys.path.insert(1, "./")
+from lib.cmdlib.commands_lib import NVMeCommandLib
+
+
+def aer_build(cmdlib, count):
+    """ Previous behaviour: a new AER command per submission """
+    start = time.perf_counter()
+    for _ in range(count):
+        nvme_cmd = cmdlib.get_aer_cmd()
+    return time.perf_counter() - start
+
+
+def aer_pool(cmdlib, count):
+    """ AER command checked out of the pool and returned """
+    start = time.perf_counter()
+    for _ in range(count):
+        nvme_cmd = cmdlib.pool.checkout("aer")
+        cmdlib.pool.checkin(nvme_cmd)
+    return time.perf_counter() - start
+
+
+def property_build(cmdlib, count):
+    """ Previous behaviour: a new Property Get command and value per offset """
+    start = time.perf_counter()
+    for index in range(count):
+        nvme_cmd = cmdlib.get_property_get_cmd()
+        value = ctypes.c_uint64()
+        nvme_cmd.buff = ctypes.addressof(value)
+        nvme_cmd.cmd.generic_command.cdw11.raw = (index * 4) & 0xFFF
+    return time.perf_counter() - start
+
+
+def property_pool(cmdlib, count):
+    """ Property Get command with its data buffer checked out of the pool """
+    start = time.perf_counter()
+    for index in range(count):
+        nvme_cmd = cmdlib.pool.checkout("property_get")
+        nvme_cmd.cmd.generic_command.cdw11.raw = (index * 4) & 0xFFF
+        cmdlib.pool.checkin(nvme_cmd)
+    return time.perf_counter() - start
+
+
+def held_memory(get, release, count):
+    """Memory allocated for count commands held at once (e.g. outstanding AERs
+        or a batch), after a first round of the same size.
+
+    Returns:
+        int: Bytes allocated.
+    """
+    release([get() for _ in range(count)])
+    tracemalloc.start()
+    nvme_cmds = [get() for _ in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    release(nvme_cmds)
+    return current - sys.getsizeof(nvme_cmds)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cmdlib = NVMeCommandLib("ioctl")
+
+    print(f"{count} commands")
+    for name, build, pool in (("AER", aer_build, aer_pool),
+                              ("Property Get", property_build, property_pool)):
+        before, after = build(cmdlib, count), pool(cmdlib, count)
+        print(f"{name:<13}: {before/count*1e6:.3f} -> {after/count*1e6:.3f} us/command "
+              f"({before/after:.1f}x)")
+    before = held_memory(cmdlib.get_aer_cmd, lambda nvme_cmds: None, 1000)
+    after = held_memory(lambda: cmdlib.pool.checkout("aer"),
+                        lambda nvme_cmds: [cmdlib.pool.checkin(nvme_cmd) for nvme_cmd in nvme_cmds],
+                        1000)
+    print(f"1000 AERs held: {before} -> {after} bytes allocated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Micro-benchmark for the per-command Python overhead of the libnvme backend.
+
+Compares re-defining the passthru prototype on every submission (previous
+behaviour) with calling the prototype bound once at load time. Commands are
+sent to an invalid descriptor so that the kernel returns immediately and only
+the Python and ctypes overhead is measured. No device is required, the
+libnvme shared object is.
+
+Usage (from project directory):
+    python scripts/benchmark_libnvme.py [iterations] [path to libnvme.so]
+
+Without a path, libnvme is resolved the same way as by the framework.
+"""
+
+import ctypes
+import sys
+import time
+sys.path.insert(1, "./")
+from lib.applib.libnvme_lib import Libnvme, load_libnvme
+from lib.structlib.nvme_struct_main_lib import NVMeCommand
+
+
+def per_call_binding(libnvme, command, iterations):
+    """ Previous behaviour: prototype set up before every submission """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        submit = libnvme.nvme_submit_admin_passthru
+        submit.argtypes = [ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p]
+        submit.restype = ctypes.c_int32
+        submit(-1, ctypes.addressof(command), None)
+    return time.perf_counter() - start
+
+
+def bound_once(libnvme, command, iterations):
+    """ Current behaviour: prototype bound at load time """
+    start = time.perf_counter()
+    submit = libnvme.nvme_submit_admin_passthru
+    for _ in range(iterations):
+        submit(-1, ctypes.addressof(command), None)
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    try:
+        path = sys.argv[2] if len(sys.argv) > 2 else Libnvme.get_libnvme_path()
+    except FileNotFoundError as error:
+        sys.exit(f"libnvme is required: {error}")
+    start = time.perf_counter()
+    libnvme = load_libnvme(path)
+    load_time = time.perf_counter() - start
+
+    command = NVMeCommand().cmd.generic_command
+    command.cdw0.OPC = 0x06
+
+    before = per_call_binding(libnvme, command, iterations)
+    after = bound_once(libnvme, command, iterations)
+
+    print(f"libnvme load + prototype binding: {load_time*1e3:.3f} ms (once per process)")
+    print(f"per-call binding : {before/iterations*1e6:.3f} us/command")
+    print(f"bound once       : {after/iterations*1e6:.3f} us/command")
+    print(f"speed-up         : {before/after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
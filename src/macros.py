@@ -20,4 +20,46 @@ NVMF_TRSVCID_SIZE           = 32
 OFFSETS_64BIT = [0, 0x28, 0x30, 0x48, 0x50] 
 OFFSET_CONTROLLER_CONFIGURATION = 0x14
 OFFSET_CONTROLLER_CAPABILITIES  = 0x0
-TEMP_DIR                    = '.temp'
\ No newline at end of file
+# Linux NVMe passthru ioctl request codes, _IOWR('N', nr, size)
+NVME_IOCTL_ADMIN_CMD        = 0xC0484E41 # struct nvme_passthru_cmd (72 bytes)
+NVME_IOCTL_IO_CMD           = 0xC0484E43
+NVME_IOCTL_ADMIN64_CMD      = 0xC0504E47 # struct nvme_passthru_cmd64 (80 bytes)
+NVME_IOCTL_IO64_CMD         = 0xC0504E48
+
+# io_uring NVMe passthrough, _IOWR('N', nr, struct nvme_uring_cmd (72 bytes))
+NVME_URING_CMD_IO           = 0xC0484E80
+NVME_URING_CMD_ADMIN        = 0xC0484E82
+IO_URING_DEFAULT_QD         = 32
+CLI_TIMEOUT_MARGIN          = 5 # seconds, process timeout on top of the command timeout
+ASYNC_MAX_CONCURRENCY       = 64
+CLI_BATCH_WORKERS           = 16
+NETLINK_KOBJECT_UEVENT      = 15
+STATE_POLL_INTERVAL         = 0.01 # seconds, re-read of a controller state without notification
+NETNS_PREFIX                = "nvmfab"
+NETNS_SUBNET                = 111 # netns harness N uses 10.111.N.0/30
+# Get Log Page in chunks of at most MDTS, see lib/applib/log_page_lib.py
+NVME_LOG_LID_TELEMETRY_HOST = 0x07
+NVME_LOG_LID_TELEMETRY_CTRL = 0x08
+NVME_LOG_LID_DISCOVER       = 0x70
+LOG_PAGE_MAX_CHUNK          = 0x100000 # bytes per command if MDTS is not limited
+LOG_PAGE_MAX_BUFFER         = 0x10000000 # larger log pages are streamed to a file
+LOG_PAGE_QUEUE_DEPTH        = 8
+LOG_PAGE_RETRIES            = 10 # reads of a log page whose generation keeps changing
+NVMF_TRTYPE_RDMA            = 1
+NVMF_TRTYPE_FC              = 2
+NVMF_TRTYPE_TCP             = 3
+NVMF_TRTYPE_LOOP            = 254
+NVMF_ADRFAM_IPV4            = 1
+NVMF_ADRFAM_IPV6            = 2
+NVMF_ADRFAM_IB              = 3
+NVMF_ADRFAM_FC              = 4
+NVME_NQN_DISC_REFERRAL      = 1 # subtype: referral to another discovery service
+NVME_NQN_NVME               = 2 # subtype: NVM subsystem
+NVME_NQN_CURR               = 3 # subtype: current discovery subsystem
+# Namespace Read/Write split in commands of at most MDTS, see NamespaceIO
+NAMESPACE_IO_QUEUE_DEPTH    = 32
+NAMESPACE_IO_MAX_CHUNK      = 0x100000 # bytes per command if MDTS is not limited
+NAMESPACE_IO_BATCH          = 4096 # commands built and submitted at a time
+COMMAND_POOL_SIZE           = 64 # commands allocated at a time per template
+DIRECT_IO_ALIGNMENT         = 4096 # alignment of the data buffers of pooled commands
+COMMAND_POOL_IO_SIZE        = 0x20000 # data buffer of pooled Read and Write commands
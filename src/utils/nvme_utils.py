@@ -3,84 +3,43 @@
 
 """ Generic utilities used in the framework. """
 
-import json
-from utils.logging_module import logger
 
-def get_dev_from_subsys(response, nqn):
+def percentile(samples, p):
     """
-    Retrieves the device path associated with a given NQN from the response.
+    Computes a percentile of the samples, interpolating between the closest ranks.
 
     Args:
-        response (str): The response string in JSON format.
-        nqn (str): The NQN (NVMe Qualified Name) to search for.
+        samples (List[float]): The samples.
+        p (float): The percentile, from 0 to 100.
 
     Returns:
-        Tuple[int, str]: A tuple containing the status code and the device path/error.
+        float: The percentile. None if there are no samples.
     """
-    
-    try:
-        js = json.loads(response)
-        js = js[0]
-        for subsystem in js["Subsystems"]:
-            if nqn == subsystem['NQN'].strip():
-                subsys_name = subsystem['Name'].strip()
-                dev_path = f"/dev/nvme{subsys_name[-1]}"
-                return 0, dev_path
-        return 1, "NQN not found in the given response"
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
 
-    except json.JSONDecodeError as e:
-        logger.exception(e)
-        return 2, "Response is not in JSON format"
 
-    except KeyError as e:
-        logger.exception(e)
-        return 3, f"JSON does not have required keys as per list-subsys format: {str(e)}"
-
-
-def parse_for_already_connected(response, connect_details, nqn):
+def histogram(samples, bins=10):
     """
-    Parses the given response to check if the NQN is already connected using the provided connect details.
+    Counts the samples in equal width bins between the minimum and the maximum.
 
     Args:
-        response (str): The response to parse, expected to be in JSON format.
-        connect_details (dict): A dictionary containing the transport, address, and service ID to match against.
-        nqn (str): The NQN (NVMe Qualified Name) to check for.
+        samples (List[float]): The samples.
+        bins (int, optional): Number of bins. Defaults to 10.
 
     Returns:
-        Tuple[int, bool, str]: A tuple containing the following values:
-            - int: The status code. 0 indicates success, 2 indicates a JSON decoding error, and 3 indicates missing keys in the JSON.
-            - bool: True if the NQN is already connected using the provided connect details, False otherwise.
-            - str: The device path (/dev/nvmeX) if the NQN is already connected, or an error message if not found.
-
+        List[Tuple[float, float, int]]: Lower bound, upper bound and count of each bin.
     """
-    try:
-        js = json.loads(response)
-        if len(js)==0:
-            return 0, False, "NQN not found in the given response"
-        js = js[0]
-        tr = connect_details["transport"]
-        addr = connect_details["addr"]
-        svc = connect_details["svcid"]
-
-    
-        for subsystem in js["Subsystems"]:
-            if nqn == subsystem['NQN'].strip():
-                path = subsystem['Paths'][0]
-                check = path["Transport"] == tr
-                check = check and path["Address"].split(',')[0]==f"traddr={addr}"
-                check = check and path["Address"].split(',')[1]==f"trsvcid={svc}"
-
-                if check:
-                    dev_name = path['Name'].strip()
-                    dev_path = f"/dev/{dev_name}"
-                    return 0, True, dev_path
-                
-        return 0, False, "NQN not found in the given response"
-
-    except json.JSONDecodeError as e:
-        logger.exception(e)
-        return 2, False,"Response is not in json format"
-
-    except KeyError as e:
-        logger.exception(e)
-        return 3, False,f"JSON does not have required keys as per list-subsys format: {str(e)}"
+    if not samples:
+        return []
+    low, high = min(samples), max(samples)
+    width = (high - low) / bins or 1
+    counts = [0] * bins
+    for sample in samples:
+        counts[min(int((sample - low) / width), bins - 1)] += 1
+    return [(low + i * width, low + (i + 1) * width, counts[i]) for i in range(bins)]
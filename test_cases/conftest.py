@@ -8,14 +8,20 @@ and tearing down a session for NVMe over Fabric compliance testing.
 """
 
 import json
+import os
 import pytest
 import sys
 sys.path.insert(1, "./")
+from src.macros import *
 from lib.cmdlib.commands_lib import NVMeCommandLib
 from lib.applib.nvme_cli_lib import NVMeCLILib
+from lib.applib.libnvme_lib import device_handles
+from lib.applib.discovery_log_lib import DiscoveryLog
 from lib.devlib.device_lib import *
 from utils.logging_module import logger
-from src.utils.nvme_utils import parse_for_already_connected
+from lib.syslib.netns_lib import NetnsHarness
+from lib.syslib.system_lib import SystemLib
+from lib.syslib.topology_lib import topology
 from utils.reporting_module import *
 
 
@@ -27,6 +33,81 @@ with open("assets/bytes_512.txt", 'wb') as f:
     f.write(bytearray([(i+10)%128 for i in range(512)]))
 
 
+def load_targets(config):
+    """
+    Returns the targets to be qualified. Each target is a dictionary with the
+    connection details (transport, addr, svcid, index) and optionally its own
+    device_path. Without a "targets" list, the single target is formed from
+    "connectDetails" and "device_path".
+
+    Args:
+        config (dict): The contents of ts_config.json.
+
+    Returns:
+        List[dict]: The targets.
+
+    Raises:
+        ValueError: If several targets are listed with "netns_target" enabled,
+            which runs a single target in the namespace of each worker.
+    """
+    if len(config.get("targets", [])) > 1 and \
+            config.get("netns_target", {}).get("enabled", "false").lower() == "true":
+        raise ValueError("netns_target runs one target per worker, "
+                         "it cannot be combined with a list of targets")
+    default = dict(config["connectDetails"], device_path=config["device_path"])
+    return [dict(default, **target) for target in config.get("targets", [])] or [default]
+
+
+def target_id(target):
+    """ Name of the target used in test ids, report and xdist groups """
+    if ts_config["connectByIP"].lower() == "true":
+        return f"{target['transport']}-{target['addr']}-{target['svcid']}-{target['index']}"
+    return target["device_path"].replace("/dev/", "")
+
+
+targets = load_targets(ts_config)
+fault_profiles = ts_config.get("fault_profiles", {})
+for profile in fault_profiles.values():
+    # Rejects invalid profiles before any test runs
+    SystemLib.netem_args(profile)
+controller_pool.trace = ts_config.get("trace")
+replaying = (controller_pool.trace or {}).get("mode", "off").lower() == "replay"
+
+
+def pytest_configure(config):
+    """ Registers the marker used to keep the tests of a target on one worker """
+    config.addinivalue_line(
+        "markers", "xdist_group(name): tests of the group are run by the same xdist worker")
+
+
+def pytest_generate_tests(metafunc):
+    """
+    Tests using the fault_profile fixture are run on the clean link and again
+    under each fault profile of ts_config.json.
+    """
+    if "fault_profile" in metafunc.fixturenames and fault_profiles:
+        metafunc.parametrize("fault_profile", ["clean"] + list(fault_profiles), indirect=True)
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    With multiple targets, every test is run once per target. The tests of a
+    target are grouped so that "pytest -n <workers> --dist loadgroup" shards
+    the targets across the workers, each worker connecting to its targets once.
+    """
+    for item in items:
+        callspec = getattr(item, "callspec", None)
+        if callspec and "target" in callspec.params:
+            item.add_marker(pytest.mark.xdist_group(target_id(callspec.params["target"])))
+
+
+@pytest.fixture(scope='session', params=targets if "targets" in ts_config else None,
+                ids=target_id)
+def target(request):
+    """ Fixture for providing the target qualified by the tests """
+    return getattr(request, "param", targets[0])
+
+
 def connectByIP(app: NVMeCLILib, cmd_lib: NVMeCommandLib, connect_details):
     """
     Connects to a NVM device using the details given in the arguments.
@@ -48,26 +129,26 @@ def connectByIP(app: NVMeCLILib, cmd_lib: NVMeCommandLib, connect_details):
 
     # Start Discover Command
     status, response = app.submit_discover_cmd(
-        transport=tr, address=addr, svcid=svc)
+        transport=tr, address=addr, svcid=svc, raw=True)
     if status != 0:
         logger.error("-- -- Session Setup Error: Discover command failed. Check the configuration details")
         return status, response
-    nqn = app.get_nqn_from_discover(response, index)
+    nqns = DiscoveryLog(response).filter(subtype=NVME_NQN_NVME).subnqns()
+    index = 0 if len(nqns) == 1 else index
+    if index >= len(nqns):
+        logger.error(f"-- -- Session Setup Error: No NVM subsystem at index {index}, "
+                     f"{len(nqns)} discovered")
+        return 1, f"No NVM subsystem at index {index}"
+    nqn = nqns[index]
     # End Discover Command
 
     # Check Device already connected
-    status, response = app.submit_list_subsys_cmd()
-    if status != 0:
-        logger.error("-- -- Command failed. Check if nvme cli tool is installed")
-        return status, response
-    status, alreadyConnected, response = parse_for_already_connected(
-        response, connect_details, nqn)
+    connected = topology.find(nqn, tr, addr, svc)
+    alreadyConnected = len(connected) != 0
     logger.info("-- Already connected: {}", alreadyConnected)
-    if status != 0:
-        logger.error(f"-- -- Session Setup Error: {status, response}")
-        return status, response
-
-    if not alreadyConnected:
+    if alreadyConnected:
+        response = connected[0].dev_path
+    else:
         logger.info("-- -- Device not connected, attempting connection.")
         # Start Connect Command
         status, response = app.submit_connect_cmd(
@@ -82,30 +163,65 @@ def connectByIP(app: NVMeCLILib, cmd_lib: NVMeCommandLib, connect_details):
     return 0, dev_path
 
 
+def connect_target(target, netns_target):
+    """ Connection details of the target, which listens in the namespace if there is one """
+    if netns_target:
+        return dict(target, transport="tcp", addr=netns_target.target_addr,
+                    svcid=ts_config["netns_target"]["svcid"])
+    return target
+
+
+@pytest.fixture(scope='session')
+def netns_target():
+    """
+    Fixture for providing the network namespace harness of the target, when
+    "netns_target" is enabled. The target command is run in a namespace of
+    its own behind a veth pair, whose host side is used for link faults.
+    Every xdist worker uses its own namespace and subnet.
+    """
+    config = ts_config.get("netns_target", {})
+    if config.get("enabled", "false").lower() != "true":
+        yield None
+        return
+
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    harness = NetnsHarness(int(worker[2:]) if worker[2:].isdigit() else 0)
+    if harness.setup() != 0 or harness.start_target(config["target_cmd"], config["svcid"]) != 0:
+        harness.teardown()
+        pytest.exit("Network namespace target setup failed", returncode=1)
+    yield harness
+    harness.teardown()
+
+
 @pytest.fixture(scope='session', autouse=True)
-def session_setup():
-    """ Session setup for Test Suite """
+def session_setup(target, netns_target):
+    """ Session setup for Test Suite, done once per target """
 
     logger.info("\n")
-    logger.info("-"*30 + " Setting up session " + "-"*50)
+    logger.info("-"*30 + f" Setting up session: {target_id(target)} " + "-"*50)
 
-    if ts_config["connectByIP"].lower() == "true":
-        connect_details = ts_config["connectDetails"]
-        app = NVMeCLILib()
+    app = NVMeCLILib()
+    if replaying:
+        # Commands are served from the traces, nothing is connected
+        dev_path = target["device_path"]
+    elif netns_target or ts_config["connectByIP"].lower() == "true":
         cmd_lib = NVMeCommandLib(ts_config["app_name"])
 
-        status, response = connectByIP(app, cmd_lib, connect_details)
+        status, response = connectByIP(app, cmd_lib, connect_target(target, netns_target))
         if status == 0:
             dev_path = response
         else:
-            if ts_config["device_path"][:-1] == "/dev/nvme" or ts_config["device_path"][:-3] == "/dev/nvme":
+            if target["device_path"][:-1] == "/dev/nvme" or target["device_path"][:-3] == "/dev/nvme":
                 logger.warning("-- ErrorConnecting, using device_path instead: {}", response)
-                dev_path = ts_config["device_path"]
+                dev_path = target["device_path"]
             else:
                 logger.error("-- Error Connecting and no device_path specified: {}", response)
                 assert False
     else:
-        dev_path = ts_config["device_path"]
+        dev_path = target["device_path"]
+
+    # Traces are named after the target, the device connected to may differ between sessions
+    controller_pool.trace_names[dev_path] = target_id(target)
 
     logger.info("-"*30 + "Completed session setup "+ "-"*50 + "\n")
     logger.success("Path being used for testcases: {}\n", dev_path)
@@ -113,8 +229,13 @@ def session_setup():
     yield dev_path
 
     logger.info("\n")
-    logger.info("Session Teardown:")
-    if ts_config["disconnectOnDone"].lower() == "true":
+    logger.info(f"Session Teardown: {target_id(target)}")
+    logger.info(f"Controllers: {controller_pool.stats()}")
+    controller_pool.close_all()
+    logger.info(f"Device handles: {device_handles.stats()}")
+    device_handles.close_all()
+    # A namespace target is removed after the session, its controller must not be left reconnecting
+    if not replaying and (netns_target or ts_config["disconnectOnDone"].lower() == "true"):
         status, res = app.submit_disconnect_cmd(device_path=dev_path)
         if status != 0:
             logger.error(f"Disconnect failed: {res}")
@@ -131,9 +252,9 @@ def fabConfig(session_setup):
 
 
 @pytest.fixture
-def connectDetails():
-    """ Fixture for providing Connection Details """
-    data = ts_config["connectDetails"]
+def connectDetails(target, netns_target):
+    """ Fixture for providing Connection Details of the target """
+    data = connect_target(target, netns_target)
     connect_details = ConnectDetails()
     connect_details.transport = data["transport"]
     connect_details.address = data["addr"]
@@ -160,6 +281,30 @@ def authDetails():
     return auth_details
 
 
+@pytest.fixture(scope='session')
+def link_iface(netns_target):
+    """ Fixture for providing the network interface on which link faults are injected """
+    if netns_target:
+        return netns_target.host_if
+    return SystemLib().get_network_interface()
+
+
+@pytest.fixture
+def fault_profile(request, link_iface):
+    """ Fixture for shaping the link of the test with a fault profile (netem) """
+    name = getattr(request, "param", "clean")
+    if name == "clean":
+        yield None
+        return
+
+    system = SystemLib()
+    logger.info(f"-- Fault profile {name}: {fault_profiles[name]}")
+    if system.set_fault_profile(link_iface, fault_profiles[name]) != 0:
+        pytest.fail(f"Setting fault profile {name} failed: {system.stderr}")
+    yield fault_profiles[name]
+    system.clear_fault_profile(link_iface)
+
+
 @pytest.fixture
 def should_run_link_failure():
     """ Fixture for providing Connection Details """
@@ -169,3 +314,9 @@ def should_run_link_failure():
         return True
     else:
         return False
+
+
+@pytest.fixture
+def link_failure_cycles():
+    """ Fixture for providing the number of Link Failure cycles measured """
+    return int(ts_config.get("link_failure_cycles", 10))
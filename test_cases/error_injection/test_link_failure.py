@@ -8,11 +8,12 @@ Simulates a Link down and then a Link up
 from src.macros import *
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
+from lib.syslib.state_watcher_lib import StateWatcher
+from lib.syslib.topology_lib import topology
 from utils.logging_module import logger
 import subprocess
 import time
-import json
 import pytest
 
 
@@ -22,7 +23,7 @@ class TestLinkFailure:
     '''
 
     @pytest.fixture(scope='function', autouse=True)
-    def setup_method(self, fabConfig, should_run_link_failure):
+    def setup_method(self, fabConfig, should_run_link_failure, link_iface):
         ''' Setup Test Case by initialization of objects '''
 
         self.skipped = False
@@ -35,27 +36,19 @@ class TestLinkFailure:
         device = self.fabConfig.device
         self.dev_name = self.fabConfig.device[5:]
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
-        self.iface = self.controller.sys.get_network_interface()
+        self.iface = link_iface
         logger.info("Network interface: {}", self.iface)
         
         # SETUP - Device Status
         self.output = []
-        ret_code, response = self.controller.app.submit_list_subsys_cmd()
-
-        if ret_code == 0:
-            j = json.loads(response.decode())
-            for i in range(len(j[0]["Subsystems"])):
-                subsys = j[0]["Subsystems"][i]
-                path = subsys["Paths"][0]
-                if path["Name"].strip() == self.dev_name:
-                    self.i = i
-                    self.output.append(f"-- {self.dev_name} Status: " + path["State"])
-                    break
-            else:
-                logger.log("FAIL", "Didn't find device for setup")
-                assert False, "Didn't find device for setup"
+        self.ctrl = topology.refresh().controller(self.dev_name)
+        if self.ctrl is None:
+            logger.log("FAIL", "Didn't find device for setup")
+            assert False, "Didn't find device for setup"
+        self.output.append(f"-- {self.dev_name} Status: {self.ctrl.state}")
+        self.watcher = StateWatcher()
 
     def test_link_failure(self, fabConfig):
         ''' Sending the command and verifying response '''
@@ -64,23 +57,21 @@ class TestLinkFailure:
             self.controller.sys.set_link( "down", self.iface)
             self.output.append("Link Down")
 
-            # SLEEP 30secs
-            self.output.append("-- Sleeping ZzZ")
-            self.controller.sys.sleep(30)
-            self.output.append("-- Woke up after 30 seconds")
+            # WAIT (30secs at most) for the host to detect the link loss
+            link_down = time.perf_counter()
+            self.output.append("-- Waiting for the controller to start reconnecting")
+            detected = self.watcher.wait_for_state(self.ctrl, ("connecting", "resetting"), 30)
+            if detected:
+                self.output.append(f"-- Link loss detected after {detected - link_down:.3f} seconds")
+            else:
+                self.output.append("-- Link loss not detected after 30 seconds")
 
             # DEVICE STATUS
-            ret_code, response = self.controller.app.submit_list_subsys_cmd()
-
-            if ret_code == 0:
-                j = json.loads(response.decode())
-                j = j[0]["Subsystems"][self.i]["Paths"][0]
-                if j["Name"].strip() == self.dev_name:
-                    self.output.append(
-                        f"-- {self.dev_name} status: " + j["State"])
-                else:
-                    logger.log("FAIL", "Device lost after link down")
-                    assert False, "Device lost after link down"
+            state = self.ctrl.state
+            if state is None:
+                logger.log("FAIL", "Device lost after link down")
+                assert False, "Device lost after link down"
+            self.output.append(f"-- {self.dev_name} status: {state}")
 
             # LINKUP
             self.controller.sys.set_link( "up", self.iface)
@@ -92,31 +83,16 @@ class TestLinkFailure:
             subprocess.Popen(cmd, shell=True)
             raise e
 
-        ret_code, response = self.controller.app.submit_list_subsys_cmd()
-        if ret_code == 0:
-            j = json.loads(response.decode())
-            j = j[0]["Subsystems"][self.i]["Paths"][0]
-            isLive = j["State"].strip(
-            ) == "live" and j["Name"].strip() == self.dev_name
-            self.output.append(f"-- {self.dev_name} status: " + (
-                j["State"] if j["Name"].strip() == self.dev_name else "not connected"))
+        state = self.ctrl.state
+        self.output.append(f"-- {self.dev_name} status: {state or 'not connected'}")
 
         self.output.append("Waiting . .. ...")
 
-        start = time.time()
-        while not isLive:
-            ret_code, response = self.controller.app.submit_list_subsys_cmd()
-            if ret_code == 0:
-                j = json.loads(response.decode())
-                j = j[0]["Subsystems"][self.i]["Paths"][0]
-                isLive = j["State"].strip(
-                ) == "live" and j["Name"].strip() == self.dev_name
-
-            if time.time() - start > 60:
-                logger.log("FAIL", "Device failed to come back up")
-                assert False, "Device failed to come back up"
-
-        end = time.time()
+        start = time.perf_counter()
+        end = self.watcher.wait_for_state(self.ctrl, "live", 60)
+        if end is None:
+            logger.log("FAIL", "Device failed to come back up")
+            assert False, "Device failed to come back up"
 
         self.output.append("-- waited " + str(end-start) +
                            " seconds since linkup")
@@ -154,6 +130,7 @@ class TestLinkFailure:
             return
         logger.info("Teardown TestCase: Link Failure")
         self.controller.sys.set_link( "up", self.iface)
+        self.watcher.close()
         self.output.append("Link Up")        
         
         for line in self.output:
@@ -0,0 +1,159 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''
+Measures the reconnect latencies over repeated Link down / Link up cycles:
+- Link down to controller state "connecting"
+- Link up to controller state "live"
+- "live" to the first successful Read
+'''
+
+import ctypes
+import time
+import pytest
+import pytest_html
+from src.macros import *
+from test_cases.conftest import fabConfig
+from lib.devlib.device_lib import controller_pool
+from lib.syslib.state_watcher_lib import StateWatcher
+from lib.syslib.topology_lib import topology
+from src.utils.nvme_utils import histogram, percentile
+from utils.logging_module import logger
+
+# Seconds between the Reads of first_io, bounds the resolution of the I/O resume latency
+IO_RETRY_INTERVAL = 0.01
+
+METRICS = {
+    "link_down_to_connecting": "Link down to connecting",
+    "link_up_to_live": "Link up to live",
+    "live_to_first_io": "Live to first I/O",
+}
+
+
+class TestLinkFailureLatency:
+    '''
+    Measures the reconnect latencies over repeated Link down / Link up cycles
+    '''
+
+    @pytest.fixture(scope='function', autouse=True)
+    def setup_method(self, fabConfig, should_run_link_failure, link_failure_cycles,
+                     link_iface):
+        ''' Setup Test Case by initialization of objects '''
+
+        self.skipped = False
+        if not should_run_link_failure:
+            self.skipped = True
+            pytest.skip("Link Failure Test disabled")
+        logger.info("\n" + "-"*100)
+        logger.info("Setup TestCase: Link Failure Latency")
+        self.fabConfig = fabConfig
+        self.dev_name = self.fabConfig.device[5:]
+        self.controller = controller_pool.get(self.fabConfig.device, self.fabConfig.application)
+        if not getattr(self.controller.app, "io_passthru", False):
+            self.skipped = True
+            pytest.skip(f"I/O commands not supported by {self.fabConfig.application}")
+        self.cycles = link_failure_cycles
+
+        self.iface = link_iface
+        logger.info("Network interface: {}", self.iface)
+
+        # Created before any check can fail, teardown closes it
+        self.watcher = StateWatcher()
+        self.ctrl = topology.refresh().controller(self.dev_name)
+        if self.ctrl is None:
+            logger.log("FAIL", "Didn't find device for setup")
+            assert False, "Didn't find device for setup"
+        self.latencies = {metric: [] for metric in METRICS}
+
+        self.lba_size = self.controller.namespace().lba_size
+        self.data = ctypes.create_string_buffer(self.lba_size)
+
+    def first_io(self, timeout):
+        '''Submits one block Reads until one succeeds, IO_RETRY_INTERVAL apart.
+            Returns its completion time
+        '''
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            nvme_cmd = self.controller.cmdlib.get_read_cmd()
+            nvme_cmd.buff = ctypes.addressof(self.data)
+            nvme_cmd.buff_size = self.lba_size
+            if self.controller.app.submit_io_passthru(nvme_cmd) == 0:
+                return time.perf_counter()
+            time.sleep(IO_RETRY_INTERVAL)
+        return None
+
+    def run_cycle(self, cycle):
+        ''' One Link down / Link up cycle. Returns an error message or None '''
+        self.controller.sys.set_link("down", self.iface)
+        link_down = time.perf_counter()
+        connecting = self.watcher.wait_for_state(self.ctrl, ("connecting", "resetting"), 60)
+
+        self.controller.sys.set_link("up", self.iface)
+        link_up = time.perf_counter()
+        if connecting is None:
+            return f"Cycle {cycle}: link loss not detected in 60 seconds"
+
+        live = self.watcher.wait_for_state(self.ctrl, "live", 60)
+        if live is None:
+            return f"Cycle {cycle}: device failed to come back up"
+
+        io_done = self.first_io(30)
+        if io_done is None:
+            return f"Cycle {cycle}: no successful I/O in 30 seconds after live"
+
+        self.latencies["link_down_to_connecting"].append(connecting - link_down)
+        self.latencies["link_up_to_live"].append(live - link_up)
+        self.latencies["live_to_first_io"].append(io_done - live)
+        logger.info(f"-- Cycle {cycle}: " + ", ".join(
+            f"{METRICS[metric]} {samples[-1]*1e3:.1f} ms"
+            for metric, samples in self.latencies.items()))
+        return None
+
+    def report(self):
+        ''' Summary of the latencies as an html table followed by the histograms '''
+        rows = []
+        hists = []
+        for metric, samples in self.latencies.items():
+            if not samples:
+                continue
+            values = [percentile(samples, p)*1e3 for p in (0, 50, 90, 99, 100)]
+            rows.append(f"<tr><td>{METRICS[metric]}</td>" +
+                        "".join(f"<td>{value:.1f}</td>" for value in values) + "</tr>")
+            logger.info(f"-- {METRICS[metric]} (ms): min {values[0]:.1f}, p50 {values[1]:.1f}, "
+                        f"p90 {values[2]:.1f}, p99 {values[3]:.1f}, max {values[4]:.1f}")
+
+            hist = "".join(f"<tr><td>{low*1e3:.1f} - {high*1e3:.1f}</td><td>{'#'*count} {count}</td></tr>"
+                           for low, high, count in histogram(samples))
+            hists.append(f"<p>{METRICS[metric]} (ms)</p><table>{hist}</table>")
+
+        return (f"<p>Reconnect latencies over {len(self.latencies['link_up_to_live'])} "
+                f"cycle(s) (ms)</p><table><tr><th>Metric</th><th>min</th><th>p50</th>"
+                f"<th>p90</th><th>p99</th><th>max</th></tr>{''.join(rows)}</table>" + "".join(hists))
+
+    def test_link_failure_latency(self, fabConfig, extras):
+        ''' Cycling the link and measuring the latencies of each cycle '''
+        error = None
+        try:
+            for cycle in range(self.cycles):
+                error = self.run_cycle(cycle)
+                if error:
+                    break
+        except Exception as e:
+            logger.exception(e)
+            raise e
+        finally:
+            self.controller.sys.set_link("up", self.iface)
+            extras.append(pytest_html.extras.html(self.report()))
+
+        if error:
+            logger.log("FAIL", error)
+            assert False, error
+
+    def teardown_method(self):
+        ''' Teardown of Test Case '''
+        if self.skipped:
+            return
+        logger.info("Teardown TestCase: Link Failure Latency")
+        self.controller.sys.set_link("up", self.iface)
+        self.watcher.close()
+        logger.info("-"*100)
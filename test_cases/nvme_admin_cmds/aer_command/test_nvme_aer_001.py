@@ -7,13 +7,13 @@ Send more Asynchronous Event Request commands than the limit specified in AERL
 Verify command fails with Asynchronous Event Request Limit Exceeded (05h).
 '''
 
-import ctypes
-import time
+import asyncio
 import pytest
 from src.macros import *
 from test_cases.conftest import fabConfig
 from utils.logging_module import logger
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
+from lib.applib.async_lib import AsyncExecutor
 
 
 class TestNVMeAER:
@@ -31,75 +31,68 @@ class TestNVMeAER:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
-        # Send Identify Controller to get AER Limit
+        # AER Limit from Identify Controller
         self.p = []
-        nvme_cmd = self.controller.cmdlib.get_identify_controller_cmd()
-        result = ctypes.create_string_buffer(4096)
-        nvme_cmd.buff = ctypes.addressof(result)
-
-        res_status = self.controller.app.submit_admin_passthru(
-                nvme_cmd, verify_rsp=True, async_run=False)
-        if res_status != 0:
-            logger.log("FAIL", "Identify failed during setup")
-            assert False, f"Identify failed: {res_status}"
-
-        self.aer_limit = int(result.raw[259]) 
+        self.aer_limit = self.controller.identify.AERL
 
     def test_aer_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
-
-        nvme_cmd = self.controller.cmdlib.get_aer_cmd()
-
-        for _ in range(self.aer_limit):
-            process = self.controller.app.submit_admin_passthru(
-                nvme_cmd, verify_rsp=True, async_run=True)
-            self.p.append(process)
-            
-            time.sleep(0.1)
-            if process.poll() != None:
-                
-                logger.log("FAIL", f"AER failed before limit: {process.poll()}")
-                assert False, f"AER failed before limit: {process.poll()}"
-
-        # AER Limit is now reached
-        process = self.controller.app.submit_admin_passthru(
-            nvme_cmd, verify_rsp=True, async_run=True)
-        
-        tim = time.time()
-        while process.poll() is None:
-            if time.time()-tim == 2:
-                break
-
-        if process.poll() is None:
-            logger.log("FAIL", "AER passed after limit")
-            process.kill()
-            assert False, f"AER passed after limit"
-
-        self.controller.app.stdout, self.controller.app.stderr = process.communicate()
-        self.controller.app.ret_code = process.returncode
-
-        stderr = self.controller.app.stderr
-        if len(stderr) != 0 and self.controller.app.ret_code != 0:
-            logger.warning(f"-- -- Command execution failed: {stderr[:stderr.find(b'\n')]}")
-        logger.success("-- -- Command execution success")
-
-        self.controller.app.get_response(nvme_cmd)
-        status_code = nvme_cmd.rsp.response.sf.SC
-        
-        if status_code!=0x05:
-            logger.log("FAIL", f"AER failed with incorrect status code: {status_code}")
-            assert False, f"AER failed with incorrect status code: {status_code}"
-        
-        logger.success("AER Command failed with correct Status Code")
-        logger.info("Status Code: {}", status_code)
-        assert True
+        asyncio.run(self.send_aer_cmds())
+
+    async def send_aer_cmds(self):
+        ''' Keeps AERL AERs outstanding and sends one more '''
+        executor = AsyncExecutor(self.controller.app)
+        pool = self.controller.cmdlib.pool
+        nvme_cmds = []
+        completed = []
+        try:
+            for _ in range(self.aer_limit):
+                nvme_cmd = pool.checkout("aer")
+                nvme_cmds.append(nvme_cmd)
+                self.p.append(asyncio.create_task(executor.submit_admin_passthru(nvme_cmd)))
+
+            await asyncio.sleep(0.1 * self.aer_limit)
+            for task in self.p:
+                if task.done() and task.exception():
+                    logger.log("FAIL", f"AER failed before limit: {task.exception()!r}")
+                    assert False, f"AER failed before limit: {task.exception()!r}"
+                if task.done():
+                    logger.log("FAIL", f"AER failed before limit: {task.result().response.sf.SC}")
+                    assert False, f"AER failed before limit: {task.result().response.sf.SC}"
+
+            # AER Limit is now reached
+            nvme_cmd = pool.checkout("aer")
+            try:
+                rsp = await executor.submit_admin_passthru(nvme_cmd, timeout=2)
+            except TimeoutError:
+                logger.log("FAIL", "AER passed after limit")
+                assert False, f"AER passed after limit"
+            completed.append(nvme_cmd)
+
+            status_code = rsp.response.sf.SC
+            if status_code!=0x05:
+                logger.log("FAIL", f"AER failed with incorrect status code: {status_code}")
+                assert False, f"AER failed with incorrect status code: {status_code}"
+
+            logger.success("AER Command failed with correct Status Code")
+            logger.info("Status Code: {}", status_code)
+            assert True
+        finally:
+            # Outstanding AERs are cancelled while the event loop is running
+            for task in self.p:
+                task.cancel()
+            await asyncio.gather(*self.p, return_exceptions=True)
+            logger.info(f"{len(self.p)} outstanding AERs cancelled")
+            executor.close()
+            # AERs still outstanding on the controller keep their commands
+            completed += [nvme_cmd for nvme_cmd, task in zip(nvme_cmds, self.p)
+                          if not task.cancelled()]
+            for nvme_cmd in completed:
+                pool.checkin(nvme_cmd)
 
     def teardown_method(self):
         ''' Teardown of Test Case '''
         logger.info("Teardown TestCase: AER")
-        for p in self.p:
-            p.kill()
-            logger.info("Process killed")
         logger.info("-"*100)
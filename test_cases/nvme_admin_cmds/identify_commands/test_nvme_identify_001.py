@@ -12,7 +12,7 @@ from src.macros import *
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
 from utils.logging_module import logger
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 
 
 class TestNVMeIdentify:
@@ -29,7 +29,7 @@ class TestNVMeIdentify:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
     def test_identify_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
@@ -12,7 +12,7 @@ import time
 from lib.devlib.device_lib import DeviceConfig
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 from utils.logging_module import logger
 
 
@@ -32,7 +32,7 @@ class TestNVMeIdentify:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
         time.sleep(0.01768)
         status, self.ns_paths = self.controller.app.submit_list_ns_cmd()
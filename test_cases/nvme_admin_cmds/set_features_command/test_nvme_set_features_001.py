@@ -12,7 +12,7 @@ import pytest
 from src.macros import *
 from test_cases.conftest import fabConfig
 from utils.logging_module import logger
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 
 
 class TestNVMeSetFeatures:
@@ -30,7 +30,7 @@ class TestNVMeSetFeatures:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
         logger.info("Completed Setup\n\n")
 
     def test_set_features_cmd(self, fabConfig):
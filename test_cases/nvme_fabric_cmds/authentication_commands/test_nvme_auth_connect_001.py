@@ -7,12 +7,12 @@ Expected output: Connect command response is successful
 '''
 
 import pytest
-import re
 from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
 from lib.devlib.device_lib import *
+from lib.syslib.topology_lib import topology
 
 
 class TestNVMeAuthConnect:
@@ -37,7 +37,7 @@ class TestNVMeAuthConnect:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
         tr = authDetails.transport
         addr = authDetails.address
@@ -61,13 +61,8 @@ class TestNVMeAuthConnect:
         self.nqn = self.controller.app.get_nqn_from_discover(response, index)
         # End Discover Command
 
-        # List-subsys
-        status, response = self.controller.app.submit_list_subsys_cmd()
-        if status != 0:
-            logger.error("-- -- TestCase Setup Error: Check if nvme cli tool is installed")
-            return status, response
-        self.all_nvme_setup: list = re.findall(r"nvme\d", response.decode())
-        self.all_nvme_setup.sort()
+        # Controllers present before connecting
+        self.all_nvme_setup = set(topology.refresh().names())
 
         logger.info("Setup Done: Auth Connect Command")
         logger.info("-"*35 + "\n")
@@ -108,18 +103,13 @@ class TestNVMeAuthConnect:
             return
         logger.info("\n\nTeardown TestCase: Auth Connect Command")
 
-        status, response = self.controller.app.submit_list_subsys_cmd()
-        if status != 0:
-            logger.error("-- -- TestCase Teardown Error")
-            return status, response
-
-        self.all_nvme_teardown: list = re.findall(r"nvme\d", response.decode())
-        self.all_nvme_teardown.sort()
-        if len(self.all_nvme_teardown)-len(self.all_nvme_setup) == 1:
-            path = "/dev/" + self.all_nvme_teardown[-1]
+        connected = set(topology.refresh().names()) - self.all_nvme_setup
+        if len(connected) == 1:
+            path = "/dev/" + connected.pop()
 
             status, res = self.controller.app.submit_disconnect_cmd(
                 device_path=path)
+            controller_pool.discard(path)
             if status != 0:
                 raise Exception(f"Disconnect failed: {res}")
 
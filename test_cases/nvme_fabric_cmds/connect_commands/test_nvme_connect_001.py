@@ -11,9 +11,10 @@ from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnect:
     '''
     Send a connect command to Discovery Controller with discovery NQN.
@@ -30,7 +31,8 @@ class TestNVMeConnect:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
+        self.discovery_device = None
 
     def test_connect_discovery(self, connectDetails: ConnectDetails):
         ''' Performing test by sending connect command to discovery NQN '''
@@ -42,6 +44,7 @@ class TestNVMeConnect:
 
         status, res = self.controller.app.submit_connect_cmd(
             tr, addr, svc, nqn)
+        self.discovery_device = res
         if status != 0:
             logger.log("FAIL", f"Sending Connect Command failed: {status}")
             assert False, f"Sending Connect Command failed: {status}"
@@ -63,6 +66,7 @@ class TestNVMeConnect:
         logger.info("\n\nTeardown TestCase: Connect Command")
         status, res = self.controller.app.submit_disconnect_cmd(
             nqn=NVME_DISCOVERY_NQN)
+        controller_pool.discard(self.discovery_device)
         if status != 0:
             raise Exception(
                 f"Disconnect from discovery controller failed: {res}")
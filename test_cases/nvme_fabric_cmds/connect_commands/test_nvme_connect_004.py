@@ -11,9 +11,10 @@ from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnectKato:
     '''
     Send a connect command to Discovery Controller not supporting change notification with Zero Keep Alive Time Out (KATO) value.
@@ -32,7 +33,8 @@ class TestNVMeConnectKato:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
+        self.discovery_device = None
 
         tr = connectDetails.transport
         addr = connectDetails.address
@@ -49,8 +51,8 @@ class TestNVMeConnectKato:
                 "TestCase Setup Exeption: Unable to connect discovery controller")
 
         # Set device path to a new controller
-        discovery_device = response
-        discovery_controller = Controller(discovery_device, application)
+        self.discovery_device = response
+        discovery_controller = controller_pool.get(self.discovery_device, application)
 
         # Sending identify controller to check OAES
         nvme_cmd = discovery_controller.cmdlib.get_identify_cmd()
@@ -105,6 +107,7 @@ class TestNVMeConnectKato:
 
         status, res = self.controller.app.submit_disconnect_cmd(
             nqn=NVME_DISCOVERY_NQN)
+        controller_pool.discard(self.discovery_device)
         if status != 0:
             raise Exception(
                 f"Disconnect from discovery controller failed: {res}")
@@ -5,15 +5,14 @@
 Send a connect command to Discovery Controller not supporting change notification with Non-Zero Keep Alive Time Out (KATO) value.
 Expected Output: Connect Command error
 '''
-import ctypes
 import pytest
 from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
-from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnectKato:
     '''
     Send a connect command to Discovery Controller not supporting change notification with Non-Zero Keep Alive Time Out (KATO) value.
@@ -32,7 +31,8 @@ class TestNVMeConnectKato:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
+        self.discovery_device = None
 
         tr = connectDetails.transport
         addr = connectDetails.address
@@ -49,22 +49,11 @@ class TestNVMeConnectKato:
                 "TestCase Setup Exeption: Unable to connect discovery controller")
 
         # Set device path to a new controller
-        discovery_device = response
-        discovery_controller = Controller(discovery_device, application)
-
-        # Sending identify controller to check OAES
-        nvme_cmd = discovery_controller.cmdlib.get_identify_cmd()
-        # Making it identify-self.controller command
-        nvme_cmd.cmd.identify_cmd.cdw10.raw = 0x01
-
-        result = IdentifyControllerData()
-        nvme_cmd.buff = ctypes.addressof(result)
-
-        ret_status = discovery_controller.app.submit_admin_passthru(
-            nvme_cmd, verify_rsp=True, async_run=False)
-        discovery_controller.app.get_response(nvme_cmd)
-        if ret_status != 0 and ret_status:
-            raise Exception(f"Error sending identify controller: {ret_status}")
+        self.discovery_device = response
+        discovery_controller = controller_pool.get(self.discovery_device, application)
+
+        # Identify controller to check OAES
+        result = discovery_controller.identify
         if bin(result.OAES)[2] == '1':
             TestNVMeConnectKato.isChangeNotificationSupported = True
         else:
@@ -106,6 +95,7 @@ class TestNVMeConnectKato:
 
         status, res = self.controller.app.submit_disconnect_cmd(
             nqn=NVME_DISCOVERY_NQN)
+        controller_pool.discard(self.discovery_device)
         if status != 0:
             raise Exception(
                 f"Disconnect from discovery controller failed: {res}")
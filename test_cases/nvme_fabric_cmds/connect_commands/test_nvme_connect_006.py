@@ -10,9 +10,10 @@ import re
 from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnect:
     '''
     Verify connect command with valid fields(SUBNQN, TRADDR, TRSVCID, TRTYPE).
@@ -29,7 +30,7 @@ class TestNVMeConnect:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
         self.connected_path = None
 
         tr = connectDetails.transport
@@ -80,6 +81,7 @@ class TestNVMeConnect:
         if self.connected_path:
             status, res = self.controller.app.submit_disconnect_cmd(
                 device_path=self.connected_path)
+            controller_pool.discard(self.connected_path)
             if status != 0:
                 raise Exception(f"Disconnect failed: {res}")
         logger.info("Teardown Complete")
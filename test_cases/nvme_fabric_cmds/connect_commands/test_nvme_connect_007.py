@@ -11,9 +11,10 @@ from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnectNQN:
     '''
     Verify connect command with NVM Subsystem NQN value - "not matching" the values that the NVM subsystem is configured to support.
@@ -29,7 +30,7 @@ class TestNVMeConnectNQN:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
         self.connected_path = None
 
         tr = connectDetails.transport
@@ -80,6 +81,7 @@ class TestNVMeConnectNQN:
         if self.connected_path:
             status, res = self.controller.app.submit_disconnect_cmd(
                 device_path=self.connected_path)
+            controller_pool.discard(self.connected_path)
             if status != 0:
                 raise Exception(f"Disconnect failed: {res}")
 
@@ -10,10 +10,11 @@ import re
 from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
 @pytest.mark.skipif(True, reason="nvme-cli corrects the host-id before sending")
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnectHostID:
     """Test case class for testing the Connect Command with Host ID cleared to 0h."""
 
@@ -26,7 +27,7 @@ class TestNVMeConnectHostID:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
         self.connected_path = None
 
         tr = connectDetails.transport
@@ -78,6 +79,7 @@ class TestNVMeConnectHostID:
         if self.connected_path:
             status, res = self.controller.app.submit_disconnect_cmd(
                 device_path=self.connected_path)
+            controller_pool.discard(self.connected_path)
             if status != 0:
                 raise Exception(f"Disconnect failed: {res}")
         logger.info("Teardown Complete")
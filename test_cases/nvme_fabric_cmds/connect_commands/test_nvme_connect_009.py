@@ -11,9 +11,10 @@ import re
 from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeConnectIOQueues:
     '''
     Send Connect and Disconnect command with different number of IO queues.
@@ -28,7 +29,7 @@ class TestNVMeConnectIOQueues:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
         self.connected_paths = []
 
         tr = connectDetails.transport
@@ -82,6 +83,7 @@ class TestNVMeConnectIOQueues:
                 continue
             status, res = self.controller.app.submit_disconnect_cmd(
                 device_path=path)
+            controller_pool.discard(path)
             if status != 0:
                 raise Exception(f"Disconnect failed: {res}")
 
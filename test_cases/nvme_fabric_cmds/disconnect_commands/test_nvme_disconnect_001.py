@@ -11,7 +11,7 @@ from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
 class TestNVMeDisconnect:
@@ -30,7 +30,8 @@ class TestNVMeDisconnect:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
+        self.discovery_device = None
 
         nqn = NVME_DISCOVERY_NQN
         tr = connectDetails.transport
@@ -38,6 +39,7 @@ class TestNVMeDisconnect:
         svc = connectDetails.svcid
         status, res = self.controller.app.submit_connect_cmd(
             tr, addr, svc, nqn)
+        self.discovery_device = res
         if status != 0:
             raise ConnectionError(f"Sending Connect Command failed: {status}")
         else:
@@ -52,6 +54,7 @@ class TestNVMeDisconnect:
         ''' Performing test by sending disconnect command '''
         status, res = self.controller.app.submit_disconnect_cmd(
             nqn=NVME_DISCOVERY_NQN)
+        controller_pool.discard(self.discovery_device)
         if status != 0:
             logger.log("FAIL", f"Disconnect from discovery controller failed: {res}")
             assert False, f"Disconnect from discovery controller failed: {res}"
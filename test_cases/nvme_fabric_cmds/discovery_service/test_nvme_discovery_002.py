@@ -11,7 +11,7 @@ from src.macros import *
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
-from lib.devlib.device_lib import ConnectDetails, Controller
+from lib.devlib.device_lib import ConnectDetails, controller_pool
 
 
 class TestNVMeDiscovery:
@@ -28,7 +28,7 @@ class TestNVMeDiscovery:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
     def test_discovery_service(self, connectDetails: ConnectDetails):
         ''' Performing test '''
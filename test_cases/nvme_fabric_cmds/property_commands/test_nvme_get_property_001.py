@@ -8,7 +8,7 @@ non-zero response is obtained.
 import ctypes
 import pytest
 from utils.logging_module import logger
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
 from test_cases.conftest import fabConfig
 from src.macros import *
@@ -24,7 +24,7 @@ class TestNVMePropertyGet:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
     def test_property_get_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
@@ -9,7 +9,7 @@ Verify that the Property Get command fails
 '''
 import ctypes
 import pytest
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
@@ -26,7 +26,7 @@ class TestNVMePropertyGet:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
     def test_property_get_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
@@ -21,7 +21,7 @@ and all values returned were 0h
 '''
 import ctypes
 import pytest
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
@@ -38,33 +38,43 @@ class TestNVMePropertyGet:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
     def test_property_get_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
 
-        nvme_cmd = self.controller.cmdlib.get_property_get_cmd()
         offsets = [0x0C, 0x10, 0x18, 0x24, 0x28,
                    0x30, 0x38, 0x3C, 0x40, 0xF00, 0x1000]
         fail = []
+        nvme_cmds = []
+        values = []
+        pool = self.controller.cmdlib.pool
         for offset in offsets:
-            get_property_value = ctypes.c_uint64()
-            nvme_cmd.buff = ctypes.addressof(get_property_value)
+            # Command and 8 byte value buffer from the pool
+            nvme_cmd = pool.checkout("property_get")
+            get_property_value = ctypes.c_uint64.from_buffer(pool.data(nvme_cmd))
             nvme_cmd.cmd.generic_command.cdw11.raw = offset
             if offset in OFFSETS_64BIT:
                 nvme_cmd.cmd.generic_command.cdw10.raw = True
             else:
                 nvme_cmd.cmd.generic_command.cdw10.raw = False
-            res_status = self.controller.app.submit_admin_passthru(nvme_cmd,
-                                                             verify_rsp=True, async_run=False)
+            nvme_cmds.append(nvme_cmd)
+            values.append(get_property_value)
 
-            # self.controller.app.get_response(nvme_cmd)
+        try:
+            statuses = self.controller.app.submit_batch(nvme_cmds, admin=True)
+            values = [value.value for value in values]
+        finally:
+            for nvme_cmd in nvme_cmds:
+                pool.checkin(nvme_cmd)
+
+        for offset, res_status, get_property_value in zip(offsets, statuses, values):
             if res_status != 0:
                 fail.append(offset)
 
-            get_property_hex_value = hex(get_property_value.value)
+            get_property_hex_value = hex(get_property_value)
 
-            if get_property_value.value != 0:
+            if get_property_value != 0:
                 fail.append(offset)
                 logger.log("FAIL", f"Value obtained {get_property_hex_value} but expected 0")
                 assert False, f"Value obtained {get_property_hex_value} but expected 0"
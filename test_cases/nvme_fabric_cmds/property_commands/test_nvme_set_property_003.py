@@ -12,7 +12,7 @@ import ctypes
 import pytest
 import sys
 import time
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 from lib.structlib.struct_admin_data_lib import IdentifyControllerData
 from utils.logging_module import logger
 from test_cases.conftest import fabConfig
@@ -29,7 +29,7 @@ class TestNVMePropertySet:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
         nvme_cmd = self.controller.cmdlib.get_property_get_cmd()
         offset = OFFSET_CONTROLLER_CONFIGURATION
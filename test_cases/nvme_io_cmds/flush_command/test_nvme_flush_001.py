@@ -8,13 +8,13 @@ Verify command success.
 
 import ctypes
 import pytest
-import shutil
 from src.macros import *
 from test_cases.conftest import fabConfig
 from utils.logging_module import logger
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeFlush:
     '''
     Send an NVM Flush command to NSID 1.
@@ -29,9 +29,9 @@ class TestNVMeFlush:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
-        self.lba_size = self.controller.app.get_device_lba_size()
+        self.lba_size = self.controller.namespace().lba_size
 
     def test_flush_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
@@ -52,6 +52,4 @@ class TestNVMeFlush:
     def teardown_method(self):
         ''' Teardown of Test Case '''
         logger.info("Teardown TestCase: Flush")
-        shutil.rmtree(TEMP_DIR, ignore_errors=True)
-        logger.info("Deleted temp directory")
         logger.info("-"*100)
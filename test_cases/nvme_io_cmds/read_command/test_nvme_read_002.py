@@ -0,0 +1,68 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''
+Send batches of NVM Read commands keeping 1, 32 and 256 commands in flight.
+Verify every command completes with success.
+'''
+
+import ctypes
+import pytest
+from src.macros import *
+from test_cases.conftest import fabConfig
+from utils.logging_module import logger
+from lib.devlib.device_lib import controller_pool
+
+
+@pytest.mark.usefixtures("fault_profile")
+class TestNVMeReadQueueDepth:
+    '''
+    Send batches of NVM Read commands keeping 1, 32 and 256 commands in flight.
+    Verify every command completes with success.
+    '''
+
+    @pytest.fixture(scope='function', autouse=True)
+    def setup_method(self, fabConfig):
+        ''' Setup Test Case by initialization of objects '''
+        logger.info("\n"+"-"*100)
+        logger.info("Setup TestCase: Read Queue Depth")
+        self.fabConfig = fabConfig
+        device = self.fabConfig.device
+        application = self.fabConfig.application
+        self.controller = controller_pool.get(device, application)
+
+        if not getattr(self.controller.app, "io_passthru", False):
+            pytest.skip(f"I/O batch submission not supported by {application}")
+
+        self.lba_size = self.controller.namespace().lba_size
+
+    @pytest.mark.parametrize("queue_depth", [1, 32, 256])
+    def test_read_queue_depth(self, fabConfig, queue_depth):
+        ''' Sending the commands and verifying responses '''
+        n_cmds = 1024
+        buffers = []
+        nvme_cmds = []
+        for i in range(n_cmds):
+            nvme_cmd = self.controller.cmdlib.get_read_cmd()
+            result = ctypes.create_string_buffer(self.lba_size)
+            buffers.append(result)
+            nvme_cmd.buff = ctypes.addressof(result)
+            nvme_cmd.buff_size = self.lba_size
+            nvme_cmd.cmd.generic_command.cdw10.raw = i  # SLBA
+            nvme_cmd.cmd.generic_command.cdw12.raw = 0  # NLB, 0's based
+            nvme_cmds.append(nvme_cmd)
+
+        statuses = self.controller.app.submit_batch(nvme_cmds, queue_depth=queue_depth)
+
+        fail = [i for i, status in enumerate(statuses) if status != 0]
+        if len(fail) != 0:
+            logger.log("FAIL", f"{len(fail)} reads failed at QD {queue_depth}, first LBA {fail[0]}")
+            assert False, f"{len(fail)} reads failed at QD {queue_depth}, first LBA {fail[0]}"
+
+        logger.success(f"{n_cmds} reads completed at QD {queue_depth}")
+        assert True
+
+    def teardown_method(self):
+        ''' Teardown of Test Case '''
+        logger.info("Teardown TestCase: Read Queue Depth")
+        logger.info("-"*100)
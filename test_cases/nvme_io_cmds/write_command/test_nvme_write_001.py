@@ -7,14 +7,14 @@ Verify success.
 '''
 
 import ctypes
-import shutil
 import pytest
 from src.macros import *
 from test_cases.conftest import fabConfig
 from utils.logging_module import logger
-from lib.devlib.device_lib import Controller
+from lib.devlib.device_lib import controller_pool
 
 
+@pytest.mark.usefixtures("fault_profile")
 class TestNVMeWrite:
     '''
     Send an NVM Write command to write one block size of data.
@@ -29,9 +29,9 @@ class TestNVMeWrite:
         self.fabConfig = fabConfig
         device = self.fabConfig.device
         application = self.fabConfig.application
-        self.controller = Controller(device, application)
+        self.controller = controller_pool.get(device, application)
 
-        self.lba_size = self.controller.app.get_device_lba_size()
+        self.lba_size = self.controller.namespace().lba_size
 
     def test_write_cmd(self, fabConfig):
         ''' Sending the command and verifying response '''
@@ -72,6 +72,4 @@ class TestNVMeWrite:
     def teardown_method(self):
         ''' Teardown of Test Case '''
         logger.info("Teardown TestCase: Write")
-        shutil.rmtree(TEMP_DIR, ignore_errors=True)
-        logger.info("Deleted temp directory")
         logger.info("-"*100)
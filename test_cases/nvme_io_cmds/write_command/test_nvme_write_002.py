@@ -0,0 +1,65 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''
+Write a transfer larger than the Maximum Data Transfer Size and read it back.
+Verify success and that the data read matches the data written.
+'''
+
+import os
+import pytest
+from src.macros import *
+from test_cases.conftest import fabConfig
+from utils.logging_module import logger
+from lib.devlib.device_lib import controller_pool
+
+
+@pytest.mark.usefixtures("fault_profile")
+class TestNVMeWriteLarge:
+    '''
+    Write a transfer split in several commands of the Maximum Data Transfer
+    Size, with a shorter last command, and read it back.
+    Verify command success and data integrity.
+    '''
+
+    @pytest.fixture(scope='function', autouse=True)
+    def setup_method(self, fabConfig):
+        ''' Setup Test Case by initialization of objects '''
+        logger.info("\n"+"-"*100)
+        logger.info("Setup TestCase: Write Large Transfer")
+        self.fabConfig = fabConfig
+        device = self.fabConfig.device
+        application = self.fabConfig.application
+        self.controller = controller_pool.get(device, application)
+
+        if not getattr(self.controller.app, "io_passthru", False):
+            pytest.skip(f"I/O commands not supported by {application}")
+
+        self.namespace_io = self.controller.namespace_io()
+
+    def test_write_large_cmd(self, fabConfig):
+        ''' Sending the commands and verifying data '''
+        start_lba = 0x1000
+        lba_size = self.namespace_io.lba_size
+        n_blocks = 4 * self.namespace_io.chunk_blocks + 1
+        data = os.urandom(n_blocks * lba_size)
+
+        res_status = self.namespace_io.write(start_lba, data)
+        if res_status != 0:
+            assert False, f"Write failed: {res_status}"
+
+        res_status, read_data = self.namespace_io.read(start_lba, len(data))
+        if res_status != 0:
+            assert False, f"Read failed: {res_status}"
+
+        if read_data != data:
+            logger.log("FAIL", f"Data read at LBA {start_lba:#x} differs from data written")
+            assert False, f"Data read at LBA {start_lba:#x} differs from data written"
+
+        logger.success(f"{len(data)} bytes verified in {self.namespace_io.commands} commands")
+        assert True
+
+    def teardown_method(self):
+        ''' Teardown of Test Case '''
+        logger.info("Teardown TestCase: Write Large Transfer")
+        logger.info("-"*100)
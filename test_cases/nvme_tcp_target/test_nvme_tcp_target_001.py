@@ -0,0 +1,269 @@
+# Copyright (c) 2024 Samsung Electronics Corporation
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''
+Start the userspace NVMe/TCP target on localhost and exercise it with a
+minimal NVMe/TCP host: Connect, Identify Controller, a Write with its data
+requested by R2T read back, a Read beyond the namespace, the SMART log
+page, the discovery log page and a Disconnect.
+
+Verify the completions, the identify data, the data read back, the
+LBA Out of Range (80h) status, the data units read and written, the
+subsystem decoded from the discovery log page, and that the Disconnect
+completes before the queue is closed. No device or kernel initiator is
+required.
+'''
+
+import os
+import socket
+import struct
+import pytest
+from src.macros import *
+from utils.logging_module import logger
+from lib.structlib.struct_admin_data_lib import IdentifyControllerData
+from lib.applib.discovery_log_lib import DiscoveryLog
+from lib.targetlib.nvme_tcp_target_lib import *
+
+NAMESPACE_SIZE = 16 << 20
+LBA_SIZE = 512
+
+
+class TCPHost:
+    '''
+    NVMe/TCP host of one queue, submitting one command at a time. Data of
+    commands without in-capsule data is sent when the target requests it
+    with R2T PDUs.
+    '''
+
+    def __init__(self, port) -> None:
+        ''' Connects to the target and exchanges ICReq/ICResp '''
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+        self.cid = 0
+        icreq = struct.pack("<BBBBIHBBI", PDU_ICREQ, 0, 128, 0, 128, 0, 0, 0, 0)
+        self.sock.sendall(icreq.ljust(128, b"\0"))
+        if self.recv_pdu()[0] != PDU_ICRESP:
+            raise ConnectionError("Target did not answer the ICReq")
+
+    def close(self):
+        ''' Closes the connection '''
+        self.sock.close()
+
+    def recv_exact(self, size):
+        ''' Receives exactly size bytes '''
+        buff = b""
+        while len(buff) < size:
+            chunk = self.sock.recv(size - len(buff))
+            if not chunk:
+                raise ConnectionError("Connection closed by the target")
+            buff += chunk
+        return buff
+
+    def recv_pdu(self):
+        ''' Receives a PDU, header included '''
+        header = self.recv_exact(8)
+        plen = struct.unpack_from("<I", header, 4)[0]
+        return header + self.recv_exact(plen - 8)
+
+    def submit(self, sqe, data=None, length=0):
+        '''Sends a command capsule without in-capsule data and handles the PDUs
+            of the target until the completion.
+
+        Args:
+            sqe (bytearray): Submission queue entry, CID filled here.
+            data (bytes, optional): Data transferred to the target.
+            length (int, optional): Bytes transferred from the target.
+
+        Returns:
+            Tuple[int, int, bytes]: Status field (without the phase tag), DW0
+                of the completion, and the data received.
+        '''
+        self.cid += 1
+        struct.pack_into("<H", sqe, 2, self.cid)
+        struct.pack_into("<I", sqe, 32, len(data) if data is not None else length)
+        self.sock.sendall(struct.pack("<BBBBI", PDU_CAPSULE_CMD, 0, 72, 0, 72) + sqe)
+
+        received = bytearray()
+        while True:
+            pdu = self.recv_pdu()
+            if pdu[0] == PDU_R2T:
+                cccid, ttag, offset, count = struct.unpack_from("<HHII", pdu, 8)
+                chunk = data[offset:offset + count]
+                header = struct.pack("<BBBBIHHIII", PDU_H2C_DATA, PDU_FLAG_DATA_LAST, 24, 24,
+                                     24 + len(chunk), cccid, ttag, offset, len(chunk), 0)
+                self.sock.sendall(header + chunk)
+            elif pdu[0] == PDU_C2H_DATA:
+                pdo = pdu[3]
+                offset, count = struct.unpack_from("<II", pdu, 12)
+                received[offset:offset + count] = pdu[pdo:pdo + count]
+            elif pdu[0] == PDU_CAPSULE_RESP:
+                dw0, _, _, _, sf = struct.unpack_from("<QHHHH", pdu, 8)
+                return sf >> 1, dw0, bytes(received)
+            else:
+                raise ConnectionError(f"Unexpected PDU type {pdu[0]}")
+
+    def connect(self, subnqn, qid=0, cntlid=0xFFFF):
+        ''' Sends a Fabrics Connect command, returns (status, dw0) '''
+        sqe = bytearray(64)
+        sqe[0], sqe[4] = 0x7F, FCTYPE_CONNECT
+        struct.pack_into("<HH", sqe, 42, qid, 31)
+        data = bytearray(1024)
+        struct.pack_into("<H", data, 16, cntlid)
+        data[256:256 + len(subnqn)] = subnqn.encode()
+        data[512:529] = b"nqn.test.host:one"
+        status, dw0, _ = self.submit(sqe, data=bytes(data))
+        return status, dw0
+
+    def io(self, opc, slba, nlb, data=None):
+        ''' Sends a Read or Write command of nlb blocks to namespace 1 '''
+        sqe = bytearray(64)
+        sqe[0] = opc
+        struct.pack_into("<I", sqe, 4, 1)
+        struct.pack_into("<III", sqe, 40, slba & 0xFFFFFFFF, slba >> 32, nlb - 1)
+        return self.submit(sqe, data=data, length=nlb * LBA_SIZE)
+
+
+class TestNVMeTCPTarget:
+    '''
+    Exercise the userspace NVMe/TCP target with a minimal host on localhost.
+    '''
+
+    @pytest.fixture(scope='function', autouse=True)
+    def setup_method(self):
+        ''' Setup Test Case by starting the target and connecting the admin queue '''
+        logger.info("\n"+"-"*100)
+        logger.info("Setup TestCase: NVMe/TCP target")
+        self.target = NVMeTCPTarget(svcid=0, size=NAMESPACE_SIZE, lba_size=LBA_SIZE)
+        self.target.start()
+        self.hosts = []
+
+        self.admin = self.open_queue()
+        status, self.cntlid = self.admin.connect(self.target.subnqn)
+        if status != 0:
+            pytest.fail(f"Connect of the admin queue failed: {status:#x}")
+
+        # Number of Queues: one I/O queue
+        sqe = bytearray(64)
+        sqe[0] = 0x09
+        struct.pack_into("<II", sqe, 40, 0x07, 0)
+        self.admin.submit(sqe)
+
+        yield
+        for host in self.hosts:
+            host.close()
+        self.target.stop()
+
+    def open_queue(self):
+        ''' Opens a connection to the target '''
+        host = TCPHost(self.target.svcid)
+        self.hosts.append(host)
+        return host
+
+    def test_identify_controller(self):
+        ''' Identify Controller on the admin queue '''
+        sqe = bytearray(64)
+        sqe[0] = 0x06
+        struct.pack_into("<I", sqe, 40, 0x01)
+        status, _, data = self.admin.submit(sqe, length=4096)
+        if status != 0 or len(data) != 4096:
+            logger.log("FAIL", f"Identify Controller failed: {status:#x}, {len(data)} bytes")
+            assert False, f"Identify Controller failed: {status:#x}, {len(data)} bytes"
+
+        identify = IdentifyControllerData.from_buffer_copy(data)
+        logger.info("CNTLID: {}, AERL: {}", identify.CNTLID, identify.AERL)
+        assert identify.CNTLID == self.cntlid, "CNTLID differs from the Connect response"
+        assert identify.AERL == AERL, f"AERL {identify.AERL} instead of {AERL}"
+        assert data[768:768 + len(self.target.subnqn)] == self.target.subnqn.encode()
+
+    def test_write_read_back(self):
+        ''' Write with the data requested by R2T, read back on an I/O queue '''
+        io_queue = self.open_queue()
+        status, _ = io_queue.connect(self.target.subnqn, qid=1, cntlid=self.cntlid)
+        assert status == 0, f"Connect of the I/O queue failed: {status:#x}"
+
+        nlb = 128
+        pattern = os.urandom(nlb * LBA_SIZE)
+        status, _, _ = io_queue.io(0x01, 0x100, nlb, data=pattern)
+        if status != 0:
+            logger.log("FAIL", f"Write failed: {status:#x}")
+            assert False, f"Write failed: {status:#x}"
+
+        status, _, data = io_queue.io(0x02, 0x100, nlb)
+        if status != 0 or data != pattern:
+            logger.log("FAIL", f"Read back failed: {status:#x}, data matches: {data == pattern}")
+            assert False, f"Read back failed: {status:#x}, data matches: {data == pattern}"
+
+    def test_read_out_of_range(self):
+        ''' Read beyond the last LBA of the namespace '''
+        io_queue = self.open_queue()
+        status, _ = io_queue.connect(self.target.subnqn, qid=1, cntlid=self.cntlid)
+        assert status == 0, f"Connect of the I/O queue failed: {status:#x}"
+
+        status, _, _ = io_queue.io(0x02, NAMESPACE_SIZE // LBA_SIZE, 1)
+        logger.info("Status Code: {:#x}", status & 0xFF)
+        if status & 0x7FF != SC_LBA_OUT_OF_RANGE:
+            logger.log("FAIL", f"Read out of range completed with status {status:#x}")
+            assert False, f"Read out of range completed with status {status:#x}"
+
+    def test_smart_data_units(self):
+        ''' Data Units Read and Written of the SMART log page after a Write and a Read '''
+        io_queue = self.open_queue()
+        status, _ = io_queue.connect(self.target.subnqn, qid=1, cntlid=self.cntlid)
+        assert status == 0, f"Connect of the I/O queue failed: {status:#x}"
+
+        # Data units are thousands of 512 byte units, rounded up
+        status, _, _ = io_queue.io(0x01, 0, 2000, data=bytes(2000 * LBA_SIZE))
+        assert status == 0, f"Write failed: {status:#x}"
+        status, _, _ = io_queue.io(0x02, 0, 1000)
+        assert status == 0, f"Read failed: {status:#x}"
+
+        sqe = bytearray(64)
+        sqe[0] = 0x02
+        struct.pack_into("<I", sqe, 4, 0xFFFFFFFF)
+        struct.pack_into("<I", sqe, 40, 0x02 | (512 // 4 - 1) << 16)
+        status, _, data = self.admin.submit(sqe, length=512)
+        assert status == 0, f"Get Log Page failed: {status:#x}"
+
+        units_read = int.from_bytes(data[32:48], "little")
+        units_written = int.from_bytes(data[48:64], "little")
+        logger.info("Data Units Read: {}, Data Units Written: {}", units_read, units_written)
+        if (units_read, units_written) != (1, 2):
+            logger.log("FAIL", f"Data units {units_read} read and {units_written} written")
+            assert False, f"Data units {units_read} read and {units_written} written"
+
+    def test_disconnect(self):
+        ''' Disconnect of an I/O queue is completed before the queue is closed '''
+        io_queue = self.open_queue()
+        status, _ = io_queue.connect(self.target.subnqn, qid=1, cntlid=self.cntlid)
+        assert status == 0, f"Connect of the I/O queue failed: {status:#x}"
+
+        sqe = bytearray(64)
+        sqe[0], sqe[4] = 0x7F, FCTYPE_DISCONNECT
+        status, _, _ = io_queue.submit(sqe)
+        assert status == 0, f"Disconnect failed: {status:#x}"
+        assert io_queue.sock.recv(1) == b"", "Queue not closed after the Disconnect"
+
+    def test_discovery_log(self):
+        ''' Discovery log page of the discovery controller, decoded with DiscoveryLog '''
+        discovery = self.open_queue()
+        status, _ = discovery.connect(NVME_DISCOVERY_NQN)
+        assert status == 0, f"Connect to the discovery controller failed: {status:#x}"
+
+        sqe = bytearray(64)
+        sqe[0] = 0x02
+        struct.pack_into("<I", sqe, 40, 0x70 | (2048 // 4 - 1) << 16)
+        status, _, data = discovery.submit(sqe, length=2048)
+        assert status == 0, f"Get Log Page failed: {status:#x}"
+
+        log = DiscoveryLog(data)
+        subsystems = log.filter(trtype=NVMF_TRTYPE_TCP, subtype=NVME_NQN_NVME)
+        logger.info("Discovered: {}", subsystems.subnqns())
+        if subsystems.subnqns() != [self.target.subnqn]:
+            logger.log("FAIL", f"Discovered {subsystems.subnqns()}")
+            assert False, f"Discovered {subsystems.subnqns()}"
+        assert subsystems.entry(0)["trsvcid"] == str(self.target.svcid)
+        assert len(log.filter(subtype=NVME_NQN_CURR)) == 0
+
+    def teardown_method(self):
+        ''' Teardown of Test Case '''
+        logger.info("Teardown TestCase: NVMe/TCP target")
+        logger.info("-"*100)
@@ -17,10 +17,14 @@ LOG LEVELS:
 
 """
 
+import os
 import sys
 from loguru import logger
 
+# Every pytest-xdist worker writes its own log file
+worker = os.environ.get("PYTEST_XDIST_WORKER")
+
 logger.level("FAIL", no=35, color="<magenta>")
-logger.add("./logs/test_{time}.log", enqueue=True, backtrace=True)
+logger.add(f"./logs/test_{{time}}{'_' + worker if worker else ''}.log", enqueue=True, backtrace=True)
 
 logger.info("Log file created")
\ No newline at end of file
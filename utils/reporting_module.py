@@ -30,11 +30,19 @@ def pytest_html_report_title(report):
         if ts_config["device_path"].startswith("/dev/") or ts_config["device_path"].startswith("nvme"):
             report.data["environment"]["Device Path"] = ts_config["device_path"]
     
-    if ts_config["connectByIP"].lower() == "true":
+    if "targets" in ts_config:
+        report.data["environment"]["Targets"] = ts_config["targets"]
+    elif ts_config["connectByIP"].lower() == "true":
         report.data["environment"]["Target Device Details"] = ts_config["connectDetails"]
 
     report.data["environment"]["Application Selected"] = ts_config["app_name"]
 
+    if ts_config.get("trace", {}).get("mode", "off").lower() != "off":
+        report.data["environment"]["Command Trace"] = ts_config["trace"]
+
+    if ts_config.get("fault_profiles"):
+        report.data["environment"]["Fault Profiles"] = ts_config["fault_profiles"]
+
     if ts_config["test_authentication"].lower() == "true":
         del ts_config["test_auth_config"]["dhchap_host"]
         del ts_config["test_auth_config"]["dhchap_ctrl"]
@@ -44,6 +52,7 @@ def pytest_html_report_title(report):
 
     if ts_config["test_link_failure"].lower() == "true":
         report.data["environment"]["Link Failure Test(s)"] = "Executed"
+        report.data["environment"]["Link Failure Cycles"] = ts_config.get("link_failure_cycles", 10)
     else:
         report.data["environment"]["Link Failure Test(s)"] = "Skipped"
 